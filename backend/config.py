@@ -106,6 +106,22 @@ class Config:
     # SideQuest Config
     QUEST_GENERATION_MODEL = "mistralai/mistral-large"
     QUEST_METADATA_EXTRACTION_MODEL = "meta-llama/llama-3.3-70b-instruct"
+    # refill the pre-generated quest pool in a background thread when it runs low
+    QUEST_POOL_ASYNC_REFILL = True
+    # batch generation for the scheduled refresh: users per prompt, prompts in flight
+    QUEST_GENERATION_BATCH_SIZE = 8
+    QUEST_GENERATION_MAX_PARALLEL = 4
+    # give up on the LLM (and use the fallback quests) after this long
+    QUEST_GENERATION_DEADLINE_SECONDS = 20
+    # after this many failures in a row, skip the LLM for a while before retrying
+    QUEST_GENERATION_BREAKER_FAILURES = 5
+    QUEST_GENERATION_BREAKER_RESET_SECONDS = 60
+    # race requests slower than this latency percentile against a second model,
+    # no hedging without a hedge model
+    QUEST_GENERATION_HEDGE_MODEL = None
+    QUEST_GENERATION_HEDGE_PERCENTILE = 95
+    # estimated text similarity above which a generated quest is a near-duplicate
+    QUEST_DEDUP_THRESHOLD = 0.6
 
 
 class DevelopmentConfig(Config):
@@ -179,6 +195,8 @@ class TestingConfig(Config):
     SPEECH_DEVELOPMENT_MODE = True
     SPEECH_APPLE_BUNDLE_ID = "com.test.speechcoach"
 
+    QUEST_POOL_ASYNC_REFILL = False
+
     # Fixed secret keys for testing
     SECRET_KEY = "testing-secret-key"
     JWT_SECRET_KEY = "testing-secret-key"
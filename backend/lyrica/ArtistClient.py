@@ -4,11 +4,20 @@ import numpy as np
 import openai
 from lyricsgenius import Genius
 from openai import OpenAI
-from backend.lyrica.VectorDB import Dictbased_VectorDB
-from backend.config import create_logger
+from backend.lyrica.VectorDB import create_vector_db
+from backend.lyrica.chunking import DEFAULT_CHUNKER, chunk_lyrics
+from backend.lyrica.embedders import DEFAULT_EMBEDDER, get_embedder
+from backend.lyrica.metrics import registry, timed
+from backend.extensions import create_logger
 from dotenv import load_dotenv
-from functools import lru_cache
+from backend.lyrica.genius_cache import genius_cache
 from backend.lyrica.models import Artist, Song, Lyric
+from backend.lyrica.repository import (
+    bulk_insert_lyrics,
+    bulk_upsert_songs,
+    get_songs_with_lyrics,
+)
+from backend.lyrica.search_index import get_lyric_index, lyric_metadata
 from backend import db
 
 load_dotenv()
@@ -16,13 +25,17 @@ load_dotenv()
 logger = create_logger(__name__, level="DEBUG")
 
 genius = Genius(os.getenv("GENIUS_ACCESS_TOKEN"))
-genius.remove_section_headers = True
+genius.remove_section_headers = False
 genius.skip_non_songs = True
 genius.excluded_terms = ["(Remix)", "(Live)"]
 
 openai.api_key = os.getenv("OPENAI_API_KEY")
 ai_client = OpenAI()
 
+EMBEDDED_TEXTS = registry.counter(
+    "lyrica_embedded_texts_total", "Texts sent to the embedding API, by embedder"
+)
+
 # def load_artist(artist_id):
 #     path = f"./data/{artist_id}.json"
 #     if not os.path.exists(path):
@@ -40,8 +53,13 @@ ai_client = OpenAI()
 #         json.dump(data, f)
 
 
+@timed("genius_search")
 def name_to_id(artist_name: str) -> str:
-    results = genius.search_artists(artist_name)
+    results = genius_cache.get(
+        "search_artists",
+        {"search_term": artist_name},
+        lambda: genius.search_artists(artist_name),
+    )
     top_result = results["sections"][0]
 
     if len(top_result["hits"]) == 0:
@@ -54,33 +72,41 @@ def name_to_id(artist_name: str) -> str:
     return str(artist_id)
 
 
+@timed("genius_lyrics")
 def get_song_lyrics(song_url=None, song_id=None):
     logger.info(f"getting song lyrics for: {song_id}: {song_url}")
     if song_url:
-        return genius.lyrics(song_url=song_url)
+        params = {"song_url": song_url}
     elif song_id:
-        return genius.lyrics(song_id=song_id)
+        params = {"song_id": song_id}
     else:
         raise ValueError("Either song_url or song_id must be provided")
+    return genius_cache.get("lyrics", params, lambda: genius.lyrics(**params))
 
 
-def lyrics_to_bars(lyrics):
-    bars = lyrics.split("\n\n")
+def embed_text(text, embedder=DEFAULT_EMBEDDER) -> np.ndarray:
+    return embed_texts([text], embedder)[0]
 
-    bar_chunks = []
-    for bar in bars:
-        if len(bar.split("\n")) > 10:
-            chunks = bar.split("\n")
-            while chunks:
-                # pop off the first 10 lines
-                bar_chunks.append("\n".join(chunks[:10]))
-                chunks = chunks[10:]
-        else:
-            bar_chunks.append(bar.strip())
-    return bar_chunks
+
+@timed("embedding")
+def embed_texts(texts, embedder=DEFAULT_EMBEDDER) -> list:
+    """Embed several texts with a single API call"""
+    embedder = get_embedder(embedder)
+    texts = list(texts)
+    EMBEDDED_TEXTS.inc(len(texts), embedder=embedder.name)
+    response = ai_client.embeddings.create(input=texts, **embedder.request_kwargs())
+    embeddings = [np.array(item.embedding) for item in response.data]
+    for embedding in embeddings:
+        embedder.check(embedding)
+    return embeddings
+
+
+def lyrics_to_bars(lyrics, config=DEFAULT_CHUNKER):
+    # section headers are kept by the Genius client so the chunker can split on them
+    return chunk_lyrics(lyrics, config)
 
 
-@lru_cache(maxsize=128)
+@timed("genius_artist_songs")
 def get_artist_songs(artist_id, max_songs=25):
     logger.info("Getting songs for artist")
     page = 1
@@ -88,12 +114,19 @@ def get_artist_songs(artist_id, max_songs=25):
 
     while (page is not None) & (len(songs) < max_songs):
         logger.info(f"Getting page {page} of songs for {artist_id}")
-        request = genius.artist_songs(
-            artist_id, sort="popularity", per_page=25, page=page
+        request = genius_cache.get(
+            "artist_songs",
+            {"artist_id": artist_id, "sort": "popularity", "page": page},
+            # bind page now: a stale hit revalidates in a background thread
+            lambda page=page: genius.artist_songs(
+                artist_id, sort="popularity", per_page=25, page=page
+            ),
         )
         new_songs = request["songs"]
         rel_songs = [
-            song for song in new_songs if str(song["primary_artist"]["id"]) == artist_id
+            song
+            for song in new_songs
+            if str(song["primary_artist"]["id"]) == str(artist_id)
         ]
 
         songs += rel_songs
@@ -104,9 +137,24 @@ def get_artist_songs(artist_id, max_songs=25):
 
 
 class ArtistClient:
-    def __init__(self, artist_id=None, artist_name=None):
+    def __init__(
+        self,
+        artist_id=None,
+        artist_name=None,
+        vdb_engine="exact",
+        chunker=DEFAULT_CHUNKER,
+        embedder=DEFAULT_EMBEDDER,
+        **vdb_kwargs,
+    ):
 
         self.genius = genius
+        # how lyrics are cut into bars, see chunking.ChunkerConfig
+        self.chunker = chunker
+        # lyrics are embedded, stored and indexed per model, see embedders.EMBEDDERS
+        self.embedder = get_embedder(embedder)
+        # vector search engine for this artist's index, see VectorDB.VECTOR_DB_ENGINES
+        self.vdb_engine = vdb_engine
+        self.vdb_kwargs = vdb_kwargs
 
         if artist_id is not None:
             self.artist_id = artist_id
@@ -124,7 +172,11 @@ class ArtistClient:
         if self.artist is None:
             logger.info(f"Creating artist {self.artist_id}")
             try:
-                genius_artist = genius.artist(artist_id=self.artist_id)["artist"]
+                genius_artist = genius_cache.get(
+                    "artist",
+                    {"artist_id": self.artist_id},
+                    lambda: genius.artist(artist_id=self.artist_id),
+                )["artist"]
             except:
                 raise ValueError(f"Could not find artist: {artist_id}")
             self.artist = Artist(
@@ -141,19 +193,22 @@ class ArtistClient:
     def create_vbd(self):
         embedding_dict = {}
         metadata = {}
-        for song in self.artist.songs:
+        self.n_songs_with_lyrics = 0
+        for song in get_songs_with_lyrics(self.artist_id, self.embedder.name):
 
             lyrics = song.lyrics
+            if lyrics:
+                self.n_songs_with_lyrics += 1
 
             for lyric in lyrics:
                 embedding_dict[lyric.id] = lyric.get_embedding()
-                metadata[lyric.id] = {
-                    "song_name": song.title,
-                    "song_url": song.url,
-                    "text": lyric.lyric,
-                }
+                metadata[lyric.id] = lyric_metadata(
+                    lyric.lyric, song.title, song.url, self.artist.id, self.artist.name
+                )
 
-        db = Dictbased_VectorDB(embedding_dict, metadata)
+        db = create_vector_db(
+            embedding_dict, metadata, engine=self.vdb_engine, **self.vdb_kwargs
+        )
 
         self.vdb = db
 
@@ -161,63 +216,53 @@ class ArtistClient:
 
     def get_top_lyrics(self):
 
-        return self.vdb.get_top_lyrics()
+        with timed("top_lyrics"):
+            return self.vdb.get_top_lyrics()
 
     def get_songs(self, max_songs=50, pull_lyrics=False):
 
         songs = get_artist_songs(self.artist_id, max_songs=max_songs)
 
-        for song in songs:
-            self.add_song(song, pull_lyrics=pull_lyrics)
+        self.add_songs(songs, pull_lyrics=pull_lyrics)
 
         return True
 
-    def add_song(self, song, pull_lyrics=False):
-        if Song.query.get(song["id"]) is None:
-
-            new_song = Song(
-                id=song["id"],
-                title=song["title"],
-                url=song["url"],
-                artist=self.artist,
-            )
-
-            db.session.add(new_song)
+    def add_songs(self, songs, pull_lyrics=False):
+        """Upsert many Genius songs at once, committing once for the batch.
+        Returns the ids of the songs that were new."""
+        with timed("db_write"):
+            new_song_ids = bulk_upsert_songs(self.artist.id, songs)
             db.session.commit()
 
-            if pull_lyrics:
-                self.get_lyrics(song["id"])
+        if pull_lyrics:
+            for song_id in new_song_ids:
+                self.get_lyrics(song_id)
 
-            return new_song
+        return new_song_ids
 
+    def add_song(self, song, pull_lyrics=False):
+        new_song_ids = self.add_songs([song], pull_lyrics=pull_lyrics)
+        if new_song_ids:
+            return Song.query.get(song["id"])
         return True
 
     def get_lyrics(self, song_id, overwrite=False):
 
         song = Song.query.get(song_id)
-        if song is not None:
-            existing_lyrics = Song.query.get(song_id).lyrics
-            if len(existing_lyrics) > 0:
-                if overwrite:
-                    song = Song.query.get(song_id)
-                else:
-                    return
-        else:
-            song = self.add_song(song_id, pull_lyrics=False)
+        if song is None:
+            raise ValueError(f"Song {song_id} is not stored, add it with add_songs")
+        has_lyrics = any(
+            lyric.embedding_model == self.embedder.name for lyric in song.lyrics
+        )
+        if has_lyrics and not overwrite:
+            return
 
         lyrics = get_song_lyrics(song_id=song_id)
 
-        lyrics = lyrics_to_bars(lyrics)
-
-        db_lyrics = []
-        for i, bar in enumerate(lyrics):
-
-            response = ai_client.embeddings.create(
-                input=bar, model="text-embedding-3-small"
-            )
-
-            embedding = np.array(response.data[0].embedding)
+        bars = lyrics_to_bars(lyrics, self.chunker)
+        embeddings = embed_texts(bars, self.embedder) if bars else []
 
+        for bar, embedding in zip(bars, embeddings):
             logger.debug(
                 f"""Embedding for {bar}: 
                          mean: {np.mean(embedding)},
@@ -226,23 +271,17 @@ class ArtistClient:
                          """
             )
 
-            db_lyric = Lyric(lyric=bar, order=i, song=song)
-            db_lyric.add_embedding(embedding)
-            db_lyrics.append(db_lyric)
+        with timed("db_write"):
+            lyric_ids = bulk_insert_lyrics(song.id, bars, embeddings, self.embedder)
+            db.session.commit()
 
-            assert len(embedding) == 1536
+        logger.debug(f"Pulled {len(lyric_ids)} lyrics for {song.title}")
 
-            self.vdb.add_item(
-                db_lyric.id,
-                embedding,
-                {
-                    "song_name": song.title,
-                    "song_url": song.url,
-                    "text": bar,
-                },
+        # lyric ids only exist once inserted, so index after the write
+        lyric_index = get_lyric_index(self.embedder)
+        for lyric_id, bar, embedding in zip(lyric_ids, bars, embeddings):
+            metadata = lyric_metadata(
+                bar, song.title, song.url, self.artist.id, self.artist.name
             )
-
-        logger.debug(f"Pulled {len(db_lyrics)} lyrics for {song.title}")
-
-        db.session.add_all(db_lyrics)
-        db.session.commit()
+            self.vdb.add_item(lyric_id, embedding, metadata)
+            lyric_index.add_lyric(self.artist.id, lyric_id, embedding, metadata)
@@ -15,27 +15,52 @@ class Dictbased_VectorDB:
             distance = 1e9
         return distance
 
-    def calculate_average_embedding(self, exclude_similar=False):
-
-        # if not exclude_similar:
+    def calculate_average_embedding(self):
         return np.mean(list(self.internal_store.values()), axis=0)
 
-        # first, discard any vectors that are too similar to each other
-        # improve on this approach
-        # # This doesnt really work
-        # np_embeddings = np.array(list(self.internal_store.values()))
+    def as_matrix(self):
+        """Stack the stored embeddings into an (n, d) matrix, returning (ids, matrix)"""
+        ids = list(self.internal_store.keys())
+        return ids, np.vstack([self.internal_store[i] for i in ids])
+
+    def select_mmr(self, query_vector, num_results=3, mmr_lambda=0.7):
+        """Pick diverse results with maximal marginal relevance.
+
+        Each step picks the item maximising
+            lambda * sim(item, query) - (1 - lambda) * max(sim(item, already picked))
+        using cosine similarity. Only the running max similarity to the picked set
+        is kept (one vector of length n), so this is O(n * k) matrix-vector work
+        and never builds an n x n distance matrix.
+
+        Returns a list of (id, item, similarity_to_query) tuples.
+        """
+        if len(self.internal_store) == 0:
+            return []
+
+        ids, matrix = self.as_matrix()
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        normed = matrix / np.where(norms == 0, 1, norms)
+        query = np.asarray(query_vector, dtype=normed.dtype)
+        query = query / (np.linalg.norm(query) or 1)
+
+        relevance = normed @ query
+        max_sim_to_selected = np.full(len(ids), -np.inf)
+        available = np.ones(len(ids), dtype=bool)
 
-        # # calculate the pairwise distances
-        # distances = np.linalg.norm(
-        #     np_embeddings[:, None] - np_embeddings[None, :], axis=2
-        # )
-        # # find the indices of the vectors that are too similar
-        # invalid_indices = ((distances < 0.25) & (distances != 0)).sum(axis=1) > 0
+        selected = []
+        for _ in range(min(num_results, len(ids))):
+            if selected:
+                scores = mmr_lambda * relevance - (1 - mmr_lambda) * max_sim_to_selected
+            else:
+                scores = relevance.copy()
+            scores[~available] = -np.inf
 
-        # # remove the similar vectors
-        # np_embeddings = np_embeddings[~invalid_indices, :]
+            best = int(np.argmax(scores))
+            selected.append(best)
+            available[best] = False
+            max_sim_to_selected = np.maximum(max_sim_to_selected, normed @ normed[best])
 
-        return np.mean(np_embeddings, axis=0)
+        return [(ids[i], matrix[i], float(relevance[i])) for i in selected]
 
     def add_item(self, new_id, new_item, metadata):
         self.internal_store[new_id] = new_item
@@ -90,25 +115,232 @@ class Dictbased_VectorDB:
     def __len__(self):
         return len(self.internal_store)
 
-    def get_top_lyrics(self):
+    def get_top_lyrics(self, num_lyrics=3, mmr_lambda=0.7):
+        """Lyrics representative of the whole catalog, picked around the mean
+        embedding with MMR so near-duplicate bars (repeated choruses) don't crowd
+        out the rest. mmr_lambda=1 gives the plain nearest neighbours."""
 
         if len(self.internal_store) == 0:
             return []
 
-        avg_embedding = self.calculate_average_embedding(exclude_similar=True)
+        avg_embedding = self.calculate_average_embedding()
 
-        search_results = self.get_knn_byitem(avg_embedding, num_nbrs=3)
+        search_results = self.select_mmr(
+            avg_embedding, num_results=num_lyrics, mmr_lambda=mmr_lambda
+        )
 
         top_lyrics = []
-        for result in search_results:
-            lyric_id = result[0]
-
+        for lyric_id, item, _ in search_results:
             top_lyrics.append(
                 {
                     "lyric_id": lyric_id,
                     "lyric": self.metadata[lyric_id],
-                    "distance": result[2],
+                    "distance": self.calculate_squared_euclidean(avg_embedding, item),
                 }
             )
 
         return top_lyrics
+
+
+class Matrix_VectorDB(Dictbased_VectorDB):
+    """Exact kNN as a single matrix-vector product over the stored vectors.
+
+    The (n, d) matrix and the squared norms of its rows are cached, and rebuilt
+    on the first query after the store changes.
+    """
+
+    def __init__(self, embeddings=None, metadata=None):
+        super().__init__(
+            embeddings if embeddings is not None else {},
+            metadata if metadata is not None else {},
+        )
+        self._ids = None
+        self._matrix = None
+        self._squared_norms = None
+
+    def add_item(self, new_id, new_item, metadata):
+        # skip the O(n) inverse_index precomputation of the exact DB
+        self.internal_store[new_id] = new_item
+        self.metadata[new_id] = metadata
+        self._matrix = None
+
+    def _ensure_matrix(self):
+        # the store can also be filled directly (see GlobalLyricIndex.load)
+        if self._matrix is None or len(self._ids) != len(self.internal_store):
+            ids, matrix = self.as_matrix()
+            self._ids = ids
+            self._matrix = matrix.astype(np.float32)
+            self._squared_norms = np.einsum("ij,ij->i", self._matrix, self._matrix)
+
+    def get_knn_byitem(self, query_vector, num_nbrs=5):
+        if len(self.internal_store) == 0:
+            return []
+        self._ensure_matrix()
+
+        query = np.asarray(query_vector, dtype=np.float32)
+        distances = np.sqrt(
+            np.maximum(
+                self._squared_norms - 2 * (self._matrix @ query) + query @ query, 0
+            )
+        )
+        k = min(num_nbrs, len(self._ids))
+        nearest = np.argpartition(distances, k - 1)[:k]
+        nearest = nearest[np.argsort(distances[nearest])]
+
+        return [
+            (self._ids[i], self.internal_store[self._ids[i]], float(distances[i]))
+            for i in nearest
+        ]
+
+    def get_knn_byid(self, query_vector_id=0, num_nbrs=5):
+        if query_vector_id not in self.internal_store:
+            return ""
+
+        knn = self.get_knn_byitem(
+            self.internal_store[query_vector_id], num_nbrs=num_nbrs + 1
+        )
+        return [result for result in knn if result[0] != query_vector_id][:num_nbrs]
+
+
+class IVF_VectorDB(Matrix_VectorDB):
+    """Approximate kNN with an inverted file index (IVF).
+
+    Stored vectors are clustered with k-means into `n_lists` cells; a query only
+    scans the `n_probe` cells whose centroids are closest to it. Raising n_probe
+    trades latency for recall (n_probe == n_lists is an exact search).
+
+    The index is trained lazily on the first query and retrained once the store
+    has grown by `retrain_growth` since the last training; items added in between
+    are assigned to their nearest existing cell.
+    """
+
+    def __init__(
+        self,
+        embeddings=None,
+        metadata=None,
+        n_lists=64,
+        n_probe=8,
+        n_iter=10,
+        retrain_growth=2.0,
+        seed=0,
+    ):
+        super().__init__(
+            embeddings if embeddings is not None else {},
+            metadata if metadata is not None else {},
+        )
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.n_iter = n_iter
+        self.retrain_growth = retrain_growth
+        self.seed = seed
+
+        self.centroids = None
+        self._list_ids = []
+        self._list_vectors = []
+        self._n_trained = 0
+
+    def add_item(self, new_id, new_item, metadata):
+        # skip the O(n) inverse_index precomputation of the exact DB
+        self.internal_store[new_id] = new_item
+        self.metadata[new_id] = metadata
+
+        if self.centroids is None:
+            return
+        if len(self.internal_store) >= self._n_trained * self.retrain_growth:
+            self.centroids = None  # retrain on next query
+            return
+
+        vector = np.asarray(new_item, dtype=np.float32)
+        cell = int(np.argmin(self._squared_distances(vector[None, :], self.centroids)))
+        self._list_ids[cell].append(new_id)
+        self._list_vectors[cell] = np.vstack([self._list_vectors[cell], vector])
+
+    def train(self):
+        """Run k-means over the stored vectors and build the inverted lists"""
+        ids, matrix = self.as_matrix()
+        matrix = matrix.astype(np.float32)
+        n_lists = max(1, min(self.n_lists, len(ids)))
+
+        rng = np.random.default_rng(self.seed)
+        centroids = matrix[rng.choice(len(ids), size=n_lists, replace=False)]
+        for _ in range(self.n_iter):
+            assignment = np.argmin(self._squared_distances(matrix, centroids), axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignment, matrix)
+            counts = np.bincount(assignment, minlength=n_lists)
+            non_empty = counts > 0
+            centroids[non_empty] = sums[non_empty] / counts[non_empty, None]
+
+        assignment = np.argmin(self._squared_distances(matrix, centroids), axis=1)
+        order = np.argsort(assignment, kind="stable")
+        boundaries = np.searchsorted(assignment[order], np.arange(n_lists + 1))
+
+        ids = np.asarray(ids, dtype=object)
+        self._list_ids = []
+        self._list_vectors = []
+        for cell in range(n_lists):
+            members = order[boundaries[cell] : boundaries[cell + 1]]
+            self._list_ids.append(list(ids[members]))
+            self._list_vectors.append(matrix[members])
+
+        self.centroids = centroids
+        self._n_trained = len(ids)
+
+    def get_knn_byitem(self, query_vector, num_nbrs=5):
+        if len(self.internal_store) == 0:
+            return []
+        if self.centroids is None:
+            self.train()
+
+        query = np.asarray(query_vector, dtype=np.float32)
+        n_probe = min(self.n_probe, len(self.centroids))
+        cell_distances = self._squared_distances(query[None, :], self.centroids)[0]
+        probed = np.argpartition(cell_distances, n_probe - 1)[:n_probe]
+
+        candidate_ids = []
+        for cell in probed:
+            candidate_ids.extend(self._list_ids[cell])
+        if not candidate_ids:
+            return []
+        candidates = np.vstack([self._list_vectors[cell] for cell in probed])
+
+        distances = np.sqrt(self._squared_distances(query[None, :], candidates)[0])
+        k = min(num_nbrs, len(candidate_ids))
+        nearest = np.argpartition(distances, k - 1)[:k]
+        nearest = nearest[np.argsort(distances[nearest])]
+
+        return [
+            (
+                candidate_ids[i],
+                self.internal_store[candidate_ids[i]],
+                float(distances[i]),
+            )
+            for i in nearest
+        ]
+
+    @staticmethod
+    def _squared_distances(points, centroids):
+        """Pairwise squared euclidean distances between two sets of row vectors"""
+        distances = (
+            np.sum(points**2, axis=1)[:, None]
+            - 2 * points @ centroids.T
+            + np.sum(centroids**2, axis=1)[None, :]
+        )
+        return np.maximum(distances, 0)
+
+
+VECTOR_DB_ENGINES = {
+    "exact": Dictbased_VectorDB,
+    "matrix": Matrix_VectorDB,
+    "ivf": IVF_VectorDB,
+}
+
+
+def create_vector_db(embeddings, metadata, engine="exact", **engine_kwargs):
+    """Build a vector DB with the named search engine ("exact", "matrix" or "ivf")"""
+    if engine not in VECTOR_DB_ENGINES:
+        raise ValueError(
+            f"Unknown vector DB engine: {engine}. "
+            f"Expected one of {list(VECTOR_DB_ENGINES)}"
+        )
+    return VECTOR_DB_ENGINES[engine](embeddings, metadata, **engine_kwargs)
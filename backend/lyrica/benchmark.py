@@ -0,0 +1,318 @@
+"""
+Offline benchmark of the lyrica vector search engines.
+
+Generates synthetic embeddings (no Genius/OpenAI access needed), so it can run in
+CI. Run it as a script, which only needs numpy (going through the `backend` package
+would build the Flask app and require its secrets). Two modes:
+
+    # every engine at several catalog sizes: build time, memory, latency p50/p99,
+    # throughput and recall, as JSON
+    python backend/lyrica/benchmark.py suite --sizes 1000,10000,100000 --output bench.json
+
+    # IVF recall/latency across n_probe settings
+    python backend/lyrica/benchmark.py ann --n-vectors 20000 --dim 256
+
+The vectors are loosely clustered, like real embeddings: tight clusters make IVF
+look perfect at any n_probe, isotropic noise (--n-clusters 0) makes it look useless.
+
+Vectors are float32, so 1M x 1536-d needs ~6GB of RAM; the exact engine scans every
+vector in Python, so leave it out (--engines ivf) at the largest sizes.
+"""
+
+import argparse
+import datetime
+import json
+import platform
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+if __package__:
+    from backend.lyrica.VectorDB import VECTOR_DB_ENGINES, create_vector_db
+else:
+    # run as a script: import the engines without the Flask app in `backend`
+    from VectorDB import VECTOR_DB_ENGINES, create_vector_db
+
+DEFAULT_SIZES = (1_000, 10_000, 100_000)
+# noise around a cluster centre, relative to the spread of the centres
+DEFAULT_SPREAD = 3.0
+
+
+def synthetic_embeddings(
+    n_vectors,
+    dim=1536,
+    n_clusters=50,
+    seed=0,
+    dtype=np.float64,
+    chunk_size=10_000,
+    spread=DEFAULT_SPREAD,
+):
+    """Unit-norm vectors drawn around random cluster centres, like real embeddings.
+    With n_clusters=0 they are isotropic.
+
+    Generated `chunk_size` rows at a time so large sets never exist as float64.
+    """
+    rng = np.random.default_rng(seed)
+    if n_clusters:
+        centres = rng.normal(size=(n_clusters, dim))
+    else:
+        centres = np.zeros((1, dim))
+    vectors = np.empty((n_vectors, dim), dtype=dtype)
+    for start in range(0, n_vectors, chunk_size):
+        n_chunk = min(chunk_size, n_vectors - start)
+        labels = rng.integers(len(centres), size=n_chunk)
+        chunk = centres[labels] + rng.normal(scale=spread, size=(n_chunk, dim))
+        vectors[start : start + n_chunk] = chunk / np.linalg.norm(
+            chunk, axis=1, keepdims=True
+        )
+    return vectors
+
+
+def recall_at_k(exact_results, approx_results):
+    """Fraction of the exact top-k ids that the approximate search also returned"""
+    hits = 0
+    total = 0
+    for exact, approx in zip(exact_results, approx_results):
+        exact_ids = {result[0] for result in exact}
+        hits += len(exact_ids & {result[0] for result in approx})
+        total += len(exact_ids)
+    return hits / total if total else 1.0
+
+
+def exact_neighbours(vectors, queries, k):
+    """Ground-truth top-k ids for each query, computed with one matrix product"""
+    results = []
+    norms = np.sum(vectors.astype(np.float32) ** 2, axis=1)
+    for query in queries:
+        distances = norms - 2 * vectors @ query.astype(np.float32)
+        nearest = np.argpartition(distances, k - 1)[:k]
+        results.append([(int(i),) for i in nearest[np.argsort(distances[nearest])]])
+    return results
+
+
+def run_queries(vdb, queries, k):
+    results, latencies = run_timed_queries(vdb, queries, k)
+    return results, float(np.mean(latencies))
+
+
+def run_timed_queries(vdb, queries, k):
+    """kNN results and per-query latencies in ms"""
+    results = []
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        results.append(vdb.get_knn_byitem(query, num_nbrs=k))
+        latencies.append((time.perf_counter() - start) * 1000)
+    return results, latencies
+
+
+def default_engine_kwargs(engine, n_vectors):
+    """Engine settings used by the suite; IVF uses ~sqrt(n) lists"""
+    if engine == "ivf":
+        return {"n_lists": max(1, int(np.sqrt(n_vectors))), "n_probe": 8}
+    return {}
+
+
+def build_engine(engine, embeddings, **engine_kwargs):
+    vdb = create_vector_db(embeddings, {}, engine=engine, **engine_kwargs)
+    if hasattr(vdb, "train"):
+        vdb.train()
+    return vdb
+
+
+def measure_build_memory(engine, embeddings, **engine_kwargs):
+    """Bytes allocated by an engine on top of the raw vectors: (retained, peak)"""
+    tracemalloc.start()
+    try:
+        vdb = build_engine(engine, dict(embeddings), **engine_kwargs)
+        retained, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del vdb
+    return retained, peak
+
+
+def benchmark_engines(
+    sizes=DEFAULT_SIZES,
+    engines=tuple(VECTOR_DB_ENGINES),
+    dim=1536,
+    n_queries=100,
+    k=10,
+    n_clusters=50,
+    spread=DEFAULT_SPREAD,
+    seed=0,
+    measure_memory=True,
+    engine_kwargs=None,
+):
+    """Build time, memory, query latency (p50/p99/mean), throughput and recall@k
+    of each engine at each catalog size. Returns a JSON-serialisable dict."""
+    engine_kwargs = engine_kwargs or {}
+    results = []
+    for n_vectors in sizes:
+        vectors = synthetic_embeddings(
+            n_vectors + n_queries,
+            dim=dim,
+            n_clusters=n_clusters,
+            seed=seed,
+            dtype=np.float32,
+            spread=spread,
+        )
+        stored, queries = vectors[:n_vectors], vectors[n_vectors:]
+        embeddings = {i: stored[i] for i in range(n_vectors)}
+        truth = exact_neighbours(stored, queries, min(k, n_vectors))
+
+        for engine in engines:
+            kwargs = {
+                **default_engine_kwargs(engine, n_vectors),
+                **engine_kwargs.get(engine, {}),
+            }
+            start = time.perf_counter()
+            vdb = build_engine(engine, dict(embeddings), **kwargs)
+            build_ms = (time.perf_counter() - start) * 1000
+
+            knn, latencies = run_timed_queries(vdb, queries, k)
+            row = {
+                "engine": engine,
+                "n_vectors": n_vectors,
+                "dim": dim,
+                "k": k,
+                "params": kwargs,
+                "build_ms": build_ms,
+                "raw_vectors_bytes": int(stored.nbytes),
+                "p50_ms": float(np.percentile(latencies, 50)),
+                "p99_ms": float(np.percentile(latencies, 99)),
+                "mean_ms": float(np.mean(latencies)),
+                "qps": 1000 * len(latencies) / sum(latencies),
+                "recall": recall_at_k(truth, knn),
+            }
+            del vdb
+            if measure_memory:
+                retained, peak = measure_build_memory(engine, embeddings, **kwargs)
+                row["index_bytes"] = retained
+                row["build_peak_bytes"] = peak
+            results.append(row)
+
+    return {
+        "meta": {
+            "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "python": sys.version.split()[0],
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "n_queries": n_queries,
+            "n_clusters": n_clusters,
+            "spread": spread,
+            "seed": seed,
+        },
+        "results": results,
+    }
+
+
+def benchmark_ann(
+    n_vectors=20000,
+    dim=256,
+    n_queries=50,
+    k=10,
+    n_lists=128,
+    n_probes=(1, 4, 8, 16, 32),
+    n_clusters=50,
+    spread=DEFAULT_SPREAD,
+    seed=0,
+):
+    """Recall@k and mean query latency of IVF at several n_probe settings vs exact"""
+    vectors = synthetic_embeddings(
+        n_vectors + n_queries,
+        dim=dim,
+        n_clusters=n_clusters,
+        seed=seed,
+        spread=spread,
+    )
+    embeddings = {i: vectors[i] for i in range(n_vectors)}
+    queries = vectors[n_vectors:]
+
+    exact = create_vector_db(embeddings, {}, engine="exact")
+    exact_results, exact_ms = run_queries(exact, queries, k)
+    report = [{"engine": "exact", "recall": 1.0, "mean_query_ms": exact_ms}]
+
+    ivf = create_vector_db(embeddings, {}, engine="ivf", n_lists=n_lists, seed=seed)
+    start = time.perf_counter()
+    ivf.train()
+    build_ms = (time.perf_counter() - start) * 1000
+
+    for n_probe in n_probes:
+        ivf.n_probe = n_probe
+        ivf_results, ivf_ms = run_queries(ivf, queries, k)
+        report.append(
+            {
+                "engine": "ivf",
+                "n_lists": n_lists,
+                "n_probe": n_probe,
+                "build_ms": build_ms,
+                "recall": recall_at_k(exact_results, ivf_results),
+                "mean_query_ms": ivf_ms,
+            }
+        )
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Lyrica vector search benchmark")
+    subparsers = parser.add_subparsers(dest="mode", required=True)
+
+    suite = subparsers.add_parser("suite", help="compare engines across sizes")
+    suite.add_argument("--sizes", default=",".join(str(size) for size in DEFAULT_SIZES))
+    suite.add_argument("--engines", default=",".join(VECTOR_DB_ENGINES))
+    suite.add_argument("--dim", type=int, default=1536)
+    suite.add_argument("--n-queries", type=int, default=100)
+    suite.add_argument("--k", type=int, default=10)
+    suite.add_argument("--n-clusters", type=int, default=50)
+    suite.add_argument("--spread", type=float, default=DEFAULT_SPREAD)
+    suite.add_argument("--seed", type=int, default=0)
+    suite.add_argument("--no-memory", action="store_true")
+    suite.add_argument("--output", help="write the JSON report here, not stdout")
+
+    ann = subparsers.add_parser("ann", help="IVF recall across n_probe settings")
+    ann.add_argument("--n-vectors", type=int, default=20000)
+    ann.add_argument("--dim", type=int, default=256)
+    ann.add_argument("--n-queries", type=int, default=50)
+    ann.add_argument("--k", type=int, default=10)
+    ann.add_argument("--n-lists", type=int, default=128)
+    ann.add_argument("--n-clusters", type=int, default=50)
+    ann.add_argument("--spread", type=float, default=DEFAULT_SPREAD)
+
+    args = parser.parse_args(argv)
+
+    if args.mode == "suite":
+        report = benchmark_engines(
+            sizes=[int(size) for size in args.sizes.split(",")],
+            engines=args.engines.split(","),
+            dim=args.dim,
+            n_queries=args.n_queries,
+            k=args.k,
+            n_clusters=args.n_clusters,
+            spread=args.spread,
+            seed=args.seed,
+            measure_memory=not args.no_memory,
+        )
+    else:
+        report = benchmark_ann(
+            n_vectors=args.n_vectors,
+            dim=args.dim,
+            n_queries=args.n_queries,
+            k=args.k,
+            n_lists=args.n_lists,
+            n_clusters=args.n_clusters,
+            spread=args.spread,
+        )
+
+    output = json.dumps(report, indent=2)
+    if getattr(args, "output", None):
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+Split song lyrics into the bars we embed and index.
+
+Lyrics are first split into sections, on blank lines and on Genius section headers
+such as "[Chorus]" or "[Verse 2: Artist]". Each section is then cut into windows of
+at most `window_lines` lines / `max_tokens` tokens, with an optional overlap of
+`overlap_lines` between consecutive windows. Pieces shorter than `min_tokens` are
+merged into the previous window. Finally, repeated chunks (a chorus sung three
+times) are deduplicated by hash of their normalised text, so each is embedded once.
+
+Tokens are whitespace-separated words, which is close enough for sizing bars.
+"""
+
+import hashlib
+import re
+from dataclasses import dataclass
+from typing import List
+
+SECTION_HEADER = re.compile(r"^\s*\[[^\]]*\]\s*$")
+
+
+@dataclass(frozen=True)
+class ChunkerConfig:
+    window_lines: int = 10
+    overlap_lines: int = 0
+    min_tokens: int = 3
+    max_tokens: int = 200
+    split_on_headers: bool = True
+    dedupe: bool = True
+
+    def __post_init__(self):
+        if self.window_lines < 1:
+            raise ValueError("window_lines must be at least 1")
+        if not 0 <= self.overlap_lines < self.window_lines:
+            raise ValueError("overlap_lines must be between 0 and window_lines - 1")
+
+
+DEFAULT_CHUNKER = ChunkerConfig()
+
+
+def split_sections(lyrics: str, split_on_headers=True) -> List[List[str]]:
+    """Group non-empty lines into sections, dropping the header lines themselves"""
+    sections = []
+    current = []
+    for line in lyrics.splitlines():
+        is_header = SECTION_HEADER.match(line) is not None
+        if not line.strip() or (is_header and split_on_headers):
+            if current:
+                sections.append(current)
+                current = []
+            continue
+        if not is_header:
+            current.append(line.strip())
+    if current:
+        sections.append(current)
+    return sections
+
+
+def window_section(lines: List[str], config: ChunkerConfig) -> List[str]:
+    """Cut one section into overlapping windows bounded by lines and tokens"""
+    n_tokens = [len(line.split()) for line in lines]
+    windows = []
+    start = 0
+    while start < len(lines):
+        end = start
+        tokens = 0
+        while (
+            end < len(lines)
+            and end - start < config.window_lines
+            and (end == start or tokens + n_tokens[end] <= config.max_tokens)
+        ):
+            tokens += n_tokens[end]
+            end += 1
+
+        if tokens < config.min_tokens and windows:
+            # too short to stand alone, fold the leftover lines into the last window
+            new_lines = lines[max(start, windows[-1][1]) : end]
+            windows[-1] = (windows[-1][0], end, windows[-1][2] + new_lines)
+        else:
+            windows.append((start, end, lines[start:end]))
+
+        if end == len(lines):
+            break
+        start = max(end - config.overlap_lines, start + 1)
+
+    return [
+        "\n".join(window_lines)
+        for _, _, window_lines in windows
+        if sum(len(line.split()) for line in window_lines) >= config.min_tokens
+    ]
+
+
+def chunk_hash(chunk: str) -> str:
+    """Hash of the chunk with case, punctuation and spacing normalised away"""
+    normalised = " ".join(re.sub(r"[^\w\s]", "", chunk.lower()).split())
+    return hashlib.sha1(normalised.encode()).hexdigest()
+
+
+def chunk_lyrics(lyrics: str, config: ChunkerConfig = DEFAULT_CHUNKER) -> List[str]:
+    """Split lyrics into embeddable chunks according to `config`"""
+    if not lyrics:
+        return []
+
+    chunks = []
+    seen = set()
+    for section in split_sections(lyrics, config.split_on_headers):
+        for chunk in window_section(section, config):
+            if config.dedupe:
+                key = chunk_hash(chunk)
+                if key in seen:
+                    continue
+                seen.add(key)
+            chunks.append(chunk)
+    return chunks
@@ -0,0 +1,79 @@
+"""
+Registry of the embedding models lyrics can be embedded with.
+
+Every stored lyric records the name of the embedder that produced its vector and
+the vector's dimension, and vector indices are built per embedder, so vectors from
+different models (or of different sizes) are never compared with each other.
+
+The text-embedding-3 models can return shortened vectors through the API's
+`dimensions` parameter. A 256-d index is 6x smaller and correspondingly faster to
+search than the native 1536-d one, at some cost in retrieval quality.
+"""
+
+from dataclasses import dataclass
+
+import numpy as np
+
+
+@dataclass(frozen=True)
+class Embedder:
+    name: str
+    model: str
+    dimensions: int
+    native_dimensions: int
+
+    @property
+    def reduced(self) -> bool:
+        return self.dimensions < self.native_dimensions
+
+    def request_kwargs(self) -> dict:
+        """Keyword arguments for `client.embeddings.create`"""
+        if self.reduced:
+            return {"model": self.model, "dimensions": self.dimensions}
+        return {"model": self.model}
+
+    def check(self, embedding: np.ndarray):
+        if len(embedding) != self.dimensions:
+            raise ValueError(
+                f"{self.name} should produce {self.dimensions}-d embeddings, "
+                f"got {len(embedding)}"
+            )
+
+
+EMBEDDERS = {}
+
+
+def register_embedder(embedder: Embedder) -> Embedder:
+    EMBEDDERS[embedder.name] = embedder
+    return embedder
+
+
+for _model, _native, _sizes in [
+    ("text-embedding-3-small", 1536, (1536, 512, 256)),
+    ("text-embedding-3-large", 3072, (3072, 1024, 256)),
+]:
+    for _size in _sizes:
+        register_embedder(
+            Embedder(
+                name=_model if _size == _native else f"{_model}-{_size}",
+                model=_model,
+                dimensions=_size,
+                native_dimensions=_native,
+            )
+        )
+
+# also what every lyric stored before the model was recorded was embedded with
+DEFAULT_EMBEDDER = EMBEDDERS["text-embedding-3-small"]
+
+
+def get_embedder(embedder=None) -> Embedder:
+    """Look up an embedder by name; an Embedder is returned as is, None gives the default"""
+    if embedder is None:
+        return DEFAULT_EMBEDDER
+    if isinstance(embedder, Embedder):
+        return embedder
+    if embedder not in EMBEDDERS:
+        raise ValueError(
+            f"Unknown embedder {embedder!r}, expected one of {sorted(EMBEDDERS)}"
+        )
+    return EMBEDDERS[embedder]
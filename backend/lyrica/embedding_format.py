@@ -0,0 +1,92 @@
+"""
+Binary storage format for lyric embeddings.
+
+Legacy rows hold a bare float64 buffer (``embedding.tobytes()``). Newer rows start
+with a single header byte naming the encoding, followed by the payload:
+
+    FLOAT32: header | float32[n]
+    FLOAT16: header | float16[n]
+    INT8:    header | dim (uint32) | scale (float32) | offset (float32) | int8[n] (+ pad)
+
+Every tagged blob has an odd length, while legacy float64 blobs are always a
+multiple of 8 bytes, so the two can be told apart without a separate column.
+"""
+
+from enum import IntEnum
+
+import numpy as np
+
+
+class EmbeddingFormat(IntEnum):
+    """Header byte values for stored embeddings"""
+
+    FLOAT32 = 1
+    FLOAT16 = 2
+    INT8 = 3
+
+
+DEFAULT_FORMAT = EmbeddingFormat.FLOAT32
+
+_FLOAT_DTYPES = {
+    EmbeddingFormat.FLOAT32: np.dtype("<f4"),
+    EmbeddingFormat.FLOAT16: np.dtype("<f2"),
+}
+_INT8_PARAMS = np.dtype([("dim", "<u4"), ("scale", "<f4"), ("offset", "<f4")])
+
+
+def encode_embedding(embedding, fmt=DEFAULT_FORMAT) -> bytes:
+    """Serialize an embedding vector to the tagged storage format"""
+    fmt = EmbeddingFormat(fmt)
+    vector = np.asarray(embedding, dtype=np.float64).ravel()
+    header = bytes([fmt])
+
+    if fmt in _FLOAT_DTYPES:
+        return header + vector.astype(_FLOAT_DTYPES[fmt]).tobytes()
+
+    # Scalar quantization: map [min, max] linearly onto [-127, 127]
+    low, high = (float(vector.min()), float(vector.max())) if vector.size else (0, 0)
+    scale = (high - low) / 254.0 or 1.0
+    offset = low + 127.0 * scale
+    quantized = np.clip(np.rint((vector - offset) / scale), -127, 127).astype(np.int8)
+
+    params = np.array([(vector.size, scale, offset)], dtype=_INT8_PARAMS).tobytes()
+    payload = quantized.tobytes()
+    # keep the blob length odd so it never looks like a legacy float64 buffer
+    if len(payload) % 2:
+        payload += b"\x00"
+    return header + params + payload
+
+
+def decode_embedding(blob: bytes) -> np.ndarray:
+    """Deserialize a stored embedding, accepting both legacy and tagged blobs"""
+    if blob is None:
+        return None
+    blob = bytes(blob)
+
+    if is_legacy_embedding(blob):
+        return np.frombuffer(blob, dtype=np.float64)
+
+    fmt = EmbeddingFormat(blob[0])
+    if fmt in _FLOAT_DTYPES:
+        return np.frombuffer(blob, dtype=_FLOAT_DTYPES[fmt], offset=1).astype(
+            np.float32
+        )
+
+    params = np.frombuffer(blob, dtype=_INT8_PARAMS, count=1, offset=1)[0]
+    dim, scale, offset = int(params["dim"]), params["scale"], params["offset"]
+    quantized = np.frombuffer(
+        blob, dtype=np.int8, count=dim, offset=1 + _INT8_PARAMS.itemsize
+    )
+    return (quantized.astype(np.float32) * scale + offset).astype(np.float32)
+
+
+def is_legacy_embedding(blob: bytes) -> bool:
+    """Legacy embeddings are headerless float64 buffers"""
+    return len(blob) % 8 == 0
+
+
+def embedding_format(blob: bytes):
+    """Return the format of a stored blob, or None for legacy float64 rows"""
+    if is_legacy_embedding(blob):
+        return None
+    return EmbeddingFormat(blob[0])
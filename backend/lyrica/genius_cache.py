@@ -0,0 +1,126 @@
+"""
+Persistent cache for Genius API responses.
+
+Responses are stored as JSON files keyed by endpoint + params, so every gunicorn
+worker on the host shares them and they survive restarts. Each resource type has
+its own TTL. Once an entry is older than its TTL (but not older than its max
+stale age) the stale value is returned immediately and a background thread
+fetches a fresh copy; a lock file makes sure only one worker does the refresh.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+
+from backend.extensions import create_logger
+from backend.lyrica.metrics import registry
+
+logger = create_logger(__name__, level="DEBUG")
+
+DAY = 24 * 60 * 60
+
+# resource type -> (ttl, max stale age) in seconds
+GENIUS_CACHE_TTLS = {
+    "search_artists": (7 * DAY, 90 * DAY),
+    "artist": (7 * DAY, 90 * DAY),
+    "artist_songs": (1 * DAY, 30 * DAY),
+    "lyrics": (30 * DAY, 365 * DAY),
+}
+DEFAULT_TTL = (1 * DAY, 7 * DAY)
+
+CACHE_REQUESTS = registry.counter(
+    "lyrica_genius_cache_requests_total",
+    "Genius cache lookups by resource and result (hit, stale, miss)",
+)
+
+GENIUS_CACHE_DIR = os.environ.get(
+    "GENIUS_CACHE_DIR",
+    os.path.join(os.getenv("TEMP", "/tmp"), "lyrica_genius_cache"),
+)
+
+
+class GeniusCache:
+    def __init__(self, cache_dir=GENIUS_CACHE_DIR, ttls=None, clock=time.time):
+        self.cache_dir = cache_dir
+        self.ttls = GENIUS_CACHE_TTLS if ttls is None else ttls
+        self.clock = clock
+        # a revalidation lock older than this is assumed to belong to a dead worker
+        self.lock_timeout = 60
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def key(self, resource, params):
+        raw = json.dumps({"resource": resource, "params": params}, sort_keys=True)
+        return hashlib.sha256(raw.encode()).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def read(self, key):
+        try:
+            with open(self._path(key)) as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def write(self, key, value):
+        # write to a temp file and rename so readers never see a partial entry
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump({"stored_at": self.clock(), "value": value}, f)
+        os.replace(tmp_path, self._path(key))
+
+    def get(self, resource, params, fetch, revalidate_async=True):
+        """Return the cached response for (resource, params), calling `fetch()` on
+        a miss. Stale entries are served while being revalidated."""
+        ttl, max_stale = self.ttls.get(resource, DEFAULT_TTL)
+        key = self.key(resource, params)
+        entry = self.read(key)
+
+        if entry is not None:
+            age = self.clock() - entry["stored_at"]
+            if age < ttl:
+                CACHE_REQUESTS.inc(resource=resource, result="hit")
+                return entry["value"]
+            if age < max_stale:
+                CACHE_REQUESTS.inc(resource=resource, result="stale")
+                logger.debug(f"Serving stale {resource} {params}, revalidating")
+                if revalidate_async:
+                    threading.Thread(
+                        target=self._revalidate, args=(key, fetch), daemon=True
+                    ).start()
+                else:
+                    self._revalidate(key, fetch)
+                return entry["value"]
+
+        CACHE_REQUESTS.inc(resource=resource, result="miss")
+        value = fetch()
+        if value is not None:
+            self.write(key, value)
+        return value
+
+    def _revalidate(self, key, fetch):
+        lock_path = self._path(key) + ".lock"
+        try:
+            if time.time() - os.path.getmtime(lock_path) > self.lock_timeout:
+                os.remove(lock_path)
+        except FileNotFoundError:
+            pass
+        try:
+            fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            return  # another worker is already refreshing this entry
+        try:
+            value = fetch()
+            if value is not None:
+                self.write(key, value)
+        except Exception as e:
+            logger.warning(f"Revalidating Genius cache entry {key} failed: {e}")
+        finally:
+            os.close(fd)
+            os.remove(lock_path)
+
+
+genius_cache = GeniusCache()
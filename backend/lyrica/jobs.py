@@ -0,0 +1,180 @@
+"""
+Background fetching of an artist's songs and lyrics.
+
+The slow Genius/OpenAI loop used to run inside the streaming response, holding a
+gunicorn worker and the request's DB session for minutes. It now runs in a
+background thread that appends each progress payload to `lyrica_fetch_job_events`;
+HTTP handlers only tail that table, so clients can disconnect and resume from the
+last sequence number they saw.
+
+A job that stops updating (its thread was killed, or its worker restarted) would
+otherwise stay in flight forever: running jobs heartbeat through `updated_at`, and
+one that has not been updated for STALE_AFTER is marked failed and replaced.
+"""
+
+import threading
+import time
+from datetime import datetime, timedelta
+
+from flask import current_app
+
+from backend.extensions import create_logger, db
+from backend.lyrica.models import FetchJob, FetchJobEvent, FetchJobStatus
+from backend.lyrica.repository import get_song_lyric_counts
+
+logger = create_logger(__name__, level="DEBUG")
+
+N_SONG_TARGET = 10
+# running jobs touch updated_at at least once per song, well within this
+STALE_AFTER = timedelta(minutes=5)
+# longest a client is kept waiting on a job, it can resume from the last seq it saw
+TAIL_TIMEOUT = 600
+
+
+def is_stale(job, now=None) -> bool:
+    """Whether an unfinished job has gone without an update for STALE_AFTER"""
+    now = now or datetime.utcnow()
+    return not job.is_finished and now - job.updated_at > STALE_AFTER
+
+
+def fail_stale_job(job):
+    logger.warning(f"Fetch job {job.id} stopped updating, marking it failed")
+    job.status = FetchJobStatus.FAILED
+    job.error = f"No progress for {STALE_AFTER}"
+    db.session.commit()
+
+
+def start_fetch_job(artist_id) -> FetchJob:
+    """Start fetching for an artist, reusing a job that is already in flight
+    unless it has gone stale"""
+    artist_id = int(artist_id)
+    job = (
+        FetchJob.query.filter_by(artist_id=artist_id)
+        .filter(FetchJob.status.in_([FetchJobStatus.PENDING, FetchJobStatus.RUNNING]))
+        .order_by(FetchJob.id.desc())
+        .first()
+    )
+    if job is not None:
+        if not is_stale(job):
+            return job
+        fail_stale_job(job)
+
+    job = FetchJob(artist_id=artist_id, status=FetchJobStatus.PENDING)
+    db.session.add(job)
+    db.session.commit()
+
+    app = current_app._get_current_object()
+    threading.Thread(target=run_fetch_job, args=(app, job.id), daemon=True).start()
+    return job
+
+
+def record_event(job, payload):
+    """Append a progress payload to the job and commit it"""
+    job.last_seq += 1
+    db.session.add(FetchJobEvent(job_id=job.id, seq=job.last_seq, payload=payload))
+    db.session.commit()
+
+
+def heartbeat(job):
+    """Touch the job so it is not taken for stale"""
+    job.updated_at = datetime.utcnow()
+    db.session.commit()
+
+
+def get_events(job_id, after_seq=0):
+    """Progress payloads with seq > after_seq, oldest first"""
+    return (
+        FetchJobEvent.query.filter(
+            FetchJobEvent.job_id == job_id, FetchJobEvent.seq > after_seq
+        )
+        .order_by(FetchJobEvent.seq)
+        .all()
+    )
+
+
+def run_fetch_job(app, job_id):
+    """Thread target: pull songs and lyrics, recording a payload after each song"""
+    # imported here so the job tables can be used without the Genius client
+    from backend.lyrica import ArtistClient
+
+    with app.app_context():
+        job = db.session.get(FetchJob, job_id)
+        job.status = FetchJobStatus.RUNNING
+        db.session.commit()
+
+        try:
+            artist = ArtistClient.ArtistClient(artist_id=job.artist_id)
+
+            n_songs_with_lyrics = artist.n_songs_with_lyrics
+
+            def payload(top_lyrics):
+                return {
+                    "n_songs": n_songs_with_lyrics,
+                    "artist": artist.artist.name,
+                    "top_lyrics": top_lyrics or [],
+                }
+
+            record_event(job, payload(artist.get_top_lyrics()))
+
+            song_counts = get_song_lyric_counts(artist.artist.id, artist.embedder.name)
+            if len(song_counts) < N_SONG_TARGET:
+                logger.info(f"Getting more songs for {artist.artist.name}")
+                heartbeat(job)
+                artist.get_songs(N_SONG_TARGET - len(song_counts))
+                song_counts = get_song_lyric_counts(
+                    artist.artist.id, artist.embedder.name
+                )
+
+            for song in song_counts[:N_SONG_TARGET]:
+                if song.n_lyrics == 0:
+                    logger.info(f"Getting lyrics for {song.title}")
+                    heartbeat(job)
+                    artist.get_lyrics(song.song_id)
+                    n_songs_with_lyrics += 1
+
+                    record_event(job, payload(artist.get_top_lyrics()))
+
+                    time.sleep(2)
+
+            job.status = FetchJobStatus.COMPLETED
+        except Exception as e:
+            logger.exception(e)
+            db.session.rollback()
+            job.status = FetchJobStatus.FAILED
+            job.error = str(e)
+        finally:
+            db.session.commit()
+            db.session.remove()
+
+
+def tail_job_events(job_id, after_seq=0, poll_interval=0.5, timeout=TAIL_TIMEOUT):
+    """Yield (seq, payload) for a job's events until it finishes.
+
+    The session is closed after every poll so no DB connection is held while
+    waiting. A failed or stale job, or one still running after `timeout`
+    seconds, ends with an {"error": ...} payload (seq None).
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        job = db.session.get(FetchJob, job_id)
+        if job is None:
+            return
+        if is_stale(job):
+            fail_stale_job(job)
+        # read the status first: a finished job has committed all of its events
+        finished, failed = job.is_finished, job.status == FetchJobStatus.FAILED
+        events = [(event.seq, event.payload) for event in get_events(job_id, after_seq)]
+        db.session.close()
+
+        yield from events
+        if events:
+            after_seq = events[-1][0]
+
+        if finished:
+            if failed:
+                yield None, {"error": "Error pulling artist info"}
+            return
+        if time.monotonic() >= deadline:
+            yield None, {"error": "Timed out waiting for artist info"}
+            return
+        time.sleep(poll_interval)
@@ -0,0 +1,212 @@
+"""
+In-process metrics for the Lyrica pipeline.
+
+Counters and histograms live in a process-wide registry and are rendered in the
+Prometheus text format by the /lyrica/metrics endpoint. Each gunicorn worker keeps
+its own registry, so scrape per worker (or sum in Prometheus).
+
+Slow stages are wrapped with `timed`, which records the stage's duration and an
+ok/error call count:
+
+    @timed("genius_search")
+    def name_to_id(artist_name): ...
+
+    with timed("db_write"):
+        ...
+
+Tests can inspect values with `registry.get(...)` and start clean with
+`registry.reset()`.
+"""
+
+import functools
+import math
+import threading
+import time
+from collections import defaultdict
+
+# seconds; Genius/OpenAI calls take 0.1-10s, vector search well under 0.1s
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(label_key, extra=()):
+    pairs = list(label_key) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (
+        (
+            name,
+            str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"),
+        )
+        for name, value in pairs
+    )
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value))
+
+
+class Counter:
+    type = "counter"
+
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        self._values = defaultdict(float)
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        with self._lock:
+            self._values[_label_key(labels)] += amount
+
+    def get(self, **labels):
+        return self._values.get(_label_key(labels), 0.0)
+
+    def reset(self):
+        with self._lock:
+            self._values.clear()
+
+    def samples(self):
+        with self._lock:
+            return [
+                (self.name, key, value) for key, value in sorted(self._values.items())
+            ]
+
+
+class Histogram:
+    type = "histogram"
+
+    def __init__(self, name, help, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        # label key -> [per-bucket counts, sum, count]
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            if key not in self._values:
+                self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            counts, _, _ = entry = self._values[key]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            entry[1] += value
+            entry[2] += 1
+
+    def get(self, **labels):
+        """(count, sum) of the observations with these labels"""
+        entry = self._values.get(_label_key(labels))
+        if entry is None:
+            return 0, 0.0
+        return entry[2], entry[1]
+
+    def reset(self):
+        with self._lock:
+            self._values.clear()
+
+    def samples(self):
+        samples = []
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._values.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    samples.append(
+                        (
+                            f"{self.name}_bucket",
+                            key + (("le", _format_value(bound)),),
+                            cumulative,
+                        )
+                    )
+                samples.append((f"{self.name}_sum", key, total))
+                samples.append((f"{self.name}_count", key, count))
+        return samples
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, cls, name, help, **kwargs):
+        with self._lock:
+            if name not in self.metrics:
+                self.metrics[name] = cls(name, help, **kwargs)
+            metric = self.metrics[name]
+        if not isinstance(metric, cls):
+            raise ValueError(f"Metric {name} is already registered as a {metric.type}")
+        return metric
+
+    def counter(self, name, help=""):
+        return self._register(Counter, name, help)
+
+    def histogram(self, name, help="", buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram, name, help, buckets=buckets)
+
+    def get(self, name):
+        return self.metrics[name]
+
+    def reset(self):
+        """Zero every metric, keeping them registered"""
+        for metric in list(self.metrics.values()):
+            metric.reset()
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format"""
+        lines = []
+        for name, metric in sorted(self.metrics.items()):
+            lines.append(f"# HELP {name} {metric.help}")
+            lines.append(f"# TYPE {name} {metric.type}")
+            for sample_name, key, value in metric.samples():
+                lines.append(
+                    f"{sample_name}{_format_labels(key)} {_format_value(value)}"
+                )
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+STAGE_SECONDS = registry.histogram(
+    "lyrica_stage_duration_seconds", "Time spent in each Lyrica pipeline stage"
+)
+STAGE_CALLS = registry.counter(
+    "lyrica_stage_calls_total", "Lyrica pipeline stage calls by outcome"
+)
+
+
+class timed:
+    """Time a pipeline stage, as a decorator or a context manager"""
+
+    def __init__(self, stage):
+        self.stage = stage
+        self._starts = threading.local()
+
+    def __enter__(self):
+        if not hasattr(self._starts, "stack"):
+            self._starts.stack = []
+        self._starts.stack.append(time.perf_counter())
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self._starts.stack.pop()
+        STAGE_SECONDS.observe(elapsed, stage=self.stage)
+        STAGE_CALLS.inc(stage=self.stage, status="error" if exc_type else "ok")
+        return False
+
+    def __call__(self, func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with self:
+                return func(*args, **kwargs)
+
+        return wrapper
@@ -0,0 +1,137 @@
+"""
+Rewrite stored lyric embeddings into the compact tagged format, after adding the
+embedding model/dimension columns and widening the lyric column if the lyrics table
+predates them, and creating the fetch job tables if they don't exist yet.
+
+The lyrica tables are not managed by alembic, so this runs as a one-off script on
+deploy, before the new app version starts serving:
+
+    ENV=prod python -m backend.lyrica.migrate_embeddings [float32|float16|int8]
+
+Rows already in the requested format are skipped, so the script can be re-run safely.
+"""
+
+import sys
+
+import sqlalchemy as sa
+
+from backend.extensions import create_logger, db
+from backend.lyrica.embedders import DEFAULT_EMBEDDER
+from backend.lyrica.embedding_format import (
+    DEFAULT_FORMAT,
+    EmbeddingFormat,
+    decode_embedding,
+    embedding_format,
+    encode_embedding,
+)
+from backend.lyrica.models import FetchJob, FetchJobEvent, Lyric
+
+logger = create_logger(__name__, level="INFO")
+
+
+def add_embedding_model_columns(session):
+    """Add Lyric.embedding_model/embedding_dim to an existing lyrics table.
+
+    Every lyric stored before these columns existed was embedded with the default
+    embedder, so that is what old rows are labelled with.
+    """
+    session.execute(
+        # DDL can't take bound parameters; the name is a trusted constant
+        sa.text(
+            "ALTER TABLE lyrics ADD COLUMN IF NOT EXISTS embedding_model VARCHAR(64) "
+            f"NOT NULL DEFAULT '{DEFAULT_EMBEDDER.name}'"
+        )
+    )
+    session.execute(
+        sa.text("ALTER TABLE lyrics ADD COLUMN IF NOT EXISTS embedding_dim INTEGER")
+    )
+    session.execute(
+        sa.text(
+            "CREATE INDEX IF NOT EXISTS ix_lyrics_embedding_model "
+            "ON lyrics (embedding_model)"
+        )
+    )
+    session.execute(
+        sa.text(
+            "UPDATE lyrics SET embedding_dim = :dim "
+            "WHERE embedding_dim IS NULL AND embeddings IS NOT NULL"
+        ).bindparams(dim=DEFAULT_EMBEDDER.dimensions)
+    )
+    session.commit()
+
+
+def widen_lyric_column(session):
+    """Chunker windows run to several lines, more than the old VARCHAR(128) holds"""
+    session.execute(sa.text("ALTER TABLE lyrics ALTER COLUMN lyric TYPE TEXT"))
+    session.commit()
+
+
+def create_fetch_job_tables(session):
+    """Create the tables behind the background artist fetch jobs"""
+    bind = session.get_bind()
+    for model in (FetchJob, FetchJobEvent):
+        model.__table__.create(bind, checkfirst=True)
+    session.commit()
+
+
+def rewrite_embeddings(session, fmt=DEFAULT_FORMAT, batch_size=500) -> int:
+    """Re-encode every stored embedding that is not already in `fmt`.
+
+    Works in id-ordered batches (keyset pagination) and commits after each batch.
+    Returns the number of rows rewritten.
+    """
+    fmt = EmbeddingFormat(fmt)
+    lyrics = Lyric.__table__
+    last_id = 0
+    n_rewritten = 0
+
+    while True:
+        rows = session.execute(
+            sa.select(lyrics.c.id, lyrics.c.embeddings)
+            .where(lyrics.c.id > last_id, lyrics.c.embeddings.isnot(None))
+            .order_by(lyrics.c.id)
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            break
+        last_id = rows[-1].id
+
+        updates = [
+            {
+                "lyric_id": row.id,
+                "new_embeddings": encode_embedding(
+                    decode_embedding(row.embeddings), fmt
+                ),
+            }
+            for row in rows
+            if embedding_format(row.embeddings) != fmt
+        ]
+        if updates:
+            session.execute(
+                lyrics.update()
+                .where(lyrics.c.id == sa.bindparam("lyric_id"))
+                .values(embeddings=sa.bindparam("new_embeddings")),
+                updates,
+            )
+            session.commit()
+            n_rewritten += len(updates)
+            logger.info(f"Rewrote {n_rewritten} embeddings (up to lyric {last_id})")
+
+    return n_rewritten
+
+
+def main():
+    fmt = EmbeddingFormat[sys.argv[1].upper()] if len(sys.argv) > 1 else DEFAULT_FORMAT
+    add_embedding_model_columns(db.session)
+    widen_lyric_column(db.session)
+    create_fetch_job_tables(db.session)
+    n_rewritten = rewrite_embeddings(db.session, fmt)
+    logger.info(f"Done: {n_rewritten} embeddings rewritten as {fmt.name}")
+
+
+if __name__ == "__main__":
+    from app import deploy_app
+
+    app = deploy_app()
+    with app.app_context():
+        main()
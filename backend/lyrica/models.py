@@ -1,6 +1,15 @@
+from datetime import datetime
+from enum import Enum
+
 import sqlalchemy as sa
 from sqlalchemy.orm import relationship
 from backend import db
+from backend.lyrica.embedding_format import (
+    DEFAULT_FORMAT,
+    decode_embedding,
+    encode_embedding,
+)
+from backend.lyrica.embedders import DEFAULT_EMBEDDER
 import numpy as np
 
 
@@ -36,18 +45,92 @@ class Lyric(db.Model):
     __tablename__ = "lyrics"
 
     id = sa.Column(sa.Integer, primary_key=True)
-    lyric = sa.Column(sa.String(128), nullable=False)
+    # a chunker window (chunking.ChunkerConfig), several lines long
+    lyric = sa.Column(sa.Text, nullable=False)
     order = sa.Column(sa.Integer, nullable=False)
     song_id = sa.Column(
         sa.Integer, sa.ForeignKey("songs.id"), nullable=False, name="song_id"
     )
     embeddings = sa.Column(sa.LargeBinary, nullable=True)
+    # which embedders.Embedder produced the vector, and its length
+    embedding_model = sa.Column(
+        sa.String(64),
+        nullable=False,
+        default=DEFAULT_EMBEDDER.name,
+        server_default=DEFAULT_EMBEDDER.name,
+        index=True,
+    )
+    embedding_dim = sa.Column(sa.Integer, nullable=True)
 
-    def add_embedding(self, embedding: np.ndarray):
-        self.embeddings = embedding.tobytes()
+    def add_embedding(
+        self, embedding: np.ndarray, fmt=DEFAULT_FORMAT, embedder=DEFAULT_EMBEDDER
+    ):
+        self.embeddings = encode_embedding(embedding, fmt)
+        self.embedding_model = embedder.name
+        self.embedding_dim = len(embedding)
 
     def get_embedding(self) -> np.ndarray:
-        return np.frombuffer(self.embeddings, dtype=np.float64)
+        return decode_embedding(self.embeddings)
 
     def __repr__(self):
         return f"<Lyric: {self.lyric}>"
+
+
+class FetchJobStatus(str, Enum):
+    PENDING = "pending"
+    RUNNING = "running"
+    COMPLETED = "completed"
+    FAILED = "failed"
+
+
+class FetchJob(db.Model):
+    """Background job pulling an artist's songs/lyrics; progress goes to FetchJobEvent"""
+
+    __tablename__ = "lyrica_fetch_jobs"
+
+    id = sa.Column(sa.Integer, primary_key=True)
+    artist_id = sa.Column(sa.Integer, nullable=False, index=True)
+    status = sa.Column(
+        sa.Enum(FetchJobStatus), nullable=False, default=FetchJobStatus.PENDING
+    )
+    last_seq = sa.Column(sa.Integer, nullable=False, default=0)
+    error = sa.Column(sa.Text, nullable=True)
+    created_at = sa.Column(sa.DateTime, nullable=False, default=datetime.utcnow)
+    updated_at = sa.Column(
+        sa.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow
+    )
+
+    events = relationship(
+        "FetchJobEvent", backref="job", lazy=True, order_by="FetchJobEvent.seq"
+    )
+
+    @property
+    def is_finished(self):
+        return self.status in (FetchJobStatus.COMPLETED, FetchJobStatus.FAILED)
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "artist_id": self.artist_id,
+            "status": self.status.value,
+            "last_seq": self.last_seq,
+            "error": self.error,
+            "created_at": self.created_at.isoformat(),
+            "updated_at": self.updated_at.isoformat(),
+        }
+
+    def __repr__(self):
+        return f"<FetchJob {self.id}: {self.artist_id} {self.status}>"
+
+
+class FetchJobEvent(db.Model):
+    __tablename__ = "lyrica_fetch_job_events"
+    __table_args__ = (sa.UniqueConstraint("job_id", "seq"),)
+
+    id = sa.Column(sa.Integer, primary_key=True)
+    job_id = sa.Column(
+        sa.Integer, sa.ForeignKey("lyrica_fetch_jobs.id"), nullable=False
+    )
+    seq = sa.Column(sa.Integer, nullable=False)
+    payload = sa.Column(sa.JSON, nullable=False)
+    created_at = sa.Column(sa.DateTime, nullable=False, default=datetime.utcnow)
@@ -0,0 +1,162 @@
+"""
+Query helpers for loading an artist's song/lyric graph without per-song lazy loads.
+"""
+
+from typing import List, NamedTuple
+
+import sqlalchemy as sa
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import selectinload
+
+from backend import db
+from backend.lyrica.embedders import DEFAULT_EMBEDDER
+from backend.lyrica.embedding_format import encode_embedding
+from backend.lyrica.models import Artist, Lyric, Song
+
+
+class SongLyricCount(NamedTuple):
+    song_id: int
+    title: str
+    url: str
+    n_lyrics: int
+
+
+def _lyric_model_filter(embedding_model):
+    return (
+        sa.true()
+        if embedding_model is None
+        else Lyric.embedding_model == embedding_model
+    )
+
+
+def get_song_lyric_counts(artist_id, embedding_model=None) -> List[SongLyricCount]:
+    """Number of stored lyrics for each of an artist's songs, in a single query.
+    With `embedding_model`, only lyrics embedded by that model are counted."""
+    rows = db.session.execute(
+        sa.select(Song.id, Song.title, Song.url, sa.func.count(Lyric.id))
+        .outerjoin(
+            Lyric,
+            sa.and_(Lyric.song_id == Song.id, _lyric_model_filter(embedding_model)),
+        )
+        .where(Song.artist_id == artist_id)
+        .group_by(Song.id)
+        .order_by(Song.id)
+    ).all()
+    return [SongLyricCount(*row) for row in rows]
+
+
+def get_songs_with_lyrics(artist_id, embedding_model=None) -> List[Song]:
+    """An artist's songs with their lyrics (and embeddings) eagerly loaded.
+
+    Costs two queries regardless of catalog size: one for the songs and one
+    `SELECT ... WHERE song_id IN (...)` for all of their lyrics. With
+    `embedding_model`, `song.lyrics` only holds lyrics embedded by that model.
+    """
+    lyrics = Song.lyrics
+    if embedding_model is not None:
+        lyrics = lyrics.and_(Lyric.embedding_model == embedding_model)
+    return (
+        db.session.execute(
+            sa.select(Song)
+            .where(Song.artist_id == artist_id)
+            .options(selectinload(lyrics))
+            .execution_options(populate_existing=True)
+            .order_by(Song.id)
+        )
+        .scalars()
+        .all()
+    )
+
+
+def iter_lyric_embeddings(
+    artist_ids=None, batch_size=1000, embedding_model=None, after_id=None
+):
+    """Stream every stored lyric with its embedding and song/artist metadata.
+
+    A single joined query (optionally limited to some artists, to one embedding
+    model and to lyrics with an id above `after_id`), read in batches so the whole
+    catalog never has to be materialised as ORM objects.
+    """
+    query = (
+        sa.select(
+            Lyric.id,
+            Lyric.lyric,
+            Lyric.embeddings,
+            Song.title,
+            Song.url,
+            Artist.id.label("artist_id"),
+            Artist.name.label("artist_name"),
+        )
+        .join(Song, Lyric.song_id == Song.id)
+        .join(Artist, Song.artist_id == Artist.id)
+        .where(Lyric.embeddings.isnot(None), _lyric_model_filter(embedding_model))
+    )
+    if artist_ids is not None:
+        query = query.where(Artist.id.in_(artist_ids))
+    if after_id is not None:
+        query = query.where(Lyric.id > after_id)
+
+    result = db.session.execute(query.execution_options(yield_per=batch_size))
+    for partition in result.partitions():
+        yield from partition
+
+
+def latest_lyric_id(embedding_model=None):
+    """Id of the most recently stored embedded lyric, None if there are none"""
+    return db.session.execute(
+        sa.select(sa.func.max(Lyric.id)).where(
+            Lyric.embeddings.isnot(None), _lyric_model_filter(embedding_model)
+        )
+    ).scalar()
+
+
+def bulk_upsert_songs(artist_id, songs) -> List[int]:
+    """Insert Genius song dicts in one `INSERT ... ON CONFLICT DO NOTHING`.
+
+    Returns the ids of the songs that were actually new. Does not commit.
+    """
+    rows = {
+        song["id"]: {
+            "id": song["id"],
+            "title": song["title"],
+            "url": song["url"],
+            "artist_id": artist_id,
+        }
+        for song in songs
+    }
+    if not rows:
+        return []
+    result = db.session.execute(
+        pg_insert(Song)
+        .values(list(rows.values()))
+        .on_conflict_do_nothing(index_elements=[Song.id])
+        .returning(Song.id)
+    )
+    return list(result.scalars())
+
+
+def bulk_insert_lyrics(
+    song_id, bars, embeddings, embedder=DEFAULT_EMBEDDER
+) -> List[int]:
+    """Insert a song's bars and their embeddings in a single executemany,
+    recording which embedder produced them.
+
+    Returns the new lyric ids in the same order as `bars`. Does not commit.
+    """
+    if not bars:
+        return []
+    rows = [
+        {
+            "lyric": bar,
+            "order": order,
+            "song_id": song_id,
+            "embeddings": encode_embedding(embedding),
+            "embedding_model": embedder.name,
+            "embedding_dim": len(embedding),
+        }
+        for order, (bar, embedding) in enumerate(zip(bars, embeddings))
+    ]
+    result = db.session.execute(
+        sa.insert(Lyric).returning(Lyric.id, sort_by_parameter_order=True), rows
+    )
+    return list(result.scalars())
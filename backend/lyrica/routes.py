@@ -1,10 +1,14 @@
 import json
-import time
 
 from flask import Blueprint, Response, jsonify, request, stream_with_context
 
-from backend.extensions import create_logger
+from backend.extensions import create_logger, db
 from backend.lyrica import ArtistClient
+from backend.lyrica.jobs import get_events, start_fetch_job, tail_job_events
+from backend.lyrica.models import FetchJob
+from backend.lyrica.embedders import get_embedder
+from backend.lyrica.metrics import registry, timed
+from backend.lyrica.search_index import get_lyric_index
 
 logger = create_logger(__name__, level="DEBUG")
 
@@ -34,59 +38,114 @@ def search_artist(artist_name: str):
 
 @lyrica.route("get-top-lyrics", methods=["POST"])
 def get_top_lyrics():
+    """Stream top-lyric payloads while songs are fetched in a background job.
+
+    Pass the X-Lyrica-Job-Id response header's job and the number of payloads
+    already received as "after_seq" to resume after a disconnect.
+    """
     artist_id = request.json.get("artist_id")
+    after_seq = request.json.get("after_seq", 0)
 
     try:
-        artist = ArtistClient.ArtistClient(artist_id=artist_id)
+        job = start_fetch_job(artist_id)
     except Exception as e:
         logger.exception(e)
         return jsonify({"error": "Error pulling artist info"}), 500
 
-    N_SONG_TARGET = 10
+    job_id = job.id
+    db.session.close()
 
     def yield_lyrics():
-        top_lyrics = artist.get_top_lyrics()
-        if top_lyrics is None:
-            top_lyrics = []
+        for _, payload in tail_job_events(job_id, after_seq):
+            yield json.dumps(payload)
 
-        # find the number of songs related to this artist that have lyridcs
-        # artist is related to songs which is related to lyrics
+    return Response(
+        stream_with_context(yield_lyrics()), headers={"X-Lyrica-Job-Id": str(job_id)}
+    )
 
-        n_songs_with_lyrics = len(
-            [song for song in artist.artist.songs if len(song.lyrics) > 0]
-        )
 
-        out = json.dumps(
-            {
-                "n_songs": n_songs_with_lyrics,
-                "artist": artist.artist.name,
-                "top_lyrics": top_lyrics,
-            }
-        )
+@lyrica.route("/jobs/<int:job_id>", methods=["GET"])
+def get_job(job_id: int):
+    """Poll a fetch job: its status plus any payloads after ?after_seq="""
+    after_seq = request.args.get("after_seq", 0, type=int)
+
+    job = db.session.get(FetchJob, job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+
+    events = [
+        {"seq": event.seq, "payload": event.payload}
+        for event in get_events(job_id, after_seq)
+    ]
+    return jsonify({"job": job.to_dict(), "events": events}), 200
+
+
+@lyrica.route("/jobs/<int:job_id>/events", methods=["GET"])
+def stream_job_events(job_id: int):
+    """Server-sent events for a fetch job; reconnecting clients resume from the
+    Last-Event-ID header (or ?after_seq=)"""
+    after_seq = request.headers.get("Last-Event-ID", type=int)
+    if after_seq is None:
+        after_seq = request.args.get("after_seq", 0, type=int)
+
+    if db.session.get(FetchJob, job_id) is None:
+        return jsonify({"error": "Job not found"}), 404
+    db.session.close()
 
-        yield out
+    def yield_events():
+        for seq, payload in tail_job_events(job_id, after_seq):
+            event_id = f"id: {seq}\n" if seq is not None else ""
+            yield f"{event_id}data: {json.dumps(payload)}\n\n"
 
-        if len(artist.artist.songs) < N_SONG_TARGET:
-            logger.info(f"Getting more songs for {artist.artist.name}")
-            artist.get_songs(N_SONG_TARGET - len(artist.artist.songs))
+    return Response(stream_with_context(yield_events()), mimetype="text/event-stream")
 
-        for i in range(N_SONG_TARGET):
-            song = artist.artist.songs[i]
-            if len(song.lyrics) == 0:
-                logger.info(f"Getting lyrics for {song.title}")
-                artist.get_lyrics(song.id)
-                n_songs_with_lyrics += 1
 
-                out = json.dumps(
-                    {
-                        "n_songs": n_songs_with_lyrics,
-                        "artist": artist.artist.name,
-                        "top_lyrics": artist.get_top_lyrics(),
-                    }
-                )
+@lyrica.route("/search", methods=["GET"])
+def search_lyrics():
+    """Lyrics similar to a piece of text (?q=...) or a stored lyric (?lyric_id=...)
+    across every artist, optionally restricted with ?artist_id=1&artist_id=2.
+    ?model= picks the embedder whose index is searched (see embedders.EMBEDDERS)"""
+    text = request.args.get("q")
+    lyric_id = request.args.get("lyric_id", type=int)
+    k = request.args.get("k", 10, type=int)
+    artist_ids = request.args.getlist("artist_id", type=int) or None
+
+    if not text and lyric_id is None:
+        return jsonify({"error": "Either q or lyric_id must be provided"}), 400
+    if k < 1 or k > 100:
+        return jsonify({"error": "k must be between 1 and 100"}), 400
+
+    try:
+        embedder = get_embedder(request.args.get("model"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    lyric_index = get_lyric_index(embedder)
+
+    try:
+        if lyric_id is not None:
+            query_vector = lyric_index.get_embedding(lyric_id)
+            if query_vector is None:
+                return jsonify({"error": "Lyric not found"}), 404
+        else:
+            query_vector = ArtistClient.embed_text(text, embedder)
+    except Exception as e:
+        logger.exception(e)
+        return jsonify({"error": "Error building search query"}), 500
+
+    with timed("vector_search"):
+        results = lyric_index.search(
+            query_vector,
+            k=k,
+            artist_ids=artist_ids,
+            exclude_ids=[lyric_id] if lyric_id is not None else (),
+        )
 
-                time.sleep(2)
+    return jsonify({"results": results}), 200
 
-                yield out
 
-    return Response(stream_with_context(yield_lyrics()))
+@lyrica.route("/metrics", methods=["GET"])
+def metrics():
+    """Stage timings and counters in the Prometheus text format"""
+    return Response(
+        registry.render(), mimetype="text/plain; version=0.0.4; charset=utf-8"
+    )
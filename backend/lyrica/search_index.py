@@ -0,0 +1,232 @@
+"""
+Process-wide lyric index for similarity search across every stored artist.
+
+The index is sharded by artist: each artist gets its own vector DB, a query is run
+against every shard (or a chosen subset) and the per-shard top-k lists are merged.
+Shards are loaded from the database on first use and kept up to date by
+`ArtistClient.get_lyrics` through `add_lyric`, and by a periodic check for lyrics
+stored by other processes (see GlobalLyricIndex).
+
+Each index only holds vectors from one embedding model; `get_lyric_index` keeps one
+index per model.
+"""
+
+import heapq
+import threading
+import time
+
+from backend.extensions import create_logger
+from backend.lyrica.embedders import DEFAULT_EMBEDDER, get_embedder
+from backend.lyrica.embedding_format import decode_embedding
+from backend.lyrica.repository import iter_lyric_embeddings, latest_lyric_id
+from backend.lyrica.VectorDB import create_vector_db
+
+logger = create_logger(__name__, level="DEBUG")
+
+
+def lyric_metadata(text, song_title, song_url, artist_id=None, artist_name=None):
+    """Metadata stored next to each embedding in the vector DBs"""
+    return {
+        "song_name": song_title,
+        "song_url": song_url,
+        "text": text,
+        "artist_id": artist_id,
+        "artist_name": artist_name,
+    }
+
+
+class GlobalLyricIndex:
+    """Lyric vectors of every artist, one shard per artist
+
+    Shards use the "matrix" engine by default: an exact search costing one
+    matrix-vector product per shard. Pass engine="ivf" for approximate search on
+    very large catalogs.
+
+    The index lives in process memory, so every web worker holds its own copy.
+    Lyrics stored by this process are added as they are stored (add_lyric); those
+    stored by other processes are picked up by `refresh`, which a search runs at
+    most every `refresh_interval` seconds. It compares the newest lyric id in the
+    database against the newest one loaded, so it only catches new lyrics:
+    deleted or re-embedded lyrics stay until the next full `load`.
+    """
+
+    # seconds between checks for lyrics stored by other processes
+    REFRESH_INTERVAL = 30
+
+    def __init__(
+        self,
+        engine="matrix",
+        embedding_model=DEFAULT_EMBEDDER.name,
+        refresh_interval=REFRESH_INTERVAL,
+        **engine_kwargs,
+    ):
+        self.embedding_model = embedding_model
+        self.engine = engine
+        self.engine_kwargs = engine_kwargs
+        self.refresh_interval = refresh_interval
+        self.shards = {}
+        self.loaded = False
+        # newest lyric id loaded from the database, and when we last checked
+        self.max_lyric_id = 0
+        self._checked_at = 0.0
+        # guards the shards; loads and refreshes read the database outside it,
+        # serialised by _load_lock
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+
+    def _new_shard(self):
+        return create_vector_db({}, {}, engine=self.engine, **self.engine_kwargs)
+
+    def load(self, artist_ids=None):
+        """(Re)load shards from the database, for all artists or just `artist_ids`"""
+        shards = {}
+        n_lyrics = 0
+        max_lyric_id = 0
+        for row in iter_lyric_embeddings(
+            artist_ids, embedding_model=self.embedding_model
+        ):
+            if row.artist_id not in shards:
+                shards[row.artist_id] = self._new_shard()
+            # add straight to the store; the exact DB's add_item precomputes an
+            # O(n) distance row per insert, which would make loading quadratic
+            shard = shards[row.artist_id]
+            shard.internal_store[row.id] = decode_embedding(row.embeddings)
+            shard.metadata[row.id] = lyric_metadata(
+                row.lyric, row.title, row.url, row.artist_id, row.artist_name
+            )
+            n_lyrics += 1
+            max_lyric_id = max(max_lyric_id, row.id)
+
+        with self._lock:
+            if artist_ids is None:
+                self.shards = shards
+                self.loaded = True
+                self.max_lyric_id = max_lyric_id
+                self._checked_at = time.monotonic()
+            else:
+                for artist_id in artist_ids:
+                    self.shards[artist_id] = shards.get(artist_id, self._new_shard())
+        logger.info(
+            f"Loaded {n_lyrics} {self.embedding_model} lyrics "
+            f"into {len(shards)} artist shards"
+        )
+
+    def ensure_loaded(self):
+        if self.loaded:
+            return
+        with self._load_lock:
+            # another request may have loaded it while we waited
+            if not self.loaded:
+                self.load()
+
+    def refresh(self):
+        """Add the lyrics stored (by any process) since the index was loaded,
+        returns how many were added"""
+        with self._load_lock:
+            self._checked_at = time.monotonic()
+            latest = latest_lyric_id(self.embedding_model)
+            if latest is None or latest <= self.max_lyric_id:
+                return 0
+            rows = list(
+                iter_lyric_embeddings(
+                    embedding_model=self.embedding_model, after_id=self.max_lyric_id
+                )
+            )
+
+            n_added = 0
+            with self._lock:
+                for row in rows:
+                    if row.artist_id not in self.shards:
+                        self.shards[row.artist_id] = self._new_shard()
+                    shard = self.shards[row.artist_id]
+                    # lyrics stored by this process are already in
+                    if row.id not in shard.internal_store:
+                        shard.add_item(
+                            row.id,
+                            decode_embedding(row.embeddings),
+                            lyric_metadata(
+                                row.lyric,
+                                row.title,
+                                row.url,
+                                row.artist_id,
+                                row.artist_name,
+                            ),
+                        )
+                        n_added += 1
+                self.max_lyric_id = max([self.max_lyric_id, *(row.id for row in rows)])
+        if n_added:
+            logger.info(f"Added {n_added} {self.embedding_model} lyrics to the index")
+        return n_added
+
+    def _refresh_if_due(self):
+        if time.monotonic() - self._checked_at >= self.refresh_interval:
+            self.refresh()
+
+    def add_lyric(self, artist_id, lyric_id, embedding, metadata):
+        """Insert a newly stored lyric; a no-op until the index has been loaded"""
+        if not self.loaded:
+            return
+        with self._lock:
+            if artist_id not in self.shards:
+                self.shards[artist_id] = self._new_shard()
+            self.shards[artist_id].add_item(lyric_id, embedding, metadata)
+
+    def search(self, query_vector, k=10, artist_ids=None, exclude_ids=()):
+        """Top-k lyrics closest to `query_vector` across the selected shards.
+
+        Returns dicts shaped like VectorDB.get_top_lyrics results, nearest first.
+        """
+        self.ensure_loaded()
+        self._refresh_if_due()
+
+        exclude_ids = set(exclude_ids)
+        candidates = []
+        # shards rebuild their caches lazily, keep adds out while searching them
+        with self._lock:
+            for artist_id, shard in self.shards.items():
+                if artist_ids is not None and artist_id not in artist_ids:
+                    continue
+                for lyric_id, _, distance in shard.get_knn_byitem(
+                    query_vector, num_nbrs=k + len(exclude_ids)
+                ):
+                    if lyric_id not in exclude_ids:
+                        candidates.append(
+                            (distance, lyric_id, shard.metadata[lyric_id])
+                        )
+
+        return [
+            {
+                "lyric_id": lyric_id,
+                "lyric": metadata,
+                "distance": float(distance),
+            }
+            for distance, lyric_id, metadata in heapq.nsmallest(
+                k, candidates, key=lambda c: c[0]
+            )
+        ]
+
+    def get_embedding(self, lyric_id):
+        """Embedding of an indexed lyric, or None if it is not in any shard"""
+        self.ensure_loaded()
+        with self._lock:
+            for shard in self.shards.values():
+                if lyric_id in shard.internal_store:
+                    return shard.internal_store[lyric_id]
+        return None
+
+    def __len__(self):
+        with self._lock:
+            return sum(len(shard) for shard in self.shards.values())
+
+
+lyric_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_lyric_index(embedder=None) -> GlobalLyricIndex:
+    """The process-wide index for an embedder (name or Embedder, default if None)"""
+    name = get_embedder(embedder).name
+    with _indexes_lock:
+        if name not in lyric_indexes:
+            lyric_indexes[name] = GlobalLyricIndex(embedding_model=name)
+        return lyric_indexes[name]
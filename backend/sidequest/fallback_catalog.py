@@ -0,0 +1,75 @@
+"""
+Index of the curated fallback quests, built once at import
+
+Quests are filed by (category, difficulty, time bucket) and sorted by their
+pre-parsed upper time estimate, so picking the quests that fit a user's
+preferences is a few dict lookups and bisects instead of a scan of the whole
+catalog. That matters when the LLM is down and every board falls back.
+"""
+
+from bisect import bisect_right
+from collections import defaultdict
+from types import MappingProxyType
+from typing import Any, Dict, List, Mapping, Tuple
+
+from backend.sidequest.fallback_quests import fallback_quests
+from backend.sidequest.models import QuestTimeBucket
+
+CatalogKey = Tuple[str, str, QuestTimeBucket]
+# upper time estimates in ascending order, and the quests in the same order
+CatalogCell = Tuple[Tuple[int, ...], Tuple[Dict[str, Any], ...]]
+
+
+def parse_time_estimate(time_str: str) -> int:
+    """Parse time estimate string to minutes"""
+    try:
+        # Handle formats like "5-10 minutes", "3 minutes", "5-7 min"
+        time_str = time_str.lower().replace("minutes", "").replace("min", "").strip()
+        if "-" in time_str:
+            parts = time_str.split("-")
+            return int(parts[1])  # Use the higher estimate
+        else:
+            return int(time_str)
+    except (ValueError, IndexError):
+        return 15  # Default fallback
+
+
+def _build_index(
+    quests_by_category: Dict[str, List[Dict[str, Any]]],
+) -> Mapping[CatalogKey, CatalogCell]:
+    entries = defaultdict(list)
+    for category, quests in quests_by_category.items():
+        for quest in quests:
+            minutes = parse_time_estimate(quest["estimated_time"])
+            key = (category, quest["difficulty"], QuestTimeBucket.for_minutes(minutes))
+            entries[key].append((minutes, quest))
+
+    index = {}
+    for key, cell_entries in entries.items():
+        cell_entries.sort(key=lambda entry: entry[0])
+        index[key] = (
+            tuple(minutes for minutes, _ in cell_entries),
+            tuple(MappingProxyType(quest) for _, quest in cell_entries),
+        )
+    return MappingProxyType(index)
+
+
+FALLBACK_CATEGORIES = tuple(fallback_quests)
+FALLBACK_INDEX = _build_index(fallback_quests)
+
+
+def matching_quests(
+    category: str, difficulty: str, max_time: int
+) -> List[Mapping[str, Any]]:
+    """Catalog quests of a category and difficulty taking at most max_time
+    minutes"""
+    matches = []
+    # buckets go from shortest to longest
+    for time_bucket in QuestTimeBucket:
+        cell = FALLBACK_INDEX.get((category, difficulty, time_bucket))
+        if cell is not None:
+            minutes, quests = cell
+            matches.extend(quests[: bisect_right(minutes, max_time)])
+        if max_time <= time_bucket.max_minutes:
+            break
+    return matches
@@ -1,3 +1,4 @@
+import random
 from datetime import datetime, timedelta
 from enum import Enum
 
@@ -28,6 +29,26 @@ class QuestDifficulty(str, Enum):
     HARD = "hard"
 
 
+class QuestTimeBucket(str, Enum):
+    """How long a quest takes, by its upper time estimate"""
+
+    MICRO = "micro"  # up to 5 minutes
+    MEDIUM = "medium"  # up to 30 minutes
+    AMBITIOUS = "ambitious"  # longer
+
+    @classmethod
+    def for_minutes(cls, minutes: int) -> "QuestTimeBucket":
+        if minutes <= 5:
+            return cls.MICRO
+        if minutes <= 30:
+            return cls.MEDIUM
+        return cls.AMBITIOUS
+
+    @property
+    def max_minutes(self) -> int:
+        return {"micro": 5, "medium": 30, "ambitious": 120}[self.value]
+
+
 class QuestRating(str, Enum):
     """Quest feedback ratings"""
 
@@ -184,7 +205,21 @@ class SideQuestUser(db.Model):
 class UserQuest(db.Model):
     """Individual quest instances"""
 
-    __table_args__ = {"schema": "sidequest"}
+    __table_args__ = (
+        # the templates a user has already seen, for the anti-join in
+        # QuestService.get_potential_templates
+        db.Index(
+            "ix_sidequest_user_quests_user_template", "user_id", "quest_template_id"
+        ),
+        # the user's history by date, covering the per-day counts
+        db.Index(
+            "ix_sidequest_user_quests_user_created",
+            "user_id",
+            "created_at",
+            postgresql_include=["status"],
+        ),
+        {"schema": "sidequest"},
+    )
     __tablename__ = "sidequest_user_quests"
 
     id = db.Column(db.Integer, primary_key=True)
@@ -412,6 +447,94 @@ class QuestGenerationLog(db.Model):
         return humps.camelize(log_dict)
 
 
+def _camel_keys(*keys):
+    """Map snake_case keys to the camelCase ones in API responses, done once at
+    import rather than camelizing every response"""
+    return {key: humps.camelize(key) for key in keys}
+
+
+_BOARD_KEYS = _camel_keys(
+    "id",
+    "user_id",
+    "last_refreshed",
+    "is_active",
+    "created_at",
+    "updated_at",
+    "quests",
+)
+_QUEST_KEYS = _camel_keys(
+    "id",
+    "user_id",
+    "text",
+    "category",
+    "difficulty",
+    "tags",
+    "estimated_time",
+    "quest_board_id",
+    "quest_template_id",
+    "accepted_at",
+    "failed_at",
+    "abandoned_at",
+    "declined_at",
+    "status",
+    "completed_at",
+    "feedback",
+    "created_at",
+    "updated_at",
+    "owner_user_id",
+    "parent_template_id",
+    "rating",
+    "comment",
+    "time_spent",
+)
+
+
+def _isoformat(value):
+    return value.isoformat() if value else None
+
+
+def _enum_value(value):
+    return value.value if value else None
+
+
+def _serialize_board_quest(row):
+    """Serialize a row of _BOARD_QUEST_COLUMNS like UserQuest.to_dict"""
+    keys = _QUEST_KEYS
+    has_template = row.template_id is not None
+    quest_dict = {
+        keys["id"]: str(row.id),
+        keys["user_id"]: row.user_id,
+        keys["text"]: row.resolved_text or row.template_text,
+        keys["category"]: _enum_value(row.category),
+        keys["difficulty"]: _enum_value(row.difficulty),
+        keys["tags"]: (row.tags or []) if has_template else None,
+        keys["estimated_time"]: row.estimated_time,
+        keys["quest_board_id"]: row.quest_board_id,
+        keys["quest_template_id"]: row.quest_template_id,
+        keys["accepted_at"]: _isoformat(row.accepted_at),
+        keys["failed_at"]: _isoformat(row.failed_at),
+        keys["abandoned_at"]: _isoformat(row.abandoned_at),
+        keys["declined_at"]: _isoformat(row.declined_at),
+        keys["status"]: _enum_value(row.status),
+        keys["completed_at"]: _isoformat(row.completed_at),
+        keys["feedback"]: (
+            {
+                keys["rating"]: _enum_value(row.feedback_rating),
+                keys["comment"]: row.feedback_comment,
+                keys["time_spent"]: row.time_spent,
+            }
+            if row.feedback_rating or row.feedback_comment
+            else None
+        ),
+        keys["created_at"]: row.created_at.isoformat(),
+        keys["updated_at"]: row.updated_at.isoformat(),
+    }
+    if has_template:
+        quest_dict[keys["owner_user_id"]] = row.owner_user_id
+        quest_dict[keys["parent_template_id"]] = row.parent_template_id
+    return quest_dict
+
+
 class QuestBoard(db.Model):
     """Daily quest board for a user"""
 
@@ -446,36 +569,100 @@ class QuestBoard(db.Model):
     user = db.relationship("User", backref=db.backref("quest_boards", uselist=False))
     quests = db.relationship("UserQuest", backref="quest_board", lazy="dynamic")
 
-    def cleanup(self):
+    @staticmethod
+    def cleanup_boards(board_ids):
         """
-        Cleanup old quests.
+        Cleanup old quests on many boards at once. Does not commit.
+        Same transitions as UserQuest.cleanup, as two UPDATE statements:
+        every quest on the boards is taken off its board, potential ones are
+        declined and accepted ones failed.
+
+        The failed quests are not recorded in the user stats, go through
+        QuestService.cleanup_board(s), which does.
         """
-        quests = self.quests.all()
-        for quest in quests:
-            quest.cleanup()
-            # remove from the quest board
-            self.quests.remove(quest)
-        self.updated_at = datetime.utcnow()
-        db.session.commit()
+        board_ids = list(board_ids)
+        if not board_ids:
+            return
+
+        def status(value):
+            return db.literal(value, UserQuest.status.type)
+
+        db.session.execute(
+            db.update(UserQuest)
+            .where(UserQuest.quest_board_id.in_(board_ids))
+            .values(
+                status=db.case(
+                    (
+                        UserQuest.status == QuestStatus.POTENTIAL,
+                        status(QuestStatus.DECLINED),
+                    ),
+                    (
+                        UserQuest.status == QuestStatus.ACCEPTED,
+                        status(QuestStatus.FAILED),
+                    ),
+                    else_=UserQuest.status,
+                ),
+                quest_board_id=None,
+            )
+            .execution_options(synchronize_session="fetch")
+        )
+        db.session.execute(
+            db.update(QuestBoard)
+            .where(QuestBoard.id.in_(board_ids))
+            .values(updated_at=datetime.utcnow())
+            .execution_options(synchronize_session="fetch")
+        )
 
     def to_dict(self):
-        board_dict = {
-            "id": self.id,
-            "user_id": self.user_id,
-            "last_refreshed": self.last_refreshed.isoformat(),
-            "is_active": self.is_active,
-            "created_at": self.created_at.isoformat(),
-            "updated_at": self.updated_at.isoformat(),
-            "quests": [quest.to_dict() for quest in self.quests],
+        """
+        Same shape as camelizing the board with UserQuest.to_dict for every quest,
+        but the quests and their templates come from one joined query and are
+        serialized straight from the rows.
+        """
+        rows = db.session.execute(
+            db.select(*_BOARD_QUEST_COLUMNS)
+            .outerjoin(QuestTemplate, UserQuest.quest_template_id == QuestTemplate.id)
+            .where(UserQuest.quest_board_id == self.id)
+            .order_by(UserQuest.id)
+        ).all()
+
+        keys = _BOARD_KEYS
+        return {
+            keys["id"]: self.id,
+            keys["user_id"]: self.user_id,
+            keys["last_refreshed"]: self.last_refreshed.isoformat(),
+            keys["is_active"]: self.is_active,
+            keys["created_at"]: self.created_at.isoformat(),
+            keys["updated_at"]: self.updated_at.isoformat(),
+            keys["quests"]: [_serialize_board_quest(row) for row in rows],
         }
-        # Convert all keys to camelCase for the API response
-        return humps.camelize(board_dict)
 
 
 class QuestTemplate(db.Model):
     """Template for a quest"""
 
-    __table_args__ = {"schema": "sidequest"}
+    __table_args__ = (
+        db.Index(
+            "ix_sidequest_quest_templates_pool",
+            "category",
+            "difficulty",
+            "time_bucket",
+            postgresql_where=db.text("pooled"),
+        ),
+        db.Index(
+            "ix_sidequest_quest_templates_random_key",
+            "random_key",
+            postgresql_where=db.text("NOT pooled AND parent_template_id IS NULL"),
+        ),
+        db.Index(
+            "ix_sidequest_quest_templates_category_random_key",
+            "category",
+            "random_key",
+            postgresql_where=db.text("NOT pooled AND parent_template_id IS NULL"),
+        ),
+        db.Index("ix_sidequest_quest_templates_wilson_score", db.desc("wilson_score")),
+        {"schema": "sidequest"},
+    )
     __tablename__ = "sidequest_quest_templates"
 
     id = db.Column(db.Integer, primary_key=True)
@@ -486,15 +673,47 @@ class QuestTemplate(db.Model):
     estimated_time = db.Column(db.String(50), nullable=False)
 
     owner_user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=True)
+    # Set on generated near-duplicates stored as variants of an existing template
+    # before TemplateDedupService reused the template itself. Such variants only
+    # live on their user's board, they are left out of sampling and voting.
     parent_template_id = db.Column(
         db.Integer,
         db.ForeignKey("sidequest.sidequest_quest_templates.id"),
         nullable=True,
     )
+    # MinHash signature of the text (see utils.minhash), null until indexed
+    minhash = db.Column(JSON(none_as_null=True), nullable=True)
 
     model_used = db.Column(db.String(100), nullable=True)  # LLM model used
     fallback_used = db.Column(db.Boolean, nullable=False, default=False)
 
+    # Pre-generated templates waiting in the quest pool (see QuestPoolService).
+    # They are unowned until claimed for a user's board, unless reserved for a user.
+    pooled = db.Column(
+        db.Boolean, nullable=False, default=False, server_default=db.false()
+    )
+    time_bucket = db.Column(db.Enum(QuestTimeBucket), nullable=True)
+    estimated_minutes = db.Column(db.Integer, nullable=True)
+
+    # Uniform random sort key, lets us sample templates by seeking to a random
+    # point on an index instead of ORDER BY random() over the whole table
+    random_key = db.Column(
+        db.Float,
+        nullable=False,
+        default=random.random,
+        server_default=db.text("random()"),
+    )
+
+    # Vote counters, maintained by VotingService.submit_vote, and the lower bound
+    # of the Wilson score interval of the approval rate to rank templates by
+    thumbs_up_count = db.Column(
+        db.Integer, nullable=False, default=0, server_default="0"
+    )
+    thumbs_down_count = db.Column(
+        db.Integer, nullable=False, default=0, server_default="0"
+    )
+    wilson_score = db.Column(db.Float, nullable=False, default=0, server_default="0")
+
     created_at = db.Column(
         db.DateTime,
         nullable=False,
@@ -525,10 +744,85 @@ class QuestTemplate(db.Model):
         return humps.camelize(template_dict)
 
 
+# what QuestBoard.to_dict reads for each quest on the board
+_BOARD_QUEST_COLUMNS = (
+    UserQuest.id,
+    UserQuest.user_id,
+    UserQuest.resolved_text,
+    UserQuest.quest_board_id,
+    UserQuest.quest_template_id,
+    UserQuest.status,
+    UserQuest.accepted_at,
+    UserQuest.completed_at,
+    UserQuest.failed_at,
+    UserQuest.abandoned_at,
+    UserQuest.declined_at,
+    UserQuest.feedback_rating,
+    UserQuest.feedback_comment,
+    UserQuest.time_spent,
+    UserQuest.created_at,
+    UserQuest.updated_at,
+    QuestTemplate.id.label("template_id"),
+    QuestTemplate.text.label("template_text"),
+    QuestTemplate.category,
+    QuestTemplate.difficulty,
+    QuestTemplate.tags,
+    QuestTemplate.estimated_time,
+    QuestTemplate.owner_user_id,
+    QuestTemplate.parent_template_id,
+)
+
+
+def wilson_lower_bound(thumbs_up, thumbs_down, z=1.96):
+    """SQL expression for the lower bound of the Wilson score interval of
+    thumbs_up / (thumbs_up + thumbs_down), 0 without votes.
+
+    Uses the form (up + z²/2 - z·sqrt(up·down/n + z²/4)) / (n + z²), which needs
+    no special case for n = 0 beyond the division inside the square root.
+    """
+    thumbs_up = db.cast(thumbs_up, db.Float)
+    thumbs_down = db.cast(thumbs_down, db.Float)
+    n = thumbs_up + thumbs_down
+    return (
+        thumbs_up
+        + z * z / 2
+        - z
+        * db.func.sqrt(
+            db.func.coalesce(thumbs_up * thumbs_down / db.func.nullif(n, 0), 0)
+            + z * z / 4
+        )
+    ) / (n + z * z)
+
+
+class QuestTemplateBand(db.Model):
+    """LSH band bucket of a template's MinHash signature, templates sharing a
+    bucket are near-duplicate candidates (see TemplateDedupService)"""
+
+    __table_args__ = {"schema": "sidequest"}
+    __tablename__ = "sidequest_quest_template_bands"
+
+    band = db.Column(db.SmallInteger, primary_key=True)
+    bucket = db.Column(db.BigInteger, primary_key=True)
+    quest_template_id = db.Column(
+        db.Integer,
+        db.ForeignKey("sidequest.sidequest_quest_templates.id", ondelete="CASCADE"),
+        primary_key=True,
+    )
+
+
 class QuestTemplateVote(db.Model):
     """Vote on a quest template"""
 
-    __table_args__ = {"schema": "sidequest"}
+    __table_args__ = (
+        # the templates a user has voted on, for the anti-join in
+        # VotingService.get_quests_to_vote_on
+        db.Index(
+            "ix_sidequest_quest_template_votes_user_template",
+            "user_id",
+            "quest_template_id",
+        ),
+        {"schema": "sidequest"},
+    )
     __tablename__ = "sidequest_quest_template_votes"
 
     id = db.Column(db.Integer, primary_key=True)
@@ -559,3 +853,48 @@ class QuestTemplateVote(db.Model):
             "created_at": self.created_at.isoformat(),
         }
         return humps.camelize(vote_dict)
+
+
+class UserQuestStats(db.Model):
+    """Per-user quest history stats, kept up to date on every quest status change
+    (see UserStatsService) so reading them is a single row"""
+
+    __table_args__ = {"schema": "sidequest"}
+    __tablename__ = "sidequest_user_stats"
+
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), primary_key=True)
+
+    total_completed = db.Column(db.Integer, nullable=False, default=0)
+    # completed, failed and abandoned quests
+    total_accepted = db.Column(db.Integer, nullable=False, default=0)
+    # completed quests per category value and per tag
+    category_counts = db.Column(JSON, nullable=False, default=dict)
+    tag_counts = db.Column(JSON, nullable=False, default=dict)
+
+    # consecutive days with a completed quest, ending on last_completed_date
+    streak_length = db.Column(db.Integer, nullable=False, default=0)
+    last_completed_date = db.Column(db.Date, nullable=True)
+
+    # Timestamps
+    created_at = db.Column(
+        db.DateTime,
+        nullable=False,
+        default=datetime.utcnow,
+    )
+    updated_at = db.Column(
+        db.DateTime,
+        nullable=False,
+        default=datetime.utcnow,
+        onupdate=datetime.utcnow,
+    )
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        # counters are incremented before the first flush
+        for counter in ("total_completed", "total_accepted", "streak_length"):
+            if getattr(self, counter) is None:
+                setattr(self, counter, 0)
+        if self.category_counts is None:
+            self.category_counts = {}
+        if self.tag_counts is None:
+            self.tag_counts = {}
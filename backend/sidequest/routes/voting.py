@@ -17,13 +17,17 @@ def get_quests_to_vote_on():
     try:
         user_id = get_jwt_identity()
         limit = request.args.get("limit", 5, type=int)
+        # spread the quests evenly over the categories
+        stratify = request.args.get("stratify", "false").lower() == "true"
 
         # Validate limit
         if limit < 1 or limit > 20:
             return error_response("Limit must be between 1 and 20", 400)
 
         voting_service = VotingService(db.session)
-        quest_templates = voting_service.get_quests_to_vote_on(user_id, limit)
+        quest_templates = voting_service.get_quests_to_vote_on(
+            user_id, limit, stratify=stratify
+        )
 
         return success_response(
             {"quest_templates": [template.to_dict() for template in quest_templates]}
@@ -1,14 +1,22 @@
 from .quest_generation_service import QuestGenerationService
 from .quest_service import QuestService
+from .quest_pool_service import QuestPoolService
+from .board_refresh_service import BoardRefreshService
+from .template_dedup_service import TemplateDedupService
 from .user_service import UserService
 from .history_service import HistoryService
+from .user_stats_service import UserStatsService
 from .voting_service import VotingService
 
 
 __all__ = [
     "QuestGenerationService",
     "QuestService",
+    "QuestPoolService",
+    "BoardRefreshService",
+    "TemplateDedupService",
     "UserService",
     "HistoryService",
+    "UserStatsService",
     "VotingService",
 ]
@@ -0,0 +1,210 @@
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+from zoneinfo import ZoneInfo
+
+from sqlalchemy import exists, or_
+from sqlalchemy.orm import Session
+
+from backend.extensions import create_logger
+from backend.sidequest.models import QuestBoard, QuestStatus, SideQuestUser, UserQuest
+
+logger = create_logger(__name__)
+
+
+def _zone(name: str) -> ZoneInfo:
+    try:
+        return ZoneInfo(name)
+    except Exception:
+        return ZoneInfo("UTC")
+
+
+class BoardRefreshService:
+    """Service for the scheduled midnight board refresh
+
+    Boards refresh at midnight in the user's timezone. Left to the request path, the
+    first app open of the day pays for the cleanup and quest generation, so the
+    worker calls `refresh_due_boards` every few minutes instead.
+
+    Users are grouped into timezone buckets by the UTC instant of their local
+    midnight (every zone sharing an offset lands in the same bucket). The refresh
+    happens in two steps, so nothing on a board changes during the user's day:
+
+    - when a bucket's next midnight is less than LEAD_TIME away, the quests its
+      boards will need are generated and reserved in the quest pool
+      (`QuestService.reserve_board_quests`), the boards themselves are untouched
+    - once the midnight has passed, boards not refreshed since are cleaned up and
+      refilled from the reservations, and stamped with that midnight so
+      `QuestService.board_needs_refresh` treats them as the new day's board
+
+    Only boards of users active within ACTIVE_WITHIN are handled, dormant boards
+    refresh on the request path when their user comes back.
+    """
+
+    # how long before local midnight the quests get generated, keep it above the
+    # worker interval so no bucket is skipped
+    LEAD_TIME = timedelta(minutes=15)
+    # boards refreshed (and committed) together
+    BATCH_SIZE = 50
+    # users who haven't created a board or acted on a quest for this long are
+    # dormant, generating their boards every night would be wasted
+    ACTIVE_WITHIN = timedelta(days=7)
+    # statuses only the user moves a quest into; the scheduled cleanup declines
+    # and fails quests, and stamps last_refreshed, so neither counts as activity
+    ACTIVE_STATUSES = (
+        QuestStatus.ACCEPTED,
+        QuestStatus.COMPLETED,
+        QuestStatus.ABANDONED,
+    )
+
+    def __init__(self, db_session: Session, quest_service=None):
+        self.db = db_session
+        self._quest_service = quest_service
+
+    @property
+    def quest_service(self):
+        if self._quest_service is None:
+            from backend.sidequest.services.quest_service import QuestService
+
+            self._quest_service = QuestService(self.db)
+        return self._quest_service
+
+    @staticmethod
+    def next_midnight(timezone_name: str, now: datetime) -> datetime:
+        """The next local midnight in `timezone_name` after `now`, as aware UTC"""
+        local_now = now.astimezone(_zone(timezone_name))
+        midnight = datetime.combine(
+            local_now.date() + timedelta(days=1),
+            datetime.min.time(),
+            tzinfo=local_now.tzinfo,
+        )
+        return midnight.astimezone(timezone.utc)
+
+    @staticmethod
+    def last_midnight(timezone_name: str, now: datetime) -> datetime:
+        """The local midnight in `timezone_name` that started the day of `now`, as
+        aware UTC"""
+        local_now = now.astimezone(_zone(timezone_name))
+        midnight = datetime.combine(
+            local_now.date(), datetime.min.time(), tzinfo=local_now.tzinfo
+        )
+        return midnight.astimezone(timezone.utc)
+
+    def timezone_buckets(
+        self, now: Optional[datetime] = None, upcoming: bool = True
+    ) -> Dict[datetime, List[str]]:
+        """Timezones in use, grouped by the UTC instant of their next local midnight
+        (or, without `upcoming`, of the one that started their current day)"""
+        now = now or datetime.now(timezone.utc)
+        midnight_of = self.next_midnight if upcoming else self.last_midnight
+        buckets = defaultdict(list)
+        for (timezone_name,) in self.db.query(SideQuestUser.timezone).distinct():
+            buckets[midnight_of(timezone_name, now)].append(timezone_name)
+        return dict(buckets)
+
+    def due_buckets(
+        self, now: Optional[datetime] = None, lead_time: Optional[timedelta] = None
+    ) -> Dict[datetime, List[str]]:
+        """Buckets whose next midnight falls within the lead time"""
+        now = now or datetime.now(timezone.utc)
+        lead_time = lead_time if lead_time is not None else self.LEAD_TIME
+        return {
+            midnight: zones
+            for midnight, zones in self.timezone_buckets(now).items()
+            if midnight - now <= lead_time
+        }
+
+    def users_to_refresh(self, midnight: datetime, zones: List[str]) -> List[int]:
+        """Users in `zones` with an active board not yet refreshed for `midnight`,
+        who created the board or acted on a quest within ACTIVE_WITHIN
+
+        Users without a board have never opened the app, they are left to the
+        request path, as are dormant users.
+        """
+        # last_refreshed is stored as naive UTC
+        midnight_utc = midnight.astimezone(timezone.utc).replace(tzinfo=None)
+        active_since = midnight_utc - self.ACTIVE_WITHIN
+        acted = exists().where(
+            UserQuest.user_id == QuestBoard.user_id,
+            UserQuest.status.in_(self.ACTIVE_STATUSES),
+            UserQuest.updated_at >= active_since,
+        )
+        rows = (
+            self.db.query(QuestBoard.user_id)
+            .join(SideQuestUser, SideQuestUser.user_id == QuestBoard.user_id)
+            .filter(
+                SideQuestUser.timezone.in_(zones),
+                QuestBoard.is_active.is_(True),
+                QuestBoard.last_refreshed < midnight_utc,
+                or_(QuestBoard.created_at >= active_since, acted),
+            )
+            .all()
+        )
+        return [user_id for (user_id,) in rows]
+
+    def reserve_bucket(self, midnight: datetime, zones: List[str]) -> int:
+        """Generate the quests of every board a bucket will refresh at `midnight`,
+        returns the number of quests reserved
+
+        Boards are handled BATCH_SIZE at a time so their quests are generated
+        together; a failing batch is rolled back and retried next run.
+        """
+        user_ids = self.users_to_refresh(midnight, zones)
+        n_reserved = 0
+        for i in range(0, len(user_ids), self.BATCH_SIZE):
+            batch = user_ids[i : i + self.BATCH_SIZE]
+            try:
+                n_reserved += self.quest_service.reserve_board_quests(batch)
+            except Exception as e:
+                logger.exception(f"Reserving quests failed for users {batch}: {e}")
+                self.db.rollback()
+        return n_reserved
+
+    def refresh_bucket(self, midnight: datetime, zones: List[str]) -> int:
+        """Refresh every board of a bucket not refreshed since `midnight`, returns
+        the number refreshed
+
+        Boards are refreshed BATCH_SIZE at a time; a failing batch is rolled back
+        and retried next run.
+        """
+        midnight_utc = midnight.astimezone(timezone.utc).replace(tzinfo=None)
+        user_ids = self.users_to_refresh(midnight, zones)
+        n_refreshed = 0
+        for i in range(0, len(user_ids), self.BATCH_SIZE):
+            batch = user_ids[i : i + self.BATCH_SIZE]
+            try:
+                self.quest_service.refresh_boards(batch, refreshed_at=midnight_utc)
+                n_refreshed += len(batch)
+            except Exception as e:
+                logger.exception(f"Scheduled refresh failed for users {batch}: {e}")
+                self.db.rollback()
+        return n_refreshed
+
+    def refresh_due_boards(
+        self, now: Optional[datetime] = None, lead_time: Optional[timedelta] = None
+    ) -> int:
+        """Generate the quests of every bucket approaching midnight, and refresh the
+        boards of every bucket past it. Returns the number of boards refreshed.
+
+        Safe to call repeatedly: reservations are only topped up, and boards already
+        stamped with their bucket's midnight are skipped.
+        """
+        now = now or datetime.now(timezone.utc)
+        for midnight, zones in self.due_buckets(now, lead_time).items():
+            n_reserved = self.reserve_bucket(midnight, zones)
+            if n_reserved:
+                logger.info(
+                    f"Reserved {n_reserved} quests for midnight {midnight.isoformat()} "
+                    f"({', '.join(sorted(zones))})"
+                )
+
+        n_refreshed = 0
+        for midnight, zones in self.timezone_buckets(now, upcoming=False).items():
+            n_bucket = self.refresh_bucket(midnight, zones)
+            if n_bucket:
+                logger.info(
+                    f"Refreshed {n_bucket} boards for midnight {midnight.isoformat()} "
+                    f"({', '.join(sorted(zones))})"
+                )
+            n_refreshed += n_bucket
+        return n_refreshed
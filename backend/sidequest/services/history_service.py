@@ -1,15 +1,17 @@
-from datetime import datetime, timedelta
+from datetime import datetime, time, timedelta, timezone
 from typing import List, Dict, Any, Optional
 from sqlalchemy.orm import Session
 from sqlalchemy import func, desc
-from collections import Counter
+from zoneinfo import ZoneInfo
 
 from backend.sidequest.models import (
     QuestStatus,
     QuestCategory,
+    QuestTemplate,
     SideQuestUser,
     UserQuest,
 )
+from backend.sidequest.services.user_stats_service import UserStatsService
 from backend.extensions import create_logger
 
 logger = create_logger(__name__)
@@ -20,53 +22,24 @@ class HistoryService:
 
     def __init__(self, db_session: Session):
         self.db = db_session
+        self.user_stats_service = UserStatsService(db_session)
 
     def get_user_stats(self, user_id: int) -> Dict[str, Any]:
-        """Get comprehensive user statistics including streak, success rate, etc."""
-        logger.debug(f"Getting user stats for user {user_id}")
-
-        # Get all completed quests for the user
-        completed_quests = (
-            self.db.query(UserQuest)
-            .filter_by(user_id=user_id, status=QuestStatus.COMPLETED)
-            .all()
-        )
-
-        # Get all accepted quests (completed + failed/abandoned)
-        accepted_quests = (
-            self.db.query(UserQuest)
-            .filter(
-                UserQuest.user_id == user_id,
-                UserQuest.status.in_(
-                    [QuestStatus.COMPLETED, QuestStatus.FAILED, QuestStatus.ABANDONED]
-                ),
-            )
-            .all()
-        )
-
-        # Calculate streak
-        streak = self._calculate_streak(user_id)
-
-        # Calculate success rate
-        success_rate = self._calculate_success_rate(completed_quests, accepted_quests)
-
-        # Get most completed category
-        most_completed_category = self._get_most_completed_category(completed_quests)
+        """Get comprehensive user statistics including streak, success rate, etc.
 
-        # Get top tags
-        top_tags = self._get_top_tags(completed_quests)
-
-        return {
-            "streak": streak,
-            "success_rate": success_rate,
-            "most_completed_category": most_completed_category,
-            "top_tags": top_tags,
-            "total_completed": len(completed_quests),
-            "total_accepted": len(accepted_quests),
-        }
+        Read from the materialized stats row, see UserStatsService.
+        """
+        logger.debug(f"Getting user stats for user {user_id}")
+        stats = self.user_stats_service.get_stats(user_id)
+        return self.user_stats_service.stats_to_dict(stats)
 
     def get_7_day_history(self, user_id: int) -> List[Dict[str, Any]]:
-        """Get the last 7 days of quest history (excluding today)"""
+        """Get the last 7 days of quest history (excluding today)
+
+        Days are calendar days in the user's timezone. The per-day counts are a
+        GROUP BY on the local date, and the summaries a single join of the
+        quests with their templates, both over the (user_id, created_at) index.
+        """
         logger.debug(f"Getting 7-day history for user {user_id}")
 
         # Get user's timezone
@@ -74,159 +47,81 @@ class HistoryService:
         if not user_profile:
             logger.warning(f"No user profile found for user {user_id}")
             return []
+        try:
+            user_tz = ZoneInfo(user_profile.timezone)
+        except Exception:
+            logger.warning(
+                f"Invalid timezone '{user_profile.timezone}' for user {user_id}, falling back to UTC"
+            )
+            user_tz = ZoneInfo("UTC")
 
-        # Calculate date range (last 7 days, excluding today)
-        end_date = datetime.utcnow().date()
+        # Calculate date range (last 7 days, excluding today), as naive UTC bounds
+        end_date = datetime.now(user_tz).date()
         start_date = end_date - timedelta(days=7)
+        start_utc, end_utc = (
+            datetime.combine(day, time.min, tzinfo=user_tz)
+            .astimezone(timezone.utc)
+            .replace(tzinfo=None)
+            for day in (start_date, end_date)
+        )
 
-        # Get all quests from the last 7 days
-        quests = (
-            self.db.query(UserQuest)
-            .filter(
-                UserQuest.user_id == user_id,
-                func.date(UserQuest.created_at) >= start_date,
-                func.date(UserQuest.created_at) < end_date,
-            )
-            .order_by(desc(UserQuest.created_at))
-            .all()
+        # created_at is naive UTC, shift it to the user's wall clock
+        local_date = func.date(
+            func.timezone(user_tz.key, func.timezone("UTC", UserQuest.created_at))
+        ).label("local_date")
+        in_range = (
+            UserQuest.user_id == user_id,
+            UserQuest.created_at >= start_utc,
+            UserQuest.created_at < end_utc,
         )
 
-        # Group quests by date
+        day_counts = {
+            day: (completed_count, total_count)
+            for day, completed_count, total_count in self.db.query(
+                local_date,
+                func.count().filter(UserQuest.status == QuestStatus.COMPLETED),
+                func.count(),
+            )
+            .filter(*in_range)
+            .group_by(local_date)
+        }
+
         quests_by_date = {}
-        for quest in quests:
-            quest_date = quest.created_at.date()
-            if quest_date not in quests_by_date:
-                quests_by_date[quest_date] = []
-            quests_by_date[quest_date].append(quest)
+        for row in (
+            self.db.query(
+                local_date,
+                UserQuest.id,
+                UserQuest.status,
+                func.coalesce(UserQuest.resolved_text, QuestTemplate.text),
+                QuestTemplate.category,
+            )
+            .outerjoin(QuestTemplate, UserQuest.quest_template_id == QuestTemplate.id)
+            .filter(*in_range)
+            .order_by(desc(UserQuest.created_at))
+        ):
+            day, quest_id, status, text, category = row
+            quests_by_date.setdefault(day, []).append(
+                {
+                    "id": str(quest_id),
+                    "text": text,
+                    "category": category.value if category else None,
+                    "completed": status == QuestStatus.COMPLETED,
+                    "skipped": status in [QuestStatus.DECLINED, QuestStatus.ABANDONED],
+                }
+            )
 
         # Build history data
         history = []
         for i in range(7):
             date = end_date - timedelta(days=i + 1)  # Exclude today
-            day_quests = quests_by_date.get(date, [])
-
-            # Calculate day stats
-            completed_count = len(
-                [q for q in day_quests if q.status == QuestStatus.COMPLETED]
-            )
-            total_count = len(day_quests)
-
-            # Create concise quest summaries
-            quest_summaries = []
-            for quest in day_quests:
-                quest_summaries.append(
-                    {
-                        "id": str(quest.id),
-                        "text": quest.text,
-                        "category": quest.category.value if quest.category else None,
-                        "completed": quest.status == QuestStatus.COMPLETED,
-                        "skipped": quest.status
-                        in [QuestStatus.DECLINED, QuestStatus.ABANDONED],
-                    }
-                )
-
+            completed_count, total_count = day_counts.get(date, (0, 0))
             history.append(
                 {
                     "date": date.isoformat(),
-                    "quests": quest_summaries,
+                    "quests": quests_by_date.get(date, []),
                     "completed_count": completed_count,
                     "total_count": total_count,
                 }
             )
 
         return history
-
-    def _calculate_streak(self, user_id: int) -> int:
-        """Calculate the current streak of consecutive days with completed quests"""
-        logger.debug(f"Calculating streak for user {user_id}")
-
-        # Get all completed quests ordered by completion date
-        completed_quests = (
-            self.db.query(UserQuest)
-            .filter_by(user_id=user_id, status=QuestStatus.COMPLETED)
-            .filter(UserQuest.completed_at.isnot(None))
-            .order_by(desc(UserQuest.completed_at))
-            .all()
-        )
-
-        if not completed_quests:
-            return 0
-
-        # Get unique completion dates
-        completion_dates = set()
-        for quest in completed_quests:
-            if quest.completed_at:
-                completion_dates.add(quest.completed_at.date())
-
-        # Sort dates in descending order
-        sorted_dates = sorted(completion_dates, reverse=True)
-
-        # Calculate streak
-        streak = 0
-        current_date = datetime.utcnow().date()
-
-        for i, completion_date in enumerate(sorted_dates):
-            if i == 0:
-                # Check if the most recent completion was today or yesterday
-                if (
-                    completion_date == current_date
-                    or completion_date == current_date - timedelta(days=1)
-                ):
-                    streak = 1
-                    current_date = completion_date
-                else:
-                    break
-            else:
-                # Check if this completion was the day after the previous one
-                if completion_date == current_date - timedelta(days=1):
-                    streak += 1
-                    current_date = completion_date
-                else:
-                    break
-
-        return streak
-
-    def _calculate_success_rate(
-        self, completed_quests: List[UserQuest], accepted_quests: List[UserQuest]
-    ) -> float:
-        """Calculate the success rate (percentage of accepted quests that were completed)"""
-        if not accepted_quests:
-            return 0.0
-
-        return round((len(completed_quests) / len(accepted_quests)) * 100, 1)
-
-    def _get_most_completed_category(
-        self, completed_quests: List[UserQuest]
-    ) -> Optional[str]:
-        """Get the category with the most completed quests"""
-        if not completed_quests:
-            return None
-
-        category_counts = Counter()
-        for quest in completed_quests:
-            if quest.category:
-                category_counts[quest.category.value] += 1
-
-        if category_counts:
-            return category_counts.most_common(1)[0][0]
-        return None
-
-    def _get_top_tags(
-        self, completed_quests: List[UserQuest], limit: int = 5
-    ) -> List[Dict[str, Any]]:
-        """Get the top tags from completed quests"""
-        if not completed_quests:
-            return []
-
-        tag_counts = Counter()
-        for quest in completed_quests:
-            if quest.tags:
-                for tag in quest.tags:
-                    tag_counts[tag] += 1
-
-        # Return top tags with counts
-        top_tags = []
-        for tag, count in tag_counts.most_common(limit):
-            top_tags.append({"tag": tag, "count": count})
-
-        return top_tags
@@ -1,15 +1,24 @@
 import json
 import random
 import time
-from typing import Any, Dict, List, Optional
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Dict, List, Optional, Tuple
 from datetime import datetime
 
 from sqlalchemy.orm import Session
 
 from backend.config import Config
 from backend.extensions import create_logger
+from backend.sidequest.fallback_catalog import (
+    FALLBACK_CATEGORIES,
+    matching_quests,
+    parse_time_estimate,
+)
 from backend.sidequest.fallback_quests import fallback_quests
 from backend.sidequest.good_quests import GOOD_QUESTS
+from backend.sidequest.utils.circuit_breaker import CircuitBreaker, CircuitOpenError
+from backend.sidequest.utils.hedging import LatencyWindow, hedged_call
 
 from backend.sidequest.models import (
     QuestCategory,
@@ -20,6 +29,59 @@ import logging
 
 logger = logging.getLogger(__name__)
 
+# shared by the single-user and batch prompts
+QUEST_DESIGN_GUIDE = """\
+## Design Guide
+
+### Core Principles
+
+- **Concrete & specific**: no ambiguity; directly executable.
+- **Memorable effort**: feels like a mini-adventure/test.
+- **Focused learning**: targeted, fun, meaningful
+- **Guided creativity**: provide constraints, not freeform.
+- **Assignment over choice**: model decides specifics.
+
+### Avoid
+
+- Vague/shallow (“notice the air”).
+- Trivial chores (“wash 5 dishes”).
+- Open-ended choice (“practice a skill of your choice”).
+- Contrived roleplay (“invent a superhero name”).
+- Fitness busywork (“10 lunges in hallway”).
+- Low-impact media (“listen to a random song”).
+- Sky prompts without action (“notice the moon”).
+
+### Anti-Mode-Collapse Rules
+
+1. **Mix of time scales per batch**
+   - Micro (1–5 min): ~30%
+   - Medium (10–30 min): ~50%
+   - Ambitious (1+ hr / multi-step): ~20% 
+2. **Category coverage**  
+   Cover most of: fitness, social, mindfulness, chores (quest-framed), hobbies, outdoors, learning, creativity.  
+   Do not over-index on fitness/micro-mindfulness.
+3. **Boundary-pushing quota**  
+   ≥20% should feel unusual, adventurous, or experimental.
+4. **One Item per Quest**
+   Each quest should be a single idea. Do not ask the user to do one thing and then another after that.
+6. **Assignment over choice**  
+   Always assign specifics (ex. if you mention the user to research a topic, you must provide the topic).
+7. **No repeated skeletons**  
+   Avoid duplicate structures in a batch.
+8. **Fun and variety are key**
+   Try to make your quests different from the examples. They must be actually fun for a human to do.
+
+"""
+
+
+# shared by every QuestGenerationService of the process
+quest_llm_breaker = CircuitBreaker(
+    "quest generation",
+    failure_threshold=Config.QUEST_GENERATION_BREAKER_FAILURES,
+    reset_timeout=Config.QUEST_GENERATION_BREAKER_RESET_SECONDS,
+)
+quest_llm_latency = LatencyWindow()
+
 
 class QuestGenerationService:
     """Service for generating personalized quests using LLM or fallback system"""
@@ -87,8 +149,8 @@ class QuestGenerationService:
             quests = self._generate_with_llm(
                 preferences, context, user_string, n_quests
             )
-            # Try LLM generation first
-            model_used = self.model
+            # Try LLM generation first, the hedge model may have answered
+            model_used = quests[0]["model_used"] if quests else self.model
             fallback_used = False
 
             if quests:
@@ -119,25 +181,157 @@ class QuestGenerationService:
 
         generation_time_ms = int((time.time() - start_time) * 1000)
 
-        # Ensure datetime objects are serialized before storing in JSON columns
-        serialized_preferences = self._serialize_datetime_objects(preferences)
-        serialized_context = (
-            self._serialize_datetime_objects(context) if context else None
-        )
         if user_id is not None:
-            log_entry = QuestGenerationLog(
-                user_id=user_id,
-                request_preferences=serialized_preferences,
-                context_data=serialized_context,
+            self._log_generation(
+                user_id,
+                preferences,
+                context,
                 quests_generated=len(quest_data),
                 model_used=model_used,
                 fallback_used=fallback_used,
                 generation_time_ms=generation_time_ms,
                 tokens_used=tokens_used,
             )
-            self.db.add(log_entry)
         return quest_data
 
+    def generate_batch_quest_template_data(
+        self, requests: Dict[int, Tuple[Dict[str, Any], int]]
+    ) -> Dict[int, List[Dict[str, Any]]]:
+        """Generate quests for many users at once (the scheduled board refresh)
+
+        `requests` maps user_id to (preferences, n_quests). Users are packed
+        QUEST_GENERATION_BATCH_SIZE to a prompt and at most
+        QUEST_GENERATION_MAX_PARALLEL prompts run at a time. Users the LLM skipped
+        or whose batch failed get fallback quests. Logs one QuestGenerationLog per
+        user, all sharing the batch's generation time.
+        """
+        start_time = time.time()
+
+        # everything that touches the db is gathered up front, the worker threads
+        # only talk to the LLM
+        profiles = {
+            user_id: {
+                "preferences": preferences,
+                "context": self.generate_context(user_id),
+                "user_string": self.generate_user_string(user_id),
+                "n_quests": n_quests,
+            }
+            for user_id, (preferences, n_quests) in requests.items()
+            if n_quests > 0
+        }
+        if not profiles:
+            return {}
+
+        user_ids = list(profiles)
+        batch_size = Config.QUEST_GENERATION_BATCH_SIZE
+        batches = [
+            {user_id: profiles[user_id] for user_id in user_ids[i : i + batch_size]}
+            for i in range(0, len(user_ids), batch_size)
+        ]
+
+        generated = {}
+        max_workers = min(len(batches), Config.QUEST_GENERATION_MAX_PARALLEL)
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [
+                executor.submit(self._generate_batch_with_llm, batch)
+                for batch in batches
+            ]
+            for future in futures:
+                try:
+                    generated.update(future.result())
+                except Exception as e:
+                    logger.warning(f"Batch quest generation failed: {str(e)}")
+
+        generation_time_ms = int((time.time() - start_time) * 1000)
+
+        quest_data = {}
+        for user_id, profile in profiles.items():
+            quests = generated.get(user_id)
+            if quests:
+                model_used, fallback_used = self.model, False
+            else:
+                logger.warning(
+                    f"Batch generation returned no quests for user {user_id}. Using fallback."
+                )
+                quests = self._generate_fallback_quests(
+                    profile["preferences"], profile["n_quests"]
+                )
+                model_used, fallback_used = None, True
+
+            quest_data[user_id] = [
+                {**quest, "model_used": model_used, "fallback_used": fallback_used}
+                for quest in quests
+            ]
+            self._log_generation(
+                user_id,
+                profile["preferences"],
+                profile["context"],
+                quests_generated=len(quests),
+                model_used=model_used,
+                fallback_used=fallback_used,
+                generation_time_ms=generation_time_ms,
+            )
+
+        logger.info(
+            f"Generated quests for {len(profiles)} users in {len(batches)} batches "
+            f"({generation_time_ms}ms)"
+        )
+        return quest_data
+
+    def _log_generation(
+        self,
+        user_id: int,
+        preferences: Dict[str, Any],
+        context: Optional[Dict[str, Any]],
+        quests_generated: int,
+        model_used: Optional[str],
+        fallback_used: bool,
+        generation_time_ms: int,
+        tokens_used: Optional[int] = None,
+    ):
+        # Ensure datetime objects are serialized before storing in JSON columns
+        serialized_preferences = self._serialize_datetime_objects(preferences)
+        serialized_context = (
+            self._serialize_datetime_objects(context) if context else None
+        )
+        log_entry = QuestGenerationLog(
+            user_id=user_id,
+            request_preferences=serialized_preferences,
+            context_data=serialized_context,
+            quests_generated=quests_generated,
+            model_used=model_used,
+            fallback_used=fallback_used,
+            generation_time_ms=generation_time_ms,
+            tokens_used=tokens_used,
+        )
+        self.db.add(log_entry)
+
+    def generate_pool_quest_data(
+        self,
+        category: str,
+        difficulty: str,
+        max_time: int,
+        n_quests: int = 3,
+    ) -> List[Dict[str, Any]]:
+        """Generate quests for the shared quest pool rather than a specific user.
+
+        There is no user context and no fallback: if the LLM fails the pool simply
+        isn't topped up this round.
+        """
+        preferences = {
+            "categories": [category],
+            "difficulty": difficulty,
+            "max_time": max_time,
+        }
+        # the prompt has no difficulty field, so ask for it explicitly
+        user_string = f"All quests should be {difficulty} difficulty."
+        quests = self._generate_with_llm(
+            preferences, user_string=user_string, n_quests=n_quests
+        )
+        for quest in quests:
+            quest["fallback_used"] = False
+        return quests
+
     def _generate_with_llm(
         self,
         preferences: Dict[str, Any],
@@ -151,36 +345,124 @@ class QuestGenerationService:
         )
 
         try:
-            content = self.client.chat(
-                messages=[
-                    {
-                        "role": "system",
-                        "content": "You are a creative quest generator for SideQuest, an app that provides personalized daily challenges. Generate fun, achievable quests that match user preferences. Always keep a quest to a single idea.",
-                    },
-                    {"role": "user", "content": prompt},
-                ],
-                temperature=0.8,
+            quests_data, model_used = self._request_quests(
+                prompt,
                 max_tokens=1000,
-                response_format={"type": "json_object"},
+                deadline=Config.QUEST_GENERATION_DEADLINE_SECONDS,
+                hedge_model=Config.QUEST_GENERATION_HEDGE_MODEL,
             )
-            try:
-                quests_data = json.loads(content)
-            except json.JSONDecodeError:
-                logger.exception(f"Invalid JSON response: {content}")
-                logger.error(f"Content: {content}")
-                raise Exception("Invalid JSON response from LLM")
 
             # Validate and format the response
             quests = []
             for quest in quests_data.get("quests", []):
                 if self._validate_quest_data(quest):
-                    quests.append(quest)
+                    quests.append({**quest, "model_used": model_used})
             return quests[:n_quests]  # Ensure we only return n_quests quests
 
+        except CircuitOpenError:
+            raise
+        except Exception as e:
+            logger.error(f"OpenAI API call failed: {str(e)}")
+            raise
+
+    def _generate_batch_with_llm(
+        self, profiles: Dict[int, Dict[str, Any]]
+    ) -> Dict[int, List[Dict[str, Any]]]:
+        """Generate quests for several users with one LLM request"""
+        # the prompt refers to users by label, not by id
+        labels = {f"user_{i}": user_id for i, user_id in enumerate(profiles, 1)}
+        prompt = self._build_batch_quest_generation_prompt(
+            {label: profiles[user_id] for label, user_id in labels.items()}
+        )
+        max_tokens = 1000 * len(labels)
+
+        try:
+            # no deadline, this runs in the worker
+            quests_data, _ = self._request_quests(prompt, max_tokens=max_tokens)
+        except CircuitOpenError:
+            raise
         except Exception as e:
             logger.error(f"OpenAI API call failed: {str(e)}")
             raise
 
+        quests_by_user = {}
+        for entry in quests_data.get("users", []):
+            user_id = labels.get(entry.get("user"))
+            if user_id is None:
+                continue
+            quests = [
+                quest
+                for quest in entry.get("quests", [])
+                if self._validate_quest_data(quest)
+            ]
+            quests_by_user[user_id] = quests[: profiles[user_id]["n_quests"]]
+        return quests_by_user
+
+    def _request_quests(
+        self,
+        prompt: str,
+        max_tokens: int,
+        deadline: Optional[float] = None,
+        hedge_model: Optional[str] = None,
+    ) -> Tuple[Dict[str, Any], str]:
+        """Send a quest generation prompt and parse the JSON response
+
+        Goes through the circuit breaker shared by the process, so while the LLM
+        keeps failing this raises CircuitOpenError right away. With a hedge model,
+        a request running past the QUEST_GENERATION_HEDGE_PERCENTILE latency is
+        raced against the same prompt on the hedge model. Gives up with a
+        TimeoutError after `deadline` seconds.
+
+        Returns the response and the model that wrote it.
+        """
+        messages = [
+            {
+                "role": "system",
+                "content": "You are a creative quest generator for SideQuest, an app that provides personalized daily challenges. Generate fun, achievable quests that match user preferences. Always keep a quest to a single idea.",
+            },
+            {"role": "user", "content": prompt},
+        ]
+        # abandoned requests must not outlive the deadline
+        timeout = {"timeout": deadline} if deadline is not None else {}
+
+        def request(model: str) -> Dict[str, Any]:
+            started = time.monotonic()
+            content = self.client.chat(
+                messages=messages,
+                model=model,
+                temperature=0.8,
+                max_tokens=max_tokens,
+                response_format={"type": "json_object"},
+                **timeout,
+            )
+            try:
+                quests_data = json.loads(content)
+            except json.JSONDecodeError:
+                logger.exception(f"Invalid JSON response: {content}")
+                logger.error(f"Content: {content}")
+                raise Exception("Invalid JSON response from LLM")
+            if hedge_model and model == self.model:
+                quest_llm_latency.record(time.monotonic() - started)
+            return quests_data
+
+        hedge, hedge_after = None, None
+        if hedge_model:
+            hedge = partial(request, hedge_model)
+            hedge_after = quest_llm_latency.percentile(
+                Config.QUEST_GENERATION_HEDGE_PERCENTILE
+            )
+
+        quests_data, hedged = quest_llm_breaker.call(
+            hedged_call,
+            partial(request, self.model),
+            hedge=hedge,
+            hedge_after=hedge_after,
+            deadline=deadline,
+        )
+        if hedged:
+            logger.info(f"Quest generation answered by hedge model {hedge_model}")
+        return quests_data, hedge_model if hedged else self.model
+
     def _build_quest_generation_prompt(
         self,
         preferences: Dict[str, Any],
@@ -224,47 +506,7 @@ Context at time of generation:
 Here are some examples of quests that users have liked:
 {', '.join(examples)}
 
-## Design Guide
-
-### Core Principles
-
-- **Concrete & specific**: no ambiguity; directly executable.
-- **Memorable effort**: feels like a mini-adventure/test.
-- **Focused learning**: targeted, fun, meaningful
-- **Guided creativity**: provide constraints, not freeform.
-- **Assignment over choice**: model decides specifics.
-
-### Avoid
-
-- Vague/shallow (“notice the air”).
-- Trivial chores (“wash 5 dishes”).
-- Open-ended choice (“practice a skill of your choice”).
-- Contrived roleplay (“invent a superhero name”).
-- Fitness busywork (“10 lunges in hallway”).
-- Low-impact media (“listen to a random song”).
-- Sky prompts without action (“notice the moon”).
-
-### Anti-Mode-Collapse Rules
-
-1. **Mix of time scales per batch**
-   - Micro (1–5 min): ~30%
-   - Medium (10–30 min): ~50%
-   - Ambitious (1+ hr / multi-step): ~20% 
-2. **Category coverage**  
-   Cover most of: fitness, social, mindfulness, chores (quest-framed), hobbies, outdoors, learning, creativity.  
-   Do not over-index on fitness/micro-mindfulness.
-3. **Boundary-pushing quota**  
-   ≥20% should feel unusual, adventurous, or experimental.
-4. **One Item per Quest**
-   Each quest should be a single idea. Do not ask the user to do one thing and then another after that.
-6. **Assignment over choice**  
-   Always assign specifics (ex. if you mention the user to research a topic, you must provide the topic).
-7. **No repeated skeletons**  
-   Avoid duplicate structures in a batch.
-8. **Fun and variety are key**
-   Try to make your quests different from the examples. They must be actually fun for a human to do.
-
-### JSON Output Format
+{QUEST_DESIGN_GUIDE}### JSON Output Format
 
 Return a JSON object with exactly this structure:
 
@@ -289,6 +531,67 @@ Return a JSON object with exactly this structure:
 - Each quest should be achievable within {max_time} minutes
 - Add relevant tags for categorization
 
+Generate quests now.
+"""
+
+    def _build_batch_quest_generation_prompt(
+        self, profiles: Dict[str, Dict[str, Any]]
+    ) -> str:
+        """Build one prompt covering several users, keyed by their labels"""
+        examples = random.sample(GOOD_QUESTS, min(len(GOOD_QUESTS), 4))
+
+        user_sections = []
+        for label, profile in profiles.items():
+            preferences = profile["preferences"]
+            context_str = ""
+            if profile["context"]:
+                context = self._serialize_datetime_objects(profile["context"])
+                context_str = json.dumps(context)
+            user_sections.append(f"""
+### {label}
+
+- Quests needed: {profile["n_quests"]}
+- Categories: {', '.join(preferences.get("categories", []))}
+- Each quest should be achievable within {preferences.get("max_time", 15)} minutes
+- Additional information about the user: {profile["user_string"] or ""}
+- Context at time of generation: {context_str}
+""")
+
+        return f"""
+You are SideQuest’s quest designer. Generate personalized daily quests for each of the {len(profiles)} users below. Treat every user separately: their quests must only use their own categories, notes and context.
+
+Questions Should:
+- Feel like meaningful side adventures - concrete, specific, and effortful
+- Quests can be mundane *if* they are productive, positive, and meaningful (for example a specific and tailored chore)
+- The majority of quests though should bring novelty, reflection, or discovery into the user’s day.
+
+## Users
+{''.join(user_sections)}
+Here are some examples of quests that users have liked:
+{', '.join(examples)}
+
+{QUEST_DESIGN_GUIDE}### JSON Output Format
+
+Return a JSON object with exactly this structure, with one entry per user:
+
+{{
+  "users": [
+    {{
+      "user": "{next(iter(profiles))}",
+      "quests": [
+        {{
+          "text": "Quest description",
+          "category": "fitness|social|mindfulness|chores|hobbies|outdoors|learning|creativity",
+          "estimated_time": "X-Y minutes",
+          "difficulty": "easy|medium|hard",
+          "ambitious": true|false,
+          "tags": ["tag1", "tag2", "tag3"]
+        }}
+      ]
+    }}
+  ]
+}}
+
 Generate quests now.
 """
 
@@ -326,61 +629,39 @@ Generate quests now.
     def _generate_fallback_quests(
         self, preferences: Dict[str, Any], n_quests: int = 3
     ) -> List[Dict[str, Any]]:
-        """Generate quests using fallback system when LLM is unavailable"""
-        categories = preferences.get("categories", list(self.fallback_quests.keys()))
+        """Generate quests using fallback system when LLM is unavailable
+
+        Quests are read off the prebuilt catalog index (see fallback_catalog).
+        """
+        categories = preferences.get("categories", FALLBACK_CATEGORIES)
         difficulty = preferences.get("difficulty", "medium")
         max_time = preferences.get("max_time", 15)
 
         # Filter fallback quests by user preferences
+        preferred_categories = set(categories)
         available_quests = []
-        for category in categories:
-            if category in self.fallback_quests:
-                category_quests = self.fallback_quests[category]
-                # Filter by difficulty and time constraints
-                filtered_quests = [
-                    q
-                    for q in category_quests
-                    if q["difficulty"] == difficulty
-                    and self._parse_time_estimate(q["estimated_time"]) <= max_time
-                ]
-                available_quests.extend(filtered_quests)
+        for category in preferred_categories:
+            available_quests.extend(matching_quests(category, difficulty, max_time))
 
         # If we don't have enough quests, add some from other categories
-        if len(available_quests) < n_quests:
-            all_quests = []
-            for quests in self.fallback_quests.values():
-                all_quests.extend(quests)
-
-            # Add quests that match difficulty and time constraints
-            for quest in all_quests:
-                if (
-                    quest["difficulty"] == difficulty
-                    and self._parse_time_estimate(quest["estimated_time"]) <= max_time
-                    and quest not in available_quests
-                ):
-                    available_quests.append(quest)
-                    if len(available_quests) >= n_quests:
-                        break
-
-        # Randomly select n_quests quests
-        selected_quests = random.sample(
-            available_quests, min(n_quests, len(available_quests))
-        )
+        for category in FALLBACK_CATEGORIES:
+            if len(available_quests) >= n_quests:
+                break
+            if category not in preferred_categories:
+                quests = matching_quests(category, difficulty, max_time)
+                available_quests.extend(quests[: n_quests - len(available_quests)])
+
+        # Randomly select n_quests quests, as copies, callers annotate them
+        selected_quests = [
+            dict(quest)
+            for quest in random.sample(
+                available_quests, min(n_quests, len(available_quests))
+            )
+        ]
         logger.info(f"Generated {len(selected_quests)} fallback quests")
 
         return selected_quests
 
     def _parse_time_estimate(self, time_str: str) -> int:
         """Parse time estimate string to minutes"""
-        try:
-            # Handle formats like "5-10 minutes", "3 minutes", "5-7 min"
-            time_str = (
-                time_str.lower().replace("minutes", "").replace("min", "").strip()
-            )
-            if "-" in time_str:
-                parts = time_str.split("-")
-                return int(parts[1])  # Use the higher estimate
-            else:
-                return int(time_str)
-        except (ValueError, IndexError):
-            return 15  # Default fallback
+        return parse_time_estimate(time_str)
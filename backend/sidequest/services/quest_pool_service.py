@@ -0,0 +1,247 @@
+from itertools import product
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import and_, func, or_
+from sqlalchemy.orm import Session
+
+from backend.extensions import create_logger
+from backend.sidequest.models import (
+    QuestCategory,
+    QuestDifficulty,
+    QuestTemplate,
+    QuestTimeBucket,
+    SideQuestUser,
+)
+from backend.sidequest.services.template_dedup_service import TemplateDedupService
+from backend.sidequest.utils.minhash import minhash_signature
+
+logger = create_logger(__name__)
+
+PoolCell = Tuple[QuestCategory, QuestDifficulty, QuestTimeBucket]
+
+
+class QuestPoolService:
+    """Service for the pool of pre-generated quest templates
+
+    Generating quests with the LLM while the user waits for their board is slow, so
+    a worker keeps a stock of validated templates for every
+    (category, difficulty, time bucket) cell. Populating a board claims templates
+    from the pool with plain DB reads, and only falls back to live generation when
+    the matching cells are empty.
+
+    Pooled templates are unowned and flagged `pooled`; claiming one hands it to the
+    user (owner_user_id) and takes it out of the pool, so no template is ever
+    served from the pool twice.
+
+    A pooled template can also be reserved for a user (pooled with an owner): the
+    scheduled refresh generates the quests a board is missing ahead of time and
+    parks them there. Only their owner claims them, before any shared stock.
+    """
+
+    # templates to keep in stock per cell, and the level below which we refill
+    TARGET_PER_CELL = 4
+    LOW_WATER_MARK = 2
+    # quests requested from the LLM in one call
+    MAX_QUESTS_PER_REQUEST = 5
+
+    def __init__(self, db_session: Session, quest_generation_service=None):
+        self.db = db_session
+        self._quest_generation_service = quest_generation_service
+        self.template_dedup_service = TemplateDedupService(db_session)
+
+    @property
+    def quest_generation_service(self):
+        # the generation service builds an LLM client, only do that when refilling
+        if self._quest_generation_service is None:
+            from backend.sidequest.services.quest_generation_service import (
+                QuestGenerationService,
+            )
+
+            self._quest_generation_service = QuestGenerationService(self.db)
+        return self._quest_generation_service
+
+    @staticmethod
+    def all_cells() -> List[PoolCell]:
+        return list(product(QuestCategory, QuestDifficulty, QuestTimeBucket))
+
+    def stock_levels(self) -> Dict[PoolCell, int]:
+        """Number of pooled templates in every cell (empty cells included)"""
+        levels = {cell: 0 for cell in self.all_cells()}
+        rows = (
+            self.db.query(
+                QuestTemplate.category,
+                QuestTemplate.difficulty,
+                QuestTemplate.time_bucket,
+                func.count(QuestTemplate.id),
+            )
+            .filter(QuestTemplate.pooled, QuestTemplate.owner_user_id.is_(None))
+            .group_by(
+                QuestTemplate.category,
+                QuestTemplate.difficulty,
+                QuestTemplate.time_bucket,
+            )
+            .all()
+        )
+        for category, difficulty, time_bucket, count in rows:
+            levels[(category, difficulty, time_bucket)] = count
+        return levels
+
+    def cells_needing_refill(self) -> Dict[PoolCell, int]:
+        """Cells below the low water mark, with how many templates they are missing"""
+        return {
+            cell: self.TARGET_PER_CELL - count
+            for cell, count in self.stock_levels().items()
+            if count < self.LOW_WATER_MARK
+        }
+
+    def add_to_pool(
+        self,
+        quest_data: Dict,
+        owner_user_id: Optional[int] = None,
+        cell: Optional[PoolCell] = None,
+    ) -> Optional[QuestTemplate]:
+        """Store validated quest data as a pooled template, filed under `cell` if
+        given, otherwise under its own category, difficulty and time estimate. With
+        owner_user_id, the template is reserved for that user.
+
+        Near-duplicates of existing templates are dropped, returns None for those.
+        """
+        signature = minhash_signature(quest_data["text"])
+        duplicate = self.template_dedup_service.find_duplicate(
+            quest_data["text"], signature
+        )
+        if duplicate is not None:
+            logger.info(
+                f"Dropping pool quest '{quest_data['text']}', a near-duplicate of "
+                f"template {duplicate.id}"
+            )
+            return None
+
+        estimated_minutes = self.quest_generation_service._parse_time_estimate(
+            quest_data["estimated_time"]
+        )
+        if cell is None:
+            cell = (
+                QuestCategory(quest_data["category"]),
+                QuestDifficulty(quest_data["difficulty"]),
+                QuestTimeBucket.for_minutes(estimated_minutes),
+            )
+        category, difficulty, time_bucket = cell
+        template = QuestTemplate(
+            text=quest_data["text"],
+            category=category,
+            difficulty=difficulty,
+            estimated_time=quest_data["estimated_time"],
+            tags=quest_data.get("tags") or [],
+            model_used=quest_data.get("model_used"),
+            fallback_used=quest_data.get("fallback_used", False),
+            owner_user_id=owner_user_id,
+            pooled=True,
+            time_bucket=time_bucket,
+            estimated_minutes=estimated_minutes,
+        )
+        self.template_dedup_service.index(template, signature)
+        return template
+
+    def refill(self, cells: Optional[Iterable[PoolCell]] = None) -> int:
+        """Top up every cell below the low water mark (or just `cells`).
+
+        Quests are filed under the cell they were generated for, whichever bucket
+        their own estimate falls in, so every refill counts towards the cell that
+        asked for it (claims filter on estimated_minutes, not the bucket).
+        Commits after each cell so a failing LLM call only loses that cell.
+        Returns the number of templates added.
+        """
+        deficits = self.cells_needing_refill()
+        if cells is not None:
+            deficits = {cell: deficits[cell] for cell in cells if cell in deficits}
+
+        n_added = 0
+        for cell, deficit in deficits.items():
+            category, difficulty, time_bucket = cell
+            try:
+                quests = self.quest_generation_service.generate_pool_quest_data(
+                    category=category.value,
+                    difficulty=difficulty.value,
+                    max_time=time_bucket.max_minutes,
+                    n_quests=min(deficit, self.MAX_QUESTS_PER_REQUEST),
+                )
+            except Exception as e:
+                logger.warning(
+                    f"Refilling quest pool cell {category.value}/{difficulty.value}/"
+                    f"{time_bucket.value} failed: {e}"
+                )
+                self.db.rollback()
+                continue
+
+            templates = [
+                self.add_to_pool(quest_data, cell=cell) for quest_data in quests
+            ]
+            self.db.commit()
+            n_added += sum(template is not None for template in templates)
+
+        logger.info(f"Added {n_added} templates to the quest pool")
+        return n_added
+
+    def claim_templates(
+        self, user_id: int, profile: SideQuestUser, n_templates: int
+    ) -> List[QuestTemplate]:
+        """Take up to n_templates pooled templates matching the user's preferences
+        and assign them to the user, the ones reserved for them first. Does not
+        commit.
+
+        Rows are locked with SKIP LOCKED so concurrent board refreshes never
+        claim the same template.
+        """
+        if n_templates <= 0:
+            return []
+
+        templates = (
+            self._available_templates(user_id, profile)
+            # reserved templates (owned) sort first
+            .order_by(QuestTemplate.owner_user_id.is_(None), func.random())
+            .limit(n_templates)
+            .with_for_update(skip_locked=True)
+            .all()
+        )
+        for template in templates:
+            template.pooled = False
+            template.owner_user_id = user_id
+        self.db.flush()
+
+        logger.info(f"Claimed {len(templates)} pooled templates for user {user_id}")
+        return templates
+
+    def count_available(self, user_id: int, profile: SideQuestUser) -> int:
+        """Number of pooled templates claim_templates could hand the user"""
+        return self._available_templates(user_id, profile).count()
+
+    def _available_templates(self, user_id: int, profile: SideQuestUser):
+        """Pooled templates reserved for the user, or shared ones matching their
+        preferences"""
+        matches_preferences = [QuestTemplate.owner_user_id.is_(None)]
+        if profile.categories:
+            matches_preferences.append(
+                QuestTemplate.category.in_(
+                    [QuestCategory(category) for category in profile.categories]
+                )
+            )
+        if profile.difficulty:
+            matches_preferences.append(QuestTemplate.difficulty == profile.difficulty)
+        if profile.max_time:
+            matches_preferences.append(
+                QuestTemplate.estimated_minutes <= profile.max_time
+            )
+
+        # a bare `pooled`, not `pooled IS true`, so the planner can match the
+        # partial pool index
+        return self.db.query(QuestTemplate).filter(
+            QuestTemplate.pooled,
+            or_(
+                QuestTemplate.owner_user_id == user_id,
+                and_(*matches_preferences),
+            ),
+        )
+
+    def needs_refill(self) -> bool:
+        return bool(self.cells_needing_refill())
@@ -1,6 +1,8 @@
+import math
+from dataclasses import dataclass
 from datetime import datetime, timedelta
-from typing import List, Optional, Dict, Any
-from sqlalchemy import or_
+from typing import List, Optional, Dict, Any, Tuple
+from sqlalchemy import exists, func, or_
 from sqlalchemy.orm import Session
 from zoneinfo import ZoneInfo
 
@@ -12,13 +14,36 @@ from backend.sidequest.models import (
     SideQuestUser,
 )
 from backend.sidequest.services.quest_generation_service import QuestGenerationService
+from backend.sidequest.services.quest_pool_service import QuestPoolService
+from backend.sidequest.services.template_dedup_service import TemplateDedupService
 from backend.sidequest.services.user_service import UserService
+from backend.sidequest.services.user_stats_service import UserStatsService
+from backend.sidequest.services.voting_service import VotingService
+from backend.sidequest.utils.sampling import sample_by_random_key
+from backend.sidequest.worker import request_pool_refill
 from backend.extensions import create_logger
 
-
 logger = create_logger(__name__)
 
 
+@dataclass
+class _BoardFill:
+    """Templates picked to top up one board, and how many quests are still missing"""
+
+    user_id: int
+    quest_board: QuestBoard
+    preferences: Dict[str, Any]
+    new_templates: List[QuestTemplate]
+    existing_templates: List[QuestTemplate]
+    n_to_generate: int
+
+    @property
+    def template_ids(self) -> List[int]:
+        return [
+            template.id for template in self.new_templates + self.existing_templates
+        ]
+
+
 class QuestService:
     """Service for managing quest interactions and quest board operations
 
@@ -36,10 +61,22 @@ class QuestService:
 
     """
 
+    # potential quests on a full board
+    BOARD_SIZE = 3
+    # share of the existing templates on a board that are picked by rating, the
+    # rest are sampled at random so unrated templates get shown (and voted on) too
+    RATED_TEMPLATE_SHARE = 0.5
+
     def __init__(self, db_session: Session):
         self.db = db_session
         self.quest_generation_service = QuestGenerationService(db_session)
+        self.quest_pool_service = QuestPoolService(
+            db_session, self.quest_generation_service
+        )
         self.user_service = UserService(db_session)
+        self.user_stats_service = UserStatsService(db_session)
+        self.template_dedup_service = TemplateDedupService(db_session)
+        self.voting_service = VotingService(db_session, self.quest_generation_service)
 
     def board_needs_refresh(self, user_id: int) -> bool:
         """Check if the quest board needs to be refreshed
@@ -91,10 +128,10 @@ class QuestService:
         current_day = datetime.now(user_tz).replace(
             hour=0, minute=0, second=0, microsecond=0
         )
-        last_refreshed_day = last_refreshed_tz.replace(
+        # convert before truncating, truncating the UTC time would use the UTC day
+        last_refreshed_day = last_refreshed_tz.astimezone(user_tz).replace(
             hour=0, minute=0, second=0, microsecond=0
         )
-        last_refreshed_day = last_refreshed_day.replace(tzinfo=user_tz)
 
         needs_refresh = last_refreshed_day < current_day
         logger.debug(
@@ -104,16 +141,151 @@ class QuestService:
 
     def cleanup_board(self, user_id: int):
         """Cleanup the quest board for a user"""
-        quest_board = self.db.query(QuestBoard).filter_by(user_id=user_id).first()
-        if not quest_board:
+        self.cleanup_boards([user_id])
+        self.db.commit()
+
+    def cleanup_boards(self, user_ids: List[int]):
+        """Cleanup the quest boards of many users in one pass. Does not commit."""
+        board_ids = [
+            board_id
+            for (board_id,) in self.db.query(QuestBoard.id).filter(
+                QuestBoard.user_id.in_(user_ids)
+            )
+        ]
+        if not board_ids:
             return
 
-        quest_board.cleanup()
+        # accepted quests are failed by the cleanup, which counts towards the stats
+        failed_counts = dict(
+            self.db.query(UserQuest.user_id, func.count())
+            .filter(
+                UserQuest.quest_board_id.in_(board_ids),
+                UserQuest.status == QuestStatus.ACCEPTED,
+            )
+            .group_by(UserQuest.user_id)
+            .all()
+        )
+        QuestBoard.cleanup_boards(board_ids)
+        self.user_stats_service.record_failed(failed_counts)
 
     def populate_board(self, user_id: int):
         """Populate the quest board for a user with new quests"""
         logger.info(f"Populating quest board with new quests for user {user_id}")
 
+        fill = self._plan_board_fill(user_id)
+        if fill is None:
+            return
+
+        if fill.n_to_generate > 0 or self.quest_pool_service.needs_refill():
+            request_pool_refill()
+
+        if fill.n_to_generate > 0:
+            new_quest_data = self.quest_generation_service.generate_quest_template_data(
+                user_id=user_id,
+                preferences=fill.preferences,
+                n_quests=fill.n_to_generate,
+            )
+            self._add_generated_templates(fill, new_quest_data)
+        self._fill_shortfall_from_existing(fill)
+
+        self._fill_board(fill)
+        self.db.commit()
+
+        return True
+
+    def populate_boards(self, user_ids: List[int]) -> int:
+        """Populate many quest boards at once
+
+        Same as populate_board for every user, except that the quests missing after
+        the pool and existing templates are generated in one batch, and everything is
+        committed together. Returns the number of boards that got new quests.
+        """
+        n_filled = self._populate_boards(user_ids, generate=True)
+        self.db.commit()
+        return n_filled
+
+    def _populate_boards(self, user_ids: List[int], generate: bool) -> int:
+        """populate_boards without the commit. Without `generate`, quests that
+        would have to be generated are taken from the existing templates instead."""
+        fills = [
+            fill
+            for fill in (self._plan_board_fill(user_id) for user_id in user_ids)
+            if fill is not None
+        ]
+        if not fills:
+            return 0
+
+        requests = {
+            fill.user_id: (fill.preferences, fill.n_to_generate)
+            for fill in fills
+            if fill.n_to_generate > 0
+        }
+        if requests or self.quest_pool_service.needs_refill():
+            request_pool_refill()
+
+        if requests and generate:
+            generated = (
+                self.quest_generation_service.generate_batch_quest_template_data(
+                    requests
+                )
+            )
+            for fill in fills:
+                self._add_generated_templates(fill, generated.get(fill.user_id, []))
+
+        for fill in fills:
+            self._fill_shortfall_from_existing(fill)
+            self._fill_board(fill)
+
+        return len(fills)
+
+    def reserve_board_quests(self, user_ids: List[int]) -> int:
+        """Generate the quests that refreshing these boards would leave missing,
+        and reserve them in the quest pool for their users. Commits.
+
+        A refreshed board is empty, so it needs BOARD_SIZE quests; whatever the
+        user's share of existing templates and the pool can't cover is generated in
+        one batch. The pool count is an estimate (other boards can claim the shared
+        stock first), a shortfall is made up from existing templates on refresh.
+        Returns the number of quests reserved.
+        """
+        n_new, n_existing = self._split_quests_needed(self.BOARD_SIZE)
+        requests = {}
+        for user_id in user_ids:
+            profile = self.user_service.get_or_create_user_profile(user_id)
+            n_missing = (
+                n_new
+                + n_existing
+                - len(self.get_potential_templates(user_id, n_existing))
+                - self.quest_pool_service.count_available(user_id, profile)
+            )
+            if n_missing > 0:
+                requests[user_id] = (profile.to_dict(), n_missing)
+        # end the read transaction, nothing is held open while the LLM runs
+        self.db.commit()
+        if not requests:
+            return 0
+
+        generated = self.quest_generation_service.generate_batch_quest_template_data(
+            requests
+        )
+        reserved = [
+            self.quest_pool_service.add_to_pool(quest_data, owner_user_id=user_id)
+            for user_id, user_quests in generated.items()
+            for quest_data in user_quests
+        ]
+        self.db.commit()
+
+        n_reserved = sum(template is not None for template in reserved)
+        logger.info(f"Reserved {n_reserved} quests for {len(requests)} boards")
+        return n_reserved
+
+    def _plan_board_fill(self, user_id: int) -> Optional[_BoardFill]:
+        """Work out how a board gets topped up, claiming pool and existing templates
+
+        Returns None if the board is already full. Quests that still have to be
+        generated are only counted (n_to_generate), so callers can generate them one
+        user at a time or in a batch.
+        """
         quest_board = self.get_or_create_board(user_id)
 
         if not quest_board:
@@ -134,16 +306,18 @@ class QuestService:
             if quest.status == QuestStatus.POTENTIAL
         ]
 
-        n_quests_needed = 3 - len(potential_quests)
+        n_quests_needed = self.BOARD_SIZE - len(potential_quests)
 
         if n_quests_needed <= 0:
             logger.info(f"No quests needed for user {user_id}, returning")
-            return
+            return None
         logger.info(f"User {user_id} needs {n_quests_needed} quests")
 
         """
         We have 2 sources of quests:
         - Creating a new quest template for the user and assigning it to them
+          (claimed from the pre-generated quest pool, generated live only if the pool
+          has nothing matching)
         - grabbing an existing quest template from the db and assigning it to the user
         
         If user only needs 1 quest:
@@ -153,61 +327,143 @@ class QuestService:
         And then half of all remaining templates are split between new and existing (if existing are available)
         """
 
-        if n_quests_needed == 1:
-            n_new_quests_needed = 1
-            n_existing_quests_needed = 0
-        else:
-            n_new_quests_needed = n_quests_needed // 2
-            n_existing_quests_needed = n_quests_needed - n_new_quests_needed
+        n_new_quests_needed, n_existing_quests_needed = self._split_quests_needed(
+            n_quests_needed
+        )
 
-        templates_for_user = []
+        new_templates = []
         if n_new_quests_needed > 0:
-            new_quest_data = self.quest_generation_service.generate_quest_template_data(
-                user_id=user_id,
-                preferences=preferences,
-                n_quests=n_new_quests_needed,
+            pooled_templates = self.quest_pool_service.claim_templates(
+                user_id, profile, n_new_quests_needed
+            )
+            new_templates.extend(pooled_templates)
+            n_new_quests_needed -= len(pooled_templates)
+
+        existing_templates = []
+        if n_existing_quests_needed > 0:
+            existing_templates = self.get_potential_templates(
+                user_id,
+                n_existing_quests_needed,
+                exclude_ids=[template.id for template in new_templates],
             )
-            for quest_data in new_quest_data:
-                logger.info(f"Generating new quest for user {user_id}")
-                template = QuestTemplate(
-                    text=quest_data.get("text"),
-                    category=quest_data.get("category"),
-                    estimated_time=quest_data.get("estimated_time"),
-                    difficulty=quest_data.get("difficulty"),
-                    tags=quest_data.get("tags"),
-                    model_used=quest_data.get("model_used"),
-                    fallback_used=quest_data.get("fallback_used"),
-                    owner_user_id=user_id,
+            # the pool can make up for a shortage of existing templates too
+            existing_templates.extend(
+                self.quest_pool_service.claim_templates(
+                    user_id,
+                    profile,
+                    n_existing_quests_needed - len(existing_templates),
                 )
-                self.db.add(template)
-                self.db.flush()  # Get the template ID
+            )
 
-                templates_for_user.append(template)
+        return _BoardFill(
+            user_id=user_id,
+            quest_board=quest_board,
+            preferences=preferences,
+            new_templates=new_templates,
+            existing_templates=existing_templates,
+            n_to_generate=n_new_quests_needed,
+        )
 
-        if n_existing_quests_needed > 0:
-            potential_templates = self.get_potential_templates(
-                user_id, n_existing_quests_needed
+    @staticmethod
+    def _split_quests_needed(n_quests_needed: int) -> Tuple[int, int]:
+        """How many of the quests a board needs are new and how many existing"""
+        if n_quests_needed == 1:
+            return 1, 0
+        n_new_quests_needed = n_quests_needed // 2
+        return n_new_quests_needed, n_quests_needed - n_new_quests_needed
+
+    def _add_generated_templates(
+        self, fill: _BoardFill, new_quest_data: List[Dict[str, Any]]
+    ):
+        """Add freshly generated quests to a fill, counting them off n_to_generate"""
+        templates = self._create_generated_templates(
+            fill.user_id, new_quest_data, exclude_ids=fill.template_ids
+        )
+        fill.new_templates.extend(templates)
+        fill.n_to_generate -= len(templates)
+
+    def _fill_shortfall_from_existing(self, fill: _BoardFill):
+        """Make up for quests that were not generated with existing templates"""
+        if fill.n_to_generate > 0:
+            fill.existing_templates.extend(
+                self.get_potential_templates(
+                    fill.user_id, fill.n_to_generate, exclude_ids=fill.template_ids
+                )
             )
-            templates_for_user.extend(potential_templates)
+            fill.n_to_generate = 0
+
+    def _create_generated_templates(
+        self,
+        user_id: int,
+        new_quest_data: List[Dict[str, Any]],
+        exclude_ids: List[int] = (),
+    ) -> List[QuestTemplate]:
+        """Store freshly generated quests as templates owned by the user
 
+        A near-duplicate of an existing template is not stored, that template is
+        handed out instead (see TemplateDedupService), unless the user can't get it:
+        it is in the pool, owned by someone else, already shown to the user, or in
+        `exclude_ids`. Such quests are dropped.
+        """
+        templates = []
+        for quest_data in new_quest_data:
+            logger.info(f"Generating new quest for user {user_id}")
+            template = QuestTemplate(
+                text=quest_data.get("text"),
+                category=quest_data.get("category"),
+                estimated_time=quest_data.get("estimated_time"),
+                difficulty=quest_data.get("difficulty"),
+                tags=quest_data.get("tags"),
+                model_used=quest_data.get("model_used"),
+                fallback_used=quest_data.get("fallback_used"),
+                owner_user_id=user_id,
+            )
+            canonical = self.template_dedup_service.add_template(template)
+            if canonical is not template and not self._can_reuse_template(
+                user_id,
+                canonical,
+                list(exclude_ids) + [chosen.id for chosen in templates],
+            ):
+                logger.info(
+                    f"Dropping generated quest, template {canonical.id} can't be "
+                    f"handed to user {user_id}"
+                )
+                continue
+            templates.append(canonical)
+        self.db.flush()  # Get the template IDs
+        return templates
+
+    def _can_reuse_template(
+        self, user_id: int, template: QuestTemplate, exclude_ids: List[int]
+    ) -> bool:
+        """Whether an existing template can go on the user's board"""
+        if template.pooled or template.id in exclude_ids:
+            return False
+        if template.owner_user_id not in (None, user_id):
+            return False
+        seen = exists().where(
+            UserQuest.user_id == user_id,
+            UserQuest.quest_template_id == template.id,
+        )
+        return not self.db.query(seen).scalar()
+
+    def _fill_board(self, fill: _BoardFill):
+        """Add the planned templates to the board as potential quests. Does not commit."""
+        templates_for_user = fill.new_templates + fill.existing_templates
         for template in templates_for_user:
-            logger.info(f"Adding new quest to user {user_id}")
+            logger.info(f"Adding new quest to user {fill.user_id}")
             quest = UserQuest(
-                user_id=user_id,
+                user_id=fill.user_id,
                 quest_template_id=template.id,
-                quest_board_id=quest_board.id,
+                quest_board_id=fill.quest_board.id,
                 resolved_text=template.text,
             )
 
             self.db.add(quest)
 
-        user_profile = self.user_service.get_or_create_user_profile(user_id)
+        user_profile = self.user_service.get_or_create_user_profile(fill.user_id)
         user_profile.last_quest_generation = datetime.utcnow()
 
-        self.db.commit()
-
-        return True
-
     def refresh_board(self, user_id: int):
         """Refresh the quest board for a user"""
         logger.info(f"Refreshing quest board for user {user_id}")
@@ -218,6 +474,27 @@ class QuestService:
         self.db.commit()
         return quest_board
 
+    def refresh_boards(self, user_ids: List[int], refreshed_at: datetime):
+        """Refresh many quest boards at once, stamping them with refreshed_at
+
+        Used by the midnight scheduler, which passes the local midnight that just
+        passed (naive UTC), so the board counts as that day's board.
+
+        The quests the boards will be missing are generated and reserved first
+        (reserve_board_quests). Cleanup, fill and the refreshed_at stamp then run
+        in one short transaction that never waits on the LLM, and a failed
+        generation can't roll back a cleanup.
+        """
+        self.reserve_board_quests(user_ids)
+
+        logger.info(f"Refreshing {len(user_ids)} quest boards")
+        self.cleanup_boards(user_ids)
+        self._populate_boards(user_ids, generate=False)
+        self.db.query(QuestBoard).filter(QuestBoard.user_id.in_(user_ids)).update(
+            {QuestBoard.last_refreshed: refreshed_at}, synchronize_session=False
+        )
+        self.db.commit()
+
     def top_up_or_refresh_board(self, user_id: int):
         """Top up the quest board for a user or refresh it if it needs to be refreshed"""
         if self.board_needs_refresh(user_id):
@@ -256,7 +533,9 @@ class QuestService:
         quest = self.db.query(UserQuest).filter_by(id=quest_id).first()
         if not quest:
             raise ValueError(f"Quest {quest_id} not found")
+        old_status = quest.status
         quest.cleanup()
+        self.user_stats_service.record_transition(quest, old_status)
         self.db.commit()
         return quest
 
@@ -274,6 +553,7 @@ class QuestService:
         quest = self.get_quest(quest_id)
         if not quest:
             return None
+        old_status = quest.status
 
         status_map = {
             "accepted": quest.accept,
@@ -295,6 +575,7 @@ class QuestService:
         else:
             raise ValueError(f"Invalid status '{status}' provided.")
 
+        self.user_stats_service.record_transition(quest, old_status)
         self.db.commit()
         return quest
 
@@ -311,31 +592,51 @@ class QuestService:
         return True
 
     def get_potential_templates(
-        self, user_id: int, n_templates: int = 3
+        self, user_id: int, n_templates: int = 3, exclude_ids: List[int] = ()
     ) -> List[QuestTemplate]:
         """Get the potential templates for a user.
         To be potential we shouuld grab all quest tempaltes that are:
         1) have never been shown to the user before (they have no user quests associated with them)
         2) are either owned by the user or have no owner
+        3) are not waiting in the quest pool (those are handed out by QuestPoolService)
+        4) are not variants of another template (see TemplateDedupService)
 
+        1) is a NOT EXISTS anti-join on the (user_id, quest_template_id) index of the
+        user's quests.
+
+        RATED_TEMPLATE_SHARE of the templates are the best rated ones (see
+        VotingService.get_highly_rated_templates, read off the wilson_score index).
+        The rest are a random sample read off the random_key index (see
+        sample_by_random_key), so no query has to sort the whole table.
         """
+        seen = exists().where(
+            UserQuest.user_id == user_id,
+            UserQuest.quest_template_id == QuestTemplate.id,
+        )
         valid_templates = self.db.query(QuestTemplate).filter(
             or_(
                 QuestTemplate.owner_user_id == user_id,
                 QuestTemplate.owner_user_id.is_(None),
-            )
+            ),
+            # `NOT pooled`, not `pooled IS false`, or the planner can't match the
+            # partial random_key indexes
+            ~QuestTemplate.pooled,
+            QuestTemplate.parent_template_id.is_(None),
+            ~seen,
         )
-        logger.info(
-            f"Found {valid_templates.count()} valid templates for user {user_id}"
-        )
-
-        valid_templates = valid_templates.filter(
-            QuestTemplate.id.notin_(
-                self.db.query(UserQuest.quest_template_id).filter_by(user_id=user_id)
+        if exclude_ids:
+            valid_templates = valid_templates.filter(
+                QuestTemplate.id.notin_(exclude_ids)
             )
-        )
-        logger.info(
-            f"Found {valid_templates.count()} valid templates for user {user_id} after filtering"
-        )
 
-        return valid_templates.limit(n_templates).all()
+        templates = self.voting_service.get_highly_rated_templates(
+            limit=math.ceil(n_templates * self.RATED_TEMPLATE_SHARE),
+            query=valid_templates,
+        )
+        if templates:
+            valid_templates = valid_templates.filter(
+                QuestTemplate.id.notin_([template.id for template in templates])
+            )
+        templates += sample_by_random_key(valid_templates, n_templates - len(templates))
+        logger.info(f"Found {len(templates)} potential templates for user {user_id}")
+        return templates
@@ -0,0 +1,111 @@
+from typing import List, Optional
+
+from sqlalchemy import select, tuple_
+from sqlalchemy.orm import Session
+
+from backend.config import Config
+from backend.extensions import create_logger
+from backend.sidequest.models import QuestTemplate, QuestTemplateBand
+from backend.sidequest.utils.minhash import (
+    band_buckets,
+    minhash_signature,
+    similarity,
+)
+
+logger = create_logger(__name__)
+
+
+class TemplateDedupService:
+    """Service for the near-duplicate index of quest templates
+
+    The LLM keeps rewording the same few quests. Every canonical template's MinHash
+    signature is stored with it, and its LSH band buckets in
+    sidequest_quest_template_bands, so a new text is only compared against the
+    templates sharing a bucket with it.
+
+    The index is updated as templates are added: a generated quest close enough to
+    an indexed template (QUEST_DEDUP_THRESHOLD) is not stored at all, callers reuse
+    that template instead. Everything else is stored and indexed.
+    """
+
+    def __init__(self, db_session: Session, threshold: Optional[float] = None):
+        self.db = db_session
+        self.threshold = (
+            threshold if threshold is not None else Config.QUEST_DEDUP_THRESHOLD
+        )
+
+    def find_duplicate(
+        self, text: str, signature: Optional[List[int]] = None
+    ) -> Optional[QuestTemplate]:
+        """The indexed template most similar to `text`, if it is a near-duplicate"""
+        signature = signature or minhash_signature(text)
+        candidate_ids = select(QuestTemplateBand.quest_template_id).where(
+            tuple_(QuestTemplateBand.band, QuestTemplateBand.bucket).in_(
+                list(enumerate(band_buckets(signature)))
+            )
+        )
+        candidates = (
+            self.db.query(QuestTemplate)
+            .filter(QuestTemplate.id.in_(candidate_ids))
+            .all()
+        )
+
+        duplicate, best_similarity = None, self.threshold
+        for candidate in candidates:
+            candidate_similarity = similarity(signature, candidate.minhash)
+            if candidate_similarity >= best_similarity:
+                duplicate, best_similarity = candidate, candidate_similarity
+        return duplicate
+
+    def index(self, template: QuestTemplate, signature: Optional[List[int]] = None):
+        """Add a template to the index. Does not commit."""
+        if template.id is None:
+            self.db.add(template)
+            self.db.flush()
+        template.minhash = signature or minhash_signature(template.text)
+        self.db.add_all(
+            QuestTemplateBand(band=band, bucket=bucket, quest_template_id=template.id)
+            for band, bucket in enumerate(band_buckets(template.minhash))
+        )
+
+    def add_template(self, template: QuestTemplate) -> QuestTemplate:
+        """Add and index a new template, unless it is a near-duplicate of an indexed
+        one. Does not commit.
+
+        Returns the canonical template: the near-duplicate (`template` is then left
+        out of the session), or `template` itself.
+        """
+        signature = minhash_signature(template.text)
+        duplicate = self.find_duplicate(template.text, signature)
+        if duplicate is None:
+            self.index(template, signature)
+            return template
+
+        logger.info(
+            f"Generated quest '{template.text}' is a near-duplicate of template "
+            f"{duplicate.id}, reusing that"
+        )
+        return duplicate
+
+    def backfill(self, batch_size: int = 500) -> int:
+        """Index every canonical template not indexed yet, committing in batches"""
+        n_indexed = 0
+        while True:
+            templates = (
+                self.db.query(QuestTemplate)
+                .filter(
+                    QuestTemplate.minhash.is_(None),
+                    QuestTemplate.parent_template_id.is_(None),
+                )
+                .order_by(QuestTemplate.id)
+                .limit(batch_size)
+                .all()
+            )
+            if not templates:
+                break
+            for template in templates:
+                self.index(template)
+            self.db.commit()
+            n_indexed += len(templates)
+        logger.info(f"Indexed {n_indexed} quest templates for deduplication")
+        return n_indexed
@@ -0,0 +1,228 @@
+from collections import Counter
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional
+
+from sqlalchemy import desc, func
+from sqlalchemy.orm import Session
+
+from backend.extensions import create_logger
+from backend.sidequest.models import (
+    QuestStatus,
+    QuestTemplate,
+    UserQuest,
+    UserQuestStats,
+)
+
+logger = create_logger(__name__)
+
+# statuses of quests the user took on, the denominator of the success rate
+ACCEPTED_STATUSES = (QuestStatus.COMPLETED, QuestStatus.FAILED, QuestStatus.ABANDONED)
+
+
+def _bump(counts: Dict[str, int], keys: Iterable[str], delta: int) -> Dict[str, int]:
+    # returns a new dict, JSON columns only notice reassignment
+    counts = dict(counts or {})
+    for key in keys:
+        counts[key] = counts.get(key, 0) + delta
+        if counts[key] <= 0:
+            del counts[key]
+    return counts
+
+
+def _streak_ending_at(dates: List[date]) -> int:
+    """Length of the run of consecutive days ending at the first of `dates`
+    (distinct, most recent first)"""
+    streak = 0
+    for i, day in enumerate(dates):
+        if i > 0 and day != dates[i - 1] - timedelta(days=1):
+            break
+        streak += 1
+    return streak
+
+
+class UserStatsService:
+    """Service for the materialized per-user quest stats (UserQuestStats)
+
+    QuestService reports every status change here and the counters are adjusted
+    by the difference, so reading the stats never touches the user's quests.
+    Users without a stats row (or a change we can't apply incrementally, like
+    un-completing a quest) are rebuilt from their quests.
+    """
+
+    def __init__(self, db_session: Session):
+        self.db = db_session
+
+    def get_stats(self, user_id: int) -> UserQuestStats:
+        stats = self.db.get(UserQuestStats, user_id)
+        if stats is None:
+            stats = self.rebuild(user_id)
+            self.db.commit()
+        return stats
+
+    def stats_to_dict(
+        self, stats: UserQuestStats, today: Optional[date] = None
+    ) -> Dict[str, Any]:
+        """The /history/stats response"""
+        today = today or datetime.utcnow().date()
+        # the streak is broken once a full day passes without a completion
+        last = stats.last_completed_date
+        streak = stats.streak_length
+        if not last or last < today - timedelta(days=1):
+            streak = 0
+
+        success_rate = 0.0
+        if stats.total_accepted:
+            success_rate = round(
+                (stats.total_completed / stats.total_accepted) * 100, 1
+            )
+
+        category_counts = Counter(stats.category_counts or {})
+        most_completed_category = (
+            category_counts.most_common(1)[0][0] if category_counts else None
+        )
+        top_tags = [
+            {"tag": tag, "count": count}
+            for tag, count in Counter(stats.tag_counts or {}).most_common(5)
+        ]
+
+        return {
+            "streak": streak,
+            "success_rate": success_rate,
+            "most_completed_category": most_completed_category,
+            "top_tags": top_tags,
+            "total_completed": stats.total_completed,
+            "total_accepted": stats.total_accepted,
+        }
+
+    def record_transition(self, quest: UserQuest, old_status: QuestStatus):
+        """Apply a quest's status change to its user's stats. Does not commit."""
+        new_status = quest.status
+        accepted_delta = int(new_status in ACCEPTED_STATUSES) - int(
+            old_status in ACCEPTED_STATUSES
+        )
+        completed_delta = int(new_status == QuestStatus.COMPLETED) - int(
+            old_status == QuestStatus.COMPLETED
+        )
+        if not accepted_delta and not completed_delta:
+            return
+
+        stats = self._locked_stats(quest.user_id)
+        if stats is None:
+            # the rebuild already sees the change
+            self.rebuild(quest.user_id)
+            return
+
+        stats.total_accepted += accepted_delta
+        if not completed_delta:
+            return
+
+        stats.total_completed += completed_delta
+        if quest.category:
+            stats.category_counts = _bump(
+                stats.category_counts, [quest.category.value], completed_delta
+            )
+        stats.tag_counts = _bump(stats.tag_counts, quest.tags or [], completed_delta)
+        if completed_delta > 0 and quest.completed_at:
+            self._extend_streak(stats, quest.completed_at.date())
+        else:
+            self._rebuild_streak(stats)
+
+    def record_failed(self, failed_counts: Dict[int, int]):
+        """Count accepted quests failed in bulk (board cleanup), by user. Does not
+        commit."""
+        for user_id, n_failed in failed_counts.items():
+            stats = self._locked_stats(user_id)
+            if stats is None:
+                self.rebuild(user_id)
+            else:
+                stats.total_accepted += n_failed
+
+    def rebuild(self, user_id: int) -> UserQuestStats:
+        """Recompute a user's stats from their quests. Does not commit."""
+        stats = self.db.get(UserQuestStats, user_id)
+        if stats is None:
+            stats = UserQuestStats(user_id=user_id)
+            self.db.add(stats)
+
+        total_completed, total_accepted = (
+            self.db.query(
+                func.count().filter(UserQuest.status == QuestStatus.COMPLETED),
+                func.count().filter(UserQuest.status.in_(ACCEPTED_STATUSES)),
+            )
+            .filter(UserQuest.user_id == user_id)
+            .one()
+        )
+        stats.total_completed = total_completed
+        stats.total_accepted = total_accepted
+
+        completed_templates = (
+            self.db.query(QuestTemplate.category, QuestTemplate.tags)
+            .join(UserQuest, UserQuest.quest_template_id == QuestTemplate.id)
+            .filter(
+                UserQuest.user_id == user_id,
+                UserQuest.status == QuestStatus.COMPLETED,
+            )
+            .all()
+        )
+        category_counts, tag_counts = Counter(), Counter()
+        for category, tags in completed_templates:
+            if category:
+                category_counts[category.value] += 1
+            tag_counts.update(tags or [])
+        stats.category_counts = dict(category_counts)
+        stats.tag_counts = dict(tag_counts)
+
+        self._rebuild_streak(stats)
+        return stats
+
+    def backfill(self, batch_size: int = 500) -> int:
+        """Rebuild the stats of every user with quests, committing in batches"""
+        user_ids = [
+            user_id for (user_id,) in self.db.query(UserQuest.user_id).distinct()
+        ]
+        for i, user_id in enumerate(user_ids, 1):
+            self.rebuild(user_id)
+            if i % batch_size == 0:
+                self.db.commit()
+        self.db.commit()
+        logger.info(f"Backfilled quest stats for {len(user_ids)} users")
+        return len(user_ids)
+
+    def _locked_stats(self, user_id: int) -> Optional[UserQuestStats]:
+        # flush the quest change first, a rebuild must see it
+        self.db.flush()
+        return (
+            self.db.query(UserQuestStats)
+            .filter_by(user_id=user_id)
+            .with_for_update()
+            .first()
+        )
+
+    def _extend_streak(self, stats: UserQuestStats, completed_on: date):
+        last = stats.last_completed_date
+        if last is None or completed_on > last + timedelta(days=1):
+            stats.streak_length = 1
+            stats.last_completed_date = completed_on
+        elif completed_on == last + timedelta(days=1):
+            stats.streak_length += 1
+            stats.last_completed_date = completed_on
+        elif completed_on < last:
+            # completed out of order, can't extend the run incrementally
+            self._rebuild_streak(stats)
+
+    def _rebuild_streak(self, stats: UserQuestStats):
+        completion_dates = [
+            completed_on
+            for (completed_on,) in self.db.query(
+                func.date(UserQuest.completed_at).label("completed_on")
+            )
+            .filter(
+                UserQuest.user_id == stats.user_id,
+                UserQuest.status == QuestStatus.COMPLETED,
+                UserQuest.completed_at.isnot(None),
+            )
+            .distinct()
+            .order_by(desc("completed_on"))
+        ]
+        stats.streak_length = _streak_ending_at(completion_dates)
+        stats.last_completed_date = completion_dates[0] if completion_dates else None
@@ -1,8 +1,9 @@
+from collections import Counter
 from datetime import datetime
 import random
 from typing import List, Optional, Dict, Any
-from sqlalchemy.orm import Session
-from sqlalchemy import and_, not_
+from sqlalchemy.orm import Query, Session
+from sqlalchemy import and_, exists, update
 
 from backend.sidequest.models import (
     QuestTemplate,
@@ -10,8 +11,11 @@ from backend.sidequest.models import (
     QuestRating,
     QuestCategory,
     QuestDifficulty,
+    wilson_lower_bound,
 )
 from backend.sidequest.services.quest_generation_service import QuestGenerationService
+from backend.sidequest.services.template_dedup_service import TemplateDedupService
+from backend.sidequest.utils.sampling import sample_by_random_key
 from backend.extensions import create_logger
 
 
@@ -21,50 +25,77 @@ logger = create_logger(__name__)
 class VotingService:
     """Service for managing quest template voting"""
 
-    def __init__(self, db_session: Session):
+    def __init__(self, db_session: Session, quest_generation_service=None):
         self.db = db_session
-        self.quest_generation_service = QuestGenerationService(db_session)
+        self.quest_generation_service = (
+            quest_generation_service or QuestGenerationService(db_session)
+        )
+        self.template_dedup_service = TemplateDedupService(db_session)
 
     def get_quests_to_vote_on(
-        self, user_id: int, limit: int = 5
+        self, user_id: int, limit: int = 5, stratify: bool = False
     ) -> List[QuestTemplate]:
         """Get quest templates for the user to vote on
 
         Returns quest templates that the user hasn't voted on yet.
         If there aren't enough, generates new ones.
+
+        The templates are sampled off the random_key index (see
+        sample_by_random_key), so this reads about `limit` rows however many
+        templates there are. With `stratify` the sample is spread evenly over the
+        categories instead of following their share of the table.
         """
         logger.debug(f"Getting {limit} quest templates to vote on for user {user_id}")
 
         # Get quest templates the user hasn't voted on
-        voted_template_ids = self.db.query(
-            QuestTemplateVote.quest_template_id
-        ).filter_by(user_id=user_id)
-
-        available_templates = (
-            self.db.query(QuestTemplate).filter(
-                not_(QuestTemplate.id.in_(voted_template_ids))
-            )
-            # .limit(limit)
-            .all()
+        voted = exists().where(
+            QuestTemplateVote.user_id == user_id,
+            QuestTemplateVote.quest_template_id == QuestTemplate.id,
+        )
+        # pooled templates haven't been handed out yet, and variants only repeat
+        # their parent. `NOT pooled` matches the partial random_key indexes,
+        # `pooled IS false` would not
+        unvoted = self.db.query(QuestTemplate).filter(
+            ~QuestTemplate.pooled,
+            QuestTemplate.parent_template_id.is_(None),
+            ~voted,
         )
 
-        logger.debug(f"Found {len(available_templates)} available templates")
+        templates = []
+        if stratify:
+            categories = list(QuestCategory)
+            random.shuffle(categories)
+            quotas = Counter(categories[i % len(categories)] for i in range(limit))
+            for category, quota in quotas.items():
+                templates += sample_by_random_key(
+                    unvoted.filter(QuestTemplate.category == category), quota
+                )
+        # unstratified, or topping up categories that ran short
+        if len(templates) < limit:
+            if templates:
+                unvoted = unvoted.filter(
+                    QuestTemplate.id.notin_([template.id for template in templates])
+                )
+            templates += sample_by_random_key(unvoted, limit - len(templates))
+
+        logger.debug(f"Found {len(templates)} available templates")
 
         # If we don't have enough templates, generate new ones
-        if len(available_templates) < limit:
-            n_needed = limit - len(available_templates)
+        if len(templates) < limit:
+            n_needed = limit - len(templates)
             logger.info(f"Generating {n_needed} new quest templates for voting")
 
             new_templates = self._generate_voting_templates(n_needed)
-            available_templates.extend(new_templates)
+            templates.extend(new_templates)
 
-        # randomly choose limit templates
-        return random.sample(available_templates, limit)
+        random.shuffle(templates)
+        return templates[:limit]
 
     def _generate_voting_templates(self, n_quests: int) -> List[QuestTemplate]:
         """Generate new quest templates specifically for voting
 
-        These templates are NOT tied to any specific user (no owner_user_id)
+        These templates are NOT tied to any specific user (no owner_user_id).
+        Near-duplicates of existing templates are dropped (see TemplateDedupService).
         """
         logger.debug(f"Generating {n_quests} new quest templates for voting")
 
@@ -111,8 +142,11 @@ class VotingService:
                 fallback_used=quest_data.get("fallback_used"),
                 owner_user_id=None,  # No owner for voting templates
             )
-            self.db.add(template)
-            templates.append(template)
+            # the sample came up short, so it already held every template the
+            # user could vote on: a near-duplicate's template is in it, voted on
+            # or pooled, drop those
+            if self.template_dedup_service.add_template(template) is template:
+                templates.append(template)
 
         self.db.commit()
         logger.info(f"Generated {len(templates)} new quest templates for voting")
@@ -148,6 +182,10 @@ class VotingService:
 
         if existing_vote:
             # Update existing vote
+            if existing_vote.vote != vote_enum:
+                self._update_vote_counts(
+                    quest_template_id, vote_enum, existing_vote.vote
+                )
             existing_vote.vote = vote_enum
             self.db.commit()
             logger.info(
@@ -162,6 +200,7 @@ class VotingService:
             vote=vote_enum,
         )
         self.db.add(vote_obj)
+        self._update_vote_counts(quest_template_id, vote_enum)
         self.db.commit()
 
         logger.info(
@@ -169,6 +208,35 @@ class VotingService:
         )
         return vote_obj
 
+    def _update_vote_counts(
+        self,
+        quest_template_id: int,
+        vote: QuestRating,
+        previous_vote: Optional[QuestRating] = None,
+    ):
+        """Apply a new (or flipped) vote to the template's counters and Wilson score
+
+        A single UPDATE, so concurrent votes on the same template can't lose counts.
+        """
+        up_delta = int(vote == QuestRating.THUMBS_UP) - int(
+            previous_vote == QuestRating.THUMBS_UP
+        )
+        down_delta = int(vote == QuestRating.THUMBS_DOWN) - int(
+            previous_vote == QuestRating.THUMBS_DOWN
+        )
+        thumbs_up = QuestTemplate.thumbs_up_count + up_delta
+        thumbs_down = QuestTemplate.thumbs_down_count + down_delta
+        self.db.execute(
+            update(QuestTemplate)
+            .where(QuestTemplate.id == quest_template_id)
+            .values(
+                thumbs_up_count=thumbs_up,
+                thumbs_down_count=thumbs_down,
+                wilson_score=wilson_lower_bound(thumbs_up, thumbs_down),
+            )
+            .execution_options(synchronize_session="fetch")
+        )
+
     def get_user_votes(self, user_id: int, limit: int = 50) -> List[QuestTemplateVote]:
         """Get all votes by a user"""
         return (
@@ -181,15 +249,15 @@ class VotingService:
 
     def get_template_vote_stats(self, quest_template_id: int) -> Dict[str, Any]:
         """Get voting statistics for a quest template"""
-        votes = (
-            self.db.query(QuestTemplateVote)
-            .filter_by(quest_template_id=quest_template_id)
-            .all()
+        counts = (
+            self.db.query(
+                QuestTemplate.thumbs_up_count, QuestTemplate.thumbs_down_count
+            )
+            .filter_by(id=quest_template_id)
+            .first()
         )
-
-        thumbs_up = sum(1 for vote in votes if vote.vote == QuestRating.THUMBS_UP)
-        thumbs_down = sum(1 for vote in votes if vote.vote == QuestRating.THUMBS_DOWN)
-        total = len(votes)
+        thumbs_up, thumbs_down = counts if counts else (0, 0)
+        total = thumbs_up + thumbs_down
 
         return {
             "quest_template_id": quest_template_id,
@@ -200,12 +268,30 @@ class VotingService:
         }
 
     def get_highly_rated_templates(
-        self, min_approval_rate: float = 0.7, min_votes: int = 5
+        self,
+        min_approval_rate: float = 0.7,
+        min_votes: int = 5,
+        limit: Optional[int] = None,
+        query: Optional[Query] = None,
     ) -> List[QuestTemplate]:
-        """Get quest templates with high approval rates"""
-        # This is a more complex query that would need to be implemented
-        # For now, return empty list - can be implemented later if needed
+        """Get quest templates with high approval rates, only among the templates
+        of `query` if given
+
+        Best first by the lower bound of the Wilson score interval, so a template
+        with 40 of 50 thumbs up ranks above one with 4 of 5. Pooled templates are
+        left out, they haven't been handed out yet.
+        """
         logger.debug(
             f"Getting highly rated templates (min approval: {min_approval_rate}, min votes: {min_votes})"
         )
-        return []
+        total_votes = QuestTemplate.thumbs_up_count + QuestTemplate.thumbs_down_count
+        if query is None:
+            query = self.db.query(QuestTemplate)
+        query = query.filter(
+            ~QuestTemplate.pooled,
+            total_votes >= min_votes,
+            QuestTemplate.thumbs_up_count >= min_approval_rate * total_votes,
+        ).order_by(QuestTemplate.wilson_score.desc(), QuestTemplate.id)
+        if limit is not None:
+            query = query.limit(limit)
+        return query.all()
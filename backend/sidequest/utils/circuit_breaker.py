@@ -0,0 +1,90 @@
+"""
+Circuit breaker for calls to a flaky dependency (the quest generation LLM)
+
+Closed, calls go through. After `failure_threshold` failures in a row the circuit
+opens and calls fail fast with CircuitOpenError, so callers go straight to their
+fallback instead of waiting for a timeout. Once `reset_timeout` has passed a
+single trial call is let through (half-open): if it succeeds the circuit closes,
+if it fails it opens again for another `reset_timeout`.
+"""
+
+import threading
+import time
+from typing import Callable, TypeVar
+
+from backend.extensions import create_logger
+
+logger = create_logger(__name__)
+
+T = TypeVar("T")
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling through an open circuit"""
+
+
+class CircuitBreaker:
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = 5,
+        reset_timeout: float = 60.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = None
+
+    def allow_request(self) -> bool:
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if (
+                self.state == self.OPEN
+                and self._clock() - self._opened_at >= self.reset_timeout
+            ):
+                # let this call through as the trial, the others keep failing fast
+                self.state = self.HALF_OPEN
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            if self.state != self.CLOSED:
+                logger.info(f"Circuit '{self.name}' closed")
+            self.reset()
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self.state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    logger.warning(
+                        f"Circuit '{self.name}' opened after {self._failures} failures"
+                    )
+                self.state = self.OPEN
+                self._opened_at = self._clock()
+
+    def call(self, fn: Callable[..., T], *args, **kwargs) -> T:
+        """Call fn through the breaker, raises CircuitOpenError when open"""
+        if not self.allow_request():
+            raise CircuitOpenError(f"Circuit '{self.name}' is open")
+        try:
+            result = fn(*args, **kwargs)
+        except Exception:
+            self.record_failure()
+            raise
+        self.record_success()
+        return result
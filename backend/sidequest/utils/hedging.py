@@ -0,0 +1,83 @@
+"""
+Hedged calls: when a call runs longer than usual, race a second one against it
+
+LatencyWindow keeps the recent latencies of a call so the hedge can fire at, say,
+the 95th percentile: the slowest few calls get a backup, the rest cost nothing
+extra. `hedged_call` also enforces a deadline on the whole thing. Calls run on a
+shared thread pool and a call past its deadline is abandoned rather than
+cancelled, so callers should give the underlying request its own timeout.
+"""
+
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Optional, Tuple, TypeVar
+
+T = TypeVar("T")
+
+_executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix="hedged-call")
+
+
+class LatencyWindow:
+    """Latencies (in seconds) of the last `size` calls"""
+
+    def __init__(self, size: int = 200, min_samples: int = 20):
+        self.min_samples = min_samples
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def clear(self):
+        with self._lock:
+            self._samples.clear()
+
+    def percentile(self, p: float) -> Optional[float]:
+        """The p-th percentile latency, None until there are min_samples"""
+        with self._lock:
+            samples = sorted(self._samples)
+        if len(samples) < self.min_samples:
+            return None
+        return samples[min(len(samples) - 1, int(len(samples) * p / 100))]
+
+
+def hedged_call(
+    primary: Callable[[], T],
+    hedge: Optional[Callable[[], T]] = None,
+    hedge_after: Optional[float] = None,
+    deadline: Optional[float] = None,
+) -> Tuple[T, bool]:
+    """Call `primary`, and `hedge` too if primary hasn't returned after
+    `hedge_after` seconds. Returns the first successful result and whether it
+    came from the hedge.
+
+    Raises the first error if every call failed, and TimeoutError if none
+    returned within `deadline` seconds.
+    """
+    start = time.monotonic()
+
+    def remaining() -> Optional[float]:
+        if deadline is None:
+            return None
+        return max(0.0, deadline - (time.monotonic() - start))
+
+    is_hedge = {_executor.submit(primary): False}
+    if hedge is not None and hedge_after is not None:
+        wait_for = hedge_after if deadline is None else min(hedge_after, deadline)
+        done, _ = wait(is_hedge, timeout=wait_for)
+        if not done and remaining() != 0:
+            is_hedge[_executor.submit(hedge)] = True
+
+    pending, errors = set(is_hedge), []
+    while pending:
+        done, pending = wait(pending, timeout=remaining(), return_when=FIRST_COMPLETED)
+        if not done:
+            raise TimeoutError(f"No response within {deadline}s")
+        for future in done:
+            if future.exception() is None:
+                return future.result(), is_hedge[future]
+            errors.append(future.exception())
+    raise errors[0]
@@ -0,0 +1,76 @@
+"""
+MinHash signatures for spotting near-duplicate quest texts
+
+A text is reduced to the set of character shingles of its normalized form, and
+its signature is the minimum of NUM_PERM hash functions over that set. The share
+of signature slots two texts agree on estimates the Jaccard similarity of their
+shingle sets.
+
+To find candidates without comparing against every template, the signature is
+cut into BANDS bands (locality sensitive hashing): texts sharing any band bucket
+are candidates. With 16 bands of 4 rows, pairs above ~0.5 similarity are likely
+to share a bucket.
+
+Hashes are derived from blake2b with fixed seeds, so signatures stay comparable
+across processes and can be stored.
+"""
+
+import hashlib
+import random
+import re
+from typing import List, Set
+
+NUM_PERM = 64
+BANDS = 16
+ROWS_PER_BAND = NUM_PERM // BANDS
+SHINGLE_SIZE = 3
+
+_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+_rng = random.Random(20250914)
+_PERMUTATIONS = [
+    (_rng.randint(1, _PRIME - 1), _rng.randint(0, _PRIME - 1)) for _ in range(NUM_PERM)
+]
+
+
+def _hash(data: bytes, digest_size: int) -> int:
+    return int.from_bytes(
+        hashlib.blake2b(data, digest_size=digest_size).digest(), "big"
+    )
+
+
+def normalize_text(text: str) -> str:
+    """Lowercase, drop punctuation and collapse whitespace"""
+    return " ".join(re.sub(r"[^a-z0-9]+", " ", text.lower()).split())
+
+
+def shingles(text: str) -> Set[str]:
+    normalized = normalize_text(text)
+    if len(normalized) <= SHINGLE_SIZE:
+        return {normalized}
+    return {
+        normalized[i : i + SHINGLE_SIZE]
+        for i in range(len(normalized) - SHINGLE_SIZE + 1)
+    }
+
+
+def minhash_signature(text: str) -> List[int]:
+    hashes = [_hash(shingle.encode(), 4) for shingle in shingles(text)]
+    return [
+        min((a * h + b) % _PRIME for h in hashes) & _MAX_HASH for a, b in _PERMUTATIONS
+    ]
+
+
+def band_buckets(signature: List[int]) -> List[int]:
+    """One bucket per band, as signed 64 bit ints (they are stored in a BIGINT)"""
+    buckets = []
+    for band in range(BANDS):
+        rows = signature[band * ROWS_PER_BAND : (band + 1) * ROWS_PER_BAND]
+        data = b"".join(row.to_bytes(4, "big") for row in rows)
+        buckets.append(_hash(data, 8) - (1 << 63))
+    return buckets
+
+
+def similarity(signature: List[int], other: List[int]) -> float:
+    """Estimated Jaccard similarity of the two texts' shingles"""
+    return sum(a == b for a, b in zip(signature, other)) / NUM_PERM
@@ -0,0 +1,37 @@
+"""
+Random sampling of quest templates without ORDER BY random()
+
+Every template has a uniform random_key. To draw n templates we seek to a random
+point on a random_key index and read the next n rows, wrapping around to the
+start of the index if we run out. That is O(n) index reads however many
+templates match, instead of sorting them all.
+"""
+
+import random
+from typing import List
+
+from sqlalchemy.orm import Query
+
+from backend.sidequest.models import QuestTemplate
+
+
+def sample_by_random_key(query: Query, n_samples: int) -> List[QuestTemplate]:
+    """Draw up to n_samples templates from a QuestTemplate query"""
+    if n_samples <= 0:
+        return []
+
+    start = random.random()
+    templates = (
+        query.filter(QuestTemplate.random_key >= start)
+        .order_by(QuestTemplate.random_key)
+        .limit(n_samples)
+        .all()
+    )
+    if len(templates) < n_samples:
+        templates += (
+            query.filter(QuestTemplate.random_key < start)
+            .order_by(QuestTemplate.random_key)
+            .limit(n_samples - len(templates))
+            .all()
+        )
+    return templates
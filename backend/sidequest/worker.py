@@ -0,0 +1,120 @@
+"""
+Background maintenance for SideQuest, kept off the request path.
+
+Run it as its own process next to the web workers:
+
+    ENV=prod python -m backend.sidequest.worker
+
+Every `interval` seconds it tops up the pool of pre-generated quest templates and
+refreshes the boards of users whose local midnight is coming up. Web workers can
+also ask for an early refill with `request_pool_refill` when a board refresh
+drains a pool cell.
+
+`python -m backend.sidequest.worker backfill-stats` rebuilds every user's
+materialized quest stats once, e.g. after adding the stats table, and
+`backfill-dedup` adds the existing quest templates to the near-duplicate index.
+"""
+
+import argparse
+import threading
+import time
+
+from flask import current_app
+
+from backend.extensions import create_logger, db
+from backend.sidequest.services.board_refresh_service import BoardRefreshService
+from backend.sidequest.services.quest_pool_service import QuestPoolService
+from backend.sidequest.services.template_dedup_service import TemplateDedupService
+from backend.sidequest.services.user_stats_service import UserStatsService
+
+logger = create_logger(__name__)
+
+WORKER_INTERVAL_SECONDS = 300
+
+_refill_lock = threading.Lock()
+
+
+def refill_quest_pool() -> int:
+    """Top up every pool cell below its low water mark"""
+    return QuestPoolService(db.session).refill()
+
+
+def refresh_due_boards() -> int:
+    """Prepare the boards of every timezone bucket approaching midnight, and
+    refresh the ones past it"""
+    return BoardRefreshService(db.session).refresh_due_boards()
+
+
+def backfill_user_stats() -> int:
+    """Rebuild the materialized quest stats of every user"""
+    return UserStatsService(db.session).backfill()
+
+
+def backfill_dedup_index() -> int:
+    """Add every quest template not indexed yet to the near-duplicate index"""
+    return TemplateDedupService(db.session).backfill()
+
+
+def _run_pool_refill(app):
+    try:
+        with app.app_context():
+            refill_quest_pool()
+    except Exception as e:
+        logger.exception(f"Quest pool refill failed: {e}")
+    finally:
+        db.session.remove()
+        _refill_lock.release()
+
+
+def request_pool_refill() -> bool:
+    """Refill the quest pool in a background thread of this process.
+
+    At most one refill runs per process; returns False if one is already running
+    or background refills are disabled (QUEST_POOL_ASYNC_REFILL).
+    """
+    app = current_app._get_current_object()
+    if not app.config.get("QUEST_POOL_ASYNC_REFILL", True):
+        return False
+    if not _refill_lock.acquire(blocking=False):
+        return False
+    threading.Thread(target=_run_pool_refill, args=(app,), daemon=True).start()
+    return True
+
+
+def run_worker(app, interval=WORKER_INTERVAL_SECONDS):
+    """Run the maintenance loop forever"""
+    logger.info(f"SideQuest worker started, running every {interval}s")
+    while True:
+        for task in (refill_quest_pool, refresh_due_boards):
+            with app.app_context():
+                try:
+                    task()
+                except Exception as e:
+                    logger.exception(f"{task.__name__} failed: {e}")
+                    db.session.rollback()
+                finally:
+                    db.session.remove()
+        time.sleep(interval)
+
+
+if __name__ == "__main__":
+    from app import deploy_app
+
+    parser = argparse.ArgumentParser(description="SideQuest background worker")
+    parser.add_argument(
+        "command",
+        nargs="?",
+        default="run",
+        choices=["run", "backfill-stats", "backfill-dedup"],
+    )
+    args = parser.parse_args()
+
+    app = deploy_app()
+    if args.command == "backfill-stats":
+        with app.app_context():
+            backfill_user_stats()
+    elif args.command == "backfill-dedup":
+        with app.app_context():
+            backfill_dedup_index()
+    else:
+        run_worker(app)
@@ -0,0 +1,90 @@
+"""
+Tests for splitting lyrics into bars.
+"""
+
+import pytest
+
+from backend.lyrica.chunking import ChunkerConfig, chunk_lyrics, split_sections
+
+LYRICS = """[Verse 1]
+one two three
+four five six
+
+[Chorus]
+la la la la
+sing it back now
+
+[Verse 2]
+seven eight nine
+
+[Chorus]
+La la la, la!
+sing it  back now
+"""
+
+
+def numbered_lines(n):
+    return "\n".join(f"line number {i}" for i in range(n))
+
+
+def test_sections_split_on_headers_and_blank_lines():
+    sections = split_sections(LYRICS)
+
+    assert sections[0] == ["one two three", "four five six"]
+    assert not any(line.startswith("[") for section in sections for line in section)
+
+
+def test_headers_split_sections_without_blank_lines():
+    lyrics = "[Intro]\nfirst line here\n[Hook]\nsecond line here"
+
+    assert chunk_lyrics(lyrics) == ["first line here", "second line here"]
+
+
+def test_repeated_choruses_are_embedded_once():
+    chunks = chunk_lyrics(LYRICS)
+
+    assert chunks == [
+        "one two three\nfour five six",
+        "la la la la\nsing it back now",
+        "seven eight nine",
+    ]
+    assert len(chunk_lyrics(LYRICS, ChunkerConfig(dedupe=False))) == 4
+
+
+def test_long_sections_are_windowed():
+    chunks = chunk_lyrics(numbered_lines(25), ChunkerConfig(window_lines=10))
+
+    assert [len(chunk.split("\n")) for chunk in chunks] == [10, 10, 5]
+
+
+def test_windows_overlap():
+    chunks = chunk_lyrics(
+        numbered_lines(10), ChunkerConfig(window_lines=4, overlap_lines=2)
+    )
+
+    assert chunks[0].split("\n")[2:] == chunks[1].split("\n")[:2]
+    assert chunks[-1].endswith("line number 9")
+
+
+def test_windows_respect_max_tokens():
+    chunks = chunk_lyrics(numbered_lines(6), ChunkerConfig(max_tokens=7))
+
+    assert all(len(chunk.split()) <= 7 for chunk in chunks)
+    assert len(chunks) == 3
+
+
+def test_short_tails_are_merged_and_short_sections_dropped():
+    lyrics = numbered_lines(3) + "\nyeah\n\nuh"
+    chunks = chunk_lyrics(lyrics, ChunkerConfig(window_lines=3))
+
+    assert chunks == [numbered_lines(3) + "\nyeah"]
+
+
+def test_empty_lyrics():
+    assert chunk_lyrics(None) == []
+    assert chunk_lyrics("") == []
+
+
+def test_overlap_must_be_smaller_than_window():
+    with pytest.raises(ValueError):
+        ChunkerConfig(window_lines=4, overlap_lines=4)
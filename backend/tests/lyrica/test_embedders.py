@@ -0,0 +1,34 @@
+"""
+Tests for the embedder registry.
+"""
+
+import numpy as np
+import pytest
+
+from backend.lyrica.embedders import DEFAULT_EMBEDDER, EMBEDDERS, get_embedder
+
+
+def test_reduced_embedders_request_fewer_dimensions():
+    embedder = get_embedder("text-embedding-3-small-256")
+
+    assert embedder.reduced
+    assert embedder.request_kwargs() == {
+        "model": "text-embedding-3-small",
+        "dimensions": 256,
+    }
+    assert DEFAULT_EMBEDDER.request_kwargs() == {"model": "text-embedding-3-small"}
+
+
+def test_get_embedder():
+    assert get_embedder() is DEFAULT_EMBEDDER
+    assert get_embedder(EMBEDDERS["text-embedding-3-large"]).dimensions == 3072
+    with pytest.raises(ValueError):
+        get_embedder("word2vec")
+
+
+def test_check_rejects_wrong_dimension():
+    embedder = get_embedder("text-embedding-3-small-512")
+
+    embedder.check(np.zeros(512))
+    with pytest.raises(ValueError):
+        embedder.check(np.zeros(1536))
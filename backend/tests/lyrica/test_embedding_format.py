@@ -0,0 +1,106 @@
+"""
+Tests for the lyric embedding storage format and the row rewrite migration.
+"""
+
+import numpy as np
+import pytest
+import sqlalchemy as sa
+
+from backend.extensions import db
+from backend.lyrica.embedding_format import (
+    EmbeddingFormat,
+    decode_embedding,
+    embedding_format,
+    encode_embedding,
+)
+from backend.lyrica.migrate_embeddings import (
+    add_embedding_model_columns,
+    create_fetch_job_tables,
+    rewrite_embeddings,
+)
+from backend.lyrica.models import Artist, FetchJob, FetchJobEvent, Lyric, Song
+
+
+@pytest.fixture
+def embedding():
+    rng = np.random.default_rng(0)
+    return rng.normal(scale=0.05, size=1536)
+
+
+class TestEmbeddingFormat:
+    """Test encoding and decoding of stored embeddings."""
+
+    def test_legacy_float64_blobs_still_decode(self, embedding):
+        blob = embedding.tobytes()
+        assert embedding_format(blob) is None
+        np.testing.assert_array_equal(decode_embedding(blob), embedding)
+
+    @pytest.mark.parametrize(
+        "fmt, expected_size, atol",
+        [
+            (EmbeddingFormat.FLOAT32, 1 + 4 * 1536, 1e-7),
+            (EmbeddingFormat.FLOAT16, 1 + 2 * 1536, 1e-4),
+            (EmbeddingFormat.INT8, 1 + 12 + 1536, 2e-3),
+        ],
+    )
+    def test_round_trip(self, embedding, fmt, expected_size, atol):
+        blob = encode_embedding(embedding, fmt)
+
+        assert len(blob) == expected_size
+        assert embedding_format(blob) == fmt
+        decoded = decode_embedding(blob)
+        assert decoded.shape == embedding.shape
+        np.testing.assert_allclose(decoded, embedding, atol=atol)
+
+    @pytest.mark.parametrize("dim", [1, 7, 8, 255, 256])
+    def test_tagged_blobs_never_look_like_legacy(self, dim):
+        vector = np.linspace(-1, 1, dim)
+        for fmt in EmbeddingFormat:
+            blob = encode_embedding(vector, fmt)
+            assert embedding_format(blob) == fmt
+            assert decode_embedding(blob).shape == (dim,)
+
+
+class TestRewriteEmbeddings:
+    """Test the migration that rewrites legacy rows."""
+
+    def test_rewrites_legacy_rows_once(self, app, embedding):
+        artist = Artist(id=1, name="Test Artist", url="https://genius.com/artists/1")
+        song = Song(id=1, title="Test Song", url="https://genius.com/1", artist=artist)
+        legacy = Lyric(lyric="a bar", order=0, song=song)
+        legacy.embeddings = embedding.tobytes()
+        current = Lyric(lyric="another bar", order=1, song=song)
+        current.add_embedding(embedding)
+        db.session.add_all([artist, song, legacy, current])
+        db.session.commit()
+
+        assert rewrite_embeddings(db.session, EmbeddingFormat.FLOAT32) == 1
+        assert rewrite_embeddings(db.session, EmbeddingFormat.FLOAT32) == 0
+
+        db.session.refresh(legacy)
+        assert embedding_format(legacy.embeddings) == EmbeddingFormat.FLOAT32
+        np.testing.assert_allclose(legacy.get_embedding(), embedding, atol=1e-7)
+
+    def test_labels_legacy_rows_with_default_model(self, app, embedding):
+        artist = Artist(id=1, name="Test Artist", url="https://genius.com/artists/1")
+        song = Song(id=1, title="Test Song", url="https://genius.com/1", artist=artist)
+        legacy = Lyric(lyric="a bar", order=0, song=song)
+        legacy.embeddings = embedding.tobytes()
+        db.session.add_all([artist, song, legacy])
+        db.session.commit()
+
+        add_embedding_model_columns(db.session)
+
+        db.session.refresh(legacy)
+        assert legacy.embedding_model == "text-embedding-3-small"
+        assert legacy.embedding_dim == 1536
+
+    def test_creates_fetch_job_tables(self, app):
+        FetchJobEvent.__table__.drop(db.engine)
+        FetchJob.__table__.drop(db.engine)
+
+        create_fetch_job_tables(db.session)
+        create_fetch_job_tables(db.session)
+
+        tables = sa.inspect(db.engine).get_table_names()
+        assert {"lyrica_fetch_jobs", "lyrica_fetch_job_events"} <= set(tables)
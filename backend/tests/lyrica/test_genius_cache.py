@@ -0,0 +1,79 @@
+"""
+Tests for the persistent Genius response cache.
+"""
+
+import os
+from unittest.mock import Mock
+
+import pytest
+
+from backend.lyrica.genius_cache import GeniusCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def cache(tmp_path, clock):
+    return GeniusCache(
+        cache_dir=str(tmp_path), ttls={"artist": (100, 1000)}, clock=clock
+    )
+
+
+def test_fresh_entries_are_served_from_disk(cache):
+    fetch = Mock(return_value={"artist": {"name": "Test Artist"}})
+
+    first = cache.get("artist", {"artist_id": 1}, fetch)
+    second = cache.get("artist", {"artist_id": 1}, fetch)
+
+    assert first == second == {"artist": {"name": "Test Artist"}}
+    fetch.assert_called_once()
+
+
+def test_cache_is_shared_between_instances(cache, tmp_path, clock):
+    cache.get("artist", {"artist_id": 1}, Mock(return_value={"id": 1}))
+    other_worker = GeniusCache(cache_dir=str(tmp_path), ttls=cache.ttls, clock=clock)
+    fetch = Mock()
+
+    assert other_worker.get("artist", {"artist_id": 1}, fetch) == {"id": 1}
+    fetch.assert_not_called()
+
+
+def test_stale_entries_are_served_while_revalidating(cache, clock):
+    cache.get("artist", {"artist_id": 1}, Mock(return_value={"version": 1}))
+    clock.now += 500
+
+    fetch = Mock(return_value={"version": 2})
+    stale = cache.get("artist", {"artist_id": 1}, fetch, revalidate_async=False)
+
+    assert stale == {"version": 1}
+    fetch.assert_called_once()
+    assert cache.get("artist", {"artist_id": 1}, Mock()) == {"version": 2}
+    assert not [p for p in os.listdir(cache.cache_dir) if p.endswith(".lock")]
+
+
+def test_expired_entries_are_refetched(cache, clock):
+    cache.get("artist", {"artist_id": 1}, Mock(return_value={"version": 1}))
+    clock.now += 5000
+
+    assert cache.get("artist", {"artist_id": 1}, Mock(return_value={"version": 2})) == {
+        "version": 2
+    }
+
+
+def test_different_params_do_not_collide(cache):
+    cache.get("artist", {"artist_id": 1}, Mock(return_value={"id": 1}))
+
+    assert cache.get("artist", {"artist_id": 2}, Mock(return_value={"id": 2})) == {
+        "id": 2
+    }
@@ -0,0 +1,158 @@
+"""
+Tests for background fetch jobs and progress tailing.
+"""
+
+from datetime import datetime
+from unittest.mock import patch
+
+import numpy as np
+import pytest
+
+from backend.extensions import db
+from backend.lyrica.embedders import DEFAULT_EMBEDDER
+from backend.lyrica.jobs import (
+    STALE_AFTER,
+    get_events,
+    record_event,
+    run_fetch_job,
+    start_fetch_job,
+    tail_job_events,
+)
+from backend.lyrica.models import FetchJob, FetchJobStatus, Lyric, Song
+
+LYRICS = """[Verse 1]
+Walking down the avenue with nowhere left to go
+Counting all the streetlights as they flicker in a row
+Every window shining like a story I don't know
+
+[Chorus]
+Hold on, hold on, the night is getting long
+Hold on, hold on, we're singing our song
+"""
+
+
+def fake_genius(resource, params, fetch_fn):
+    """Canned Genius responses: artist 7 with two songs, plus a feature"""
+    if resource == "artist":
+        return {"artist": {"name": "Test Artist", "url": "https://genius.com/a/7"}}
+    if resource == "artist_songs":
+        song = lambda song_id, artist_id: {  # noqa: E731
+            "id": song_id,
+            "title": f"Song {song_id}",
+            "url": f"https://genius.com/{song_id}",
+            "primary_artist": {"id": artist_id},
+        }
+        return {"songs": [song(1, 7), song(2, 7), song(3, 8)], "next_page": None}
+    if resource == "lyrics":
+        return LYRICS
+    raise AssertionError(f"Unexpected Genius request: {resource}")
+
+
+def fake_embed_texts(texts, embedder=DEFAULT_EMBEDDER):
+    return [np.full(embedder.dimensions, 0.1) for _ in texts]
+
+
+def make_job(status=FetchJobStatus.RUNNING, n_events=0):
+    job = FetchJob(artist_id=1, status=status)
+    db.session.add(job)
+    db.session.commit()
+    for i in range(n_events):
+        record_event(job, {"n_songs": i})
+    return job
+
+
+def test_events_resume_after_sequence_number(app):
+    job = make_job(n_events=3)
+
+    assert job.last_seq == 3
+    assert [event.payload for event in get_events(job.id, after_seq=1)] == [
+        {"n_songs": 1},
+        {"n_songs": 2},
+    ]
+
+
+def test_tail_drains_events_of_a_finished_job(app):
+    job = make_job(status=FetchJobStatus.COMPLETED, n_events=2)
+
+    assert list(tail_job_events(job.id, poll_interval=0)) == [
+        (1, {"n_songs": 0}),
+        (2, {"n_songs": 1}),
+    ]
+
+
+def test_tail_reports_failed_jobs(app):
+    job = make_job(status=FetchJobStatus.FAILED, n_events=1)
+
+    assert list(tail_job_events(job.id, after_seq=1, poll_interval=0)) == [
+        (None, {"error": "Error pulling artist info"})
+    ]
+
+
+def test_start_fetch_job_reuses_job_in_flight(app):
+    with patch("backend.lyrica.jobs.threading.Thread") as thread:
+        first = start_fetch_job("1")
+        second = start_fetch_job(1)
+
+    assert first.id == second.id
+    assert first.status == FetchJobStatus.PENDING
+    thread.assert_called_once()
+    thread.return_value.start.assert_called_once()
+
+
+def test_run_fetch_job_stores_songs_and_lyrics(app):
+    ArtistClient = pytest.importorskip("backend.lyrica.ArtistClient")
+    job = FetchJob(artist_id=7, status=FetchJobStatus.PENDING)
+    db.session.add(job)
+    db.session.commit()
+    job_id = job.id
+
+    with patch.object(
+        ArtistClient.genius_cache, "get", side_effect=fake_genius
+    ), patch.object(ArtistClient, "embed_texts", side_effect=fake_embed_texts), patch(
+        "backend.lyrica.jobs.time.sleep"
+    ):
+        run_fetch_job(app, job_id)
+
+    # the job ran in its own app context and session
+    db.session.expire_all()
+    job = db.session.get(FetchJob, job_id)
+    assert job.status == FetchJobStatus.COMPLETED, job.error
+    # the other artist's song is left out
+    assert sorted(song.id for song in Song.query.filter_by(artist_id=7)) == [1, 2]
+    assert Song.query.get(3) is None
+    assert Lyric.query.filter(Lyric.song_id.in_([1, 2])).count() > 0
+    assert [event.payload["n_songs"] for event in get_events(job_id)] == [0, 1, 2]
+
+
+def test_start_fetch_job_replaces_stale_job(app):
+    stale = make_job()
+    stale.updated_at = datetime.utcnow() - STALE_AFTER * 2
+    db.session.commit()
+
+    with patch("backend.lyrica.jobs.threading.Thread") as thread:
+        job = start_fetch_job(stale.artist_id)
+
+    assert job.id != stale.id
+    assert stale.status == FetchJobStatus.FAILED
+    thread.return_value.start.assert_called_once()
+
+
+def test_tail_fails_stale_jobs(app):
+    job = make_job(n_events=1)
+    job.updated_at = datetime.utcnow() - STALE_AFTER * 2
+    db.session.commit()
+
+    assert list(tail_job_events(job.id, poll_interval=0)) == [
+        (1, {"n_songs": 0}),
+        (None, {"error": "Error pulling artist info"}),
+    ]
+    assert db.session.get(FetchJob, job.id).status == FetchJobStatus.FAILED
+
+
+def test_tail_gives_up_after_timeout(app):
+    job = make_job(n_events=1)
+
+    assert list(tail_job_events(job.id, poll_interval=0, timeout=0)) == [
+        (1, {"n_songs": 0}),
+        (None, {"error": "Timed out waiting for artist info"}),
+    ]
@@ -0,0 +1,70 @@
+"""
+Tests for the Lyrica stage timings and Prometheus rendering.
+"""
+
+from unittest.mock import Mock
+
+import pytest
+
+from backend.lyrica.genius_cache import GeniusCache
+from backend.lyrica.metrics import STAGE_CALLS, STAGE_SECONDS, registry, timed
+
+
+@pytest.fixture(autouse=True)
+def clean_registry():
+    registry.reset()
+    yield
+    registry.reset()
+
+
+def test_timed_records_duration_and_outcome():
+    @timed("genius_search")
+    def search(fail=False):
+        if fail:
+            raise ValueError("no artist")
+        return "1"
+
+    assert search() == "1"
+    with pytest.raises(ValueError):
+        search(fail=True)
+    with timed("db_write"):
+        pass
+
+    count, total = STAGE_SECONDS.get(stage="genius_search")
+    assert count == 2 and total >= 0
+    assert STAGE_CALLS.get(stage="genius_search", status="ok") == 1
+    assert STAGE_CALLS.get(stage="genius_search", status="error") == 1
+    assert STAGE_CALLS.get(stage="db_write", status="ok") == 1
+
+
+def test_render_prometheus_text_format():
+    histogram = registry.histogram("test_latency_seconds", "Test", buckets=(0.1, 1))
+    histogram.observe(0.05, stage="a")
+    histogram.observe(0.5, stage="a")
+    registry.counter("test_total", "Test").inc(3, result='say "hi"')
+
+    text = registry.render()
+
+    assert "# TYPE test_latency_seconds histogram" in text
+    assert 'test_latency_seconds_bucket{stage="a",le="0.1"} 1.0' in text
+    assert 'test_latency_seconds_bucket{stage="a",le="1.0"} 2.0' in text
+    assert 'test_latency_seconds_bucket{stage="a",le="+Inf"} 2.0' in text
+    assert 'test_latency_seconds_count{stage="a"} 2.0' in text
+    assert 'test_total{result="say \\"hi\\""} 3.0' in text
+
+
+def test_metric_names_cannot_change_type():
+    registry.counter("test_total")
+    with pytest.raises(ValueError):
+        registry.histogram("test_total")
+
+
+def test_genius_cache_counts_hits_and_misses(tmp_path):
+    cache = GeniusCache(cache_dir=str(tmp_path))
+    requests = registry.get("lyrica_genius_cache_requests_total")
+
+    cache.get("artist", {"artist_id": 1}, Mock(return_value={"id": 1}))
+    cache.get("artist", {"artist_id": 1}, Mock())
+
+    assert requests.get(resource="artist", result="miss") == 1
+    assert requests.get(resource="artist", result="hit") == 1
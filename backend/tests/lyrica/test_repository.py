@@ -0,0 +1,131 @@
+"""
+Tests for the lyrica song/lyric loading helpers.
+"""
+
+import numpy as np
+import pytest
+from sqlalchemy import event
+
+from backend.extensions import db
+from backend.lyrica.embedders import get_embedder
+from backend.lyrica.models import Artist, Lyric, Song
+from backend.lyrica.repository import (
+    bulk_insert_lyrics,
+    bulk_upsert_songs,
+    get_song_lyric_counts,
+    get_songs_with_lyrics,
+)
+
+
+@pytest.fixture
+def artist_catalog(app):
+    """An artist with five songs, three of which have lyrics."""
+    artist = Artist(id=1, name="Test Artist", url="https://genius.com/artists/1")
+    db.session.add(artist)
+    for song_id in range(1, 6):
+        song = Song(
+            id=song_id,
+            title=f"Song {song_id}",
+            url=f"https://genius.com/{song_id}",
+            artist=artist,
+        )
+        db.session.add(song)
+        for order in range(song_id if song_id <= 3 else 0):
+            lyric = Lyric(lyric=f"bar {order}", order=order, song=song)
+            lyric.add_embedding(np.full(8, song_id, dtype=float))
+            db.session.add(lyric)
+    db.session.commit()
+    db.session.expunge_all()
+    return artist
+
+
+def count_queries():
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(db.engine, "before_cursor_execute", before_cursor_execute)
+    return statements, lambda: event.remove(
+        db.engine, "before_cursor_execute", before_cursor_execute
+    )
+
+
+def test_song_lyric_counts_single_query(artist_catalog):
+    statements, stop = count_queries()
+    try:
+        counts = get_song_lyric_counts(1)
+    finally:
+        stop()
+
+    assert len(statements) == 1
+    assert [(c.song_id, c.n_lyrics) for c in counts] == [
+        (1, 1),
+        (2, 2),
+        (3, 3),
+        (4, 0),
+        (5, 0),
+    ]
+
+
+def test_songs_with_lyrics_loads_graph_in_two_queries(artist_catalog):
+    statements, stop = count_queries()
+    try:
+        songs = get_songs_with_lyrics(1)
+        embeddings = [lyric.get_embedding() for song in songs for lyric in song.lyrics]
+    finally:
+        stop()
+
+    assert len(statements) == 2
+    assert len(songs) == 5
+    assert len(embeddings) == 6
+
+
+def test_bulk_upsert_songs_skips_existing(artist_catalog):
+    songs = [
+        {
+            "id": song_id,
+            "title": f"Song {song_id}",
+            "url": f"https://genius.com/{song_id}",
+        }
+        for song_id in (4, 5, 6, 7, 7)
+    ]
+
+    statements, stop = count_queries()
+    try:
+        new_ids = bulk_upsert_songs(1, songs)
+    finally:
+        stop()
+    db.session.commit()
+
+    assert len(statements) == 1
+    assert sorted(new_ids) == [6, 7]
+    assert len(get_song_lyric_counts(1)) == 7
+
+
+def test_bulk_insert_lyrics_returns_ids_in_order(artist_catalog):
+    bars = ["first bar", "second bar", "third bar"]
+    embeddings = [np.full(8, i, dtype=float) for i in range(3)]
+
+    lyric_ids = bulk_insert_lyrics(4, bars, embeddings)
+    db.session.commit()
+
+    lyrics = [db.session.get(Lyric, lyric_id) for lyric_id in lyric_ids]
+    assert [lyric.lyric for lyric in lyrics] == bars
+    assert [lyric.order for lyric in lyrics] == [0, 1, 2]
+    np.testing.assert_allclose(lyrics[2].get_embedding(), embeddings[2])
+
+
+def test_lyrics_are_partitioned_by_embedding_model(artist_catalog):
+    small = get_embedder("text-embedding-3-small-256")
+    lyric_ids = bulk_insert_lyrics(4, ["short bar"], [np.ones(256)], small)
+    db.session.commit()
+
+    lyric = db.session.get(Lyric, lyric_ids[0])
+    assert (lyric.embedding_model, lyric.embedding_dim) == (small.name, 256)
+
+    songs = get_songs_with_lyrics(1, embedding_model=small.name)
+    assert [len(song.lyrics) for song in songs] == [0, 0, 0, 1, 0]
+    counts = get_song_lyric_counts(1, embedding_model=small.name)
+    assert [c.n_lyrics for c in counts] == [0, 0, 0, 1, 0]
+    assert [c.n_lyrics for c in get_song_lyric_counts(1)] == [1, 2, 3, 1, 0]
@@ -0,0 +1,112 @@
+"""
+Tests for the cross-artist lyric index.
+"""
+
+import numpy as np
+import pytest
+
+from backend.extensions import db
+from backend.lyrica.models import Artist, Lyric, Song
+from backend.lyrica.embedders import get_embedder
+from backend.lyrica.search_index import (
+    GlobalLyricIndex,
+    get_lyric_index,
+    lyric_metadata,
+)
+
+
+@pytest.fixture
+def two_artists(app):
+    """Two artists with one song each; lyric embeddings are basis vectors."""
+    lyric_ids = {}
+    for artist_id in (1, 2):
+        artist = Artist(
+            id=artist_id,
+            name=f"Artist {artist_id}",
+            url=f"https://genius.com/artists/{artist_id}",
+        )
+        song = Song(
+            id=artist_id,
+            title=f"Song {artist_id}",
+            url=f"https://genius.com/{artist_id}",
+            artist=artist,
+        )
+        db.session.add_all([artist, song])
+        for order in range(2):
+            axis = 2 * (artist_id - 1) + order
+            lyric = Lyric(lyric=f"bar {axis}", order=order, song=song)
+            lyric.add_embedding(np.eye(4)[axis])
+            db.session.add(lyric)
+            db.session.flush()
+            lyric_ids[axis] = lyric.id
+    db.session.commit()
+    return lyric_ids
+
+
+def test_search_merges_results_across_shards(two_artists):
+    index = GlobalLyricIndex()
+
+    results = index.search(np.array([0.1, 0.0, 1.0, 0.0]), k=2)
+
+    assert len(index.shards) == 2
+    assert [r["lyric_id"] for r in results] == [two_artists[2], two_artists[0]]
+    assert results[0]["lyric"]["song_name"] == "Song 2"
+    assert results[0]["lyric"]["artist_name"] == "Artist 2"
+
+
+def test_search_by_lyric_excludes_the_query(two_artists):
+    index = GlobalLyricIndex()
+    query_id = two_artists[0]
+
+    results = index.search(
+        index.get_embedding(query_id), k=3, exclude_ids=[query_id], artist_ids=[1]
+    )
+
+    assert [r["lyric_id"] for r in results] == [two_artists[1]]
+
+
+def test_added_lyrics_are_searchable(two_artists):
+    index = GlobalLyricIndex(engine="ivf", n_lists=2, n_probe=2)
+    index.ensure_loaded()
+
+    index.add_lyric(
+        3, 999, np.array([1.0, 1.0, 1.0, 1.0]), lyric_metadata("new", "Song 3", "url")
+    )
+
+    assert index.search(np.array([1.0, 1.0, 1.0, 1.0]), k=1)[0]["lyric_id"] == 999
+    assert len(index) == 5
+
+
+def test_search_picks_up_lyrics_stored_by_other_processes(two_artists):
+    index = GlobalLyricIndex(refresh_interval=0)
+    index.ensure_loaded()
+
+    # stored without going through this index, like another web worker would
+    lyric = Lyric(lyric="elsewhere", order=2, song_id=2)
+    lyric.add_embedding(np.array([0.0, 0.0, 0.0, 5.0]))
+    db.session.add(lyric)
+    db.session.commit()
+
+    assert index.search(np.array([0.0, 0.0, 0.0, 5.0]), k=1)[0]["lyric_id"] == (
+        lyric.id
+    )
+    assert len(index) == 5
+    assert index.refresh() == 0
+
+
+def test_indices_are_partitioned_by_embedding_model(two_artists):
+    small = get_embedder("text-embedding-3-small-256")
+    lyric = Lyric(lyric="reduced", order=2, song_id=1)
+    lyric.add_embedding(np.ones(256), embedder=small)
+    db.session.add(lyric)
+    db.session.commit()
+
+    default_index = GlobalLyricIndex()
+    small_index = GlobalLyricIndex(embedding_model=small.name)
+    default_index.ensure_loaded()
+    small_index.ensure_loaded()
+
+    assert len(default_index) == 4
+    assert len(small_index) == 1
+    assert small_index.search(np.ones(256), k=1)[0]["lyric_id"] == lyric.id
+    assert get_lyric_index(small) is get_lyric_index(small.name)
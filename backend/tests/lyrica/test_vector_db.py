@@ -0,0 +1,149 @@
+"""
+Tests for the lyrica in-memory vector search.
+"""
+
+import json
+
+import numpy as np
+import pytest
+
+from backend.lyrica.benchmark import (
+    benchmark_ann,
+    benchmark_engines,
+    synthetic_embeddings,
+)
+from backend.lyrica.VectorDB import (
+    Dictbased_VectorDB,
+    IVF_VectorDB,
+    Matrix_VectorDB,
+    create_vector_db,
+)
+
+
+def build_db(vectors):
+    embeddings = {i: np.asarray(v, dtype=float) for i, v in enumerate(vectors)}
+    metadata = {i: {"text": f"bar {i}"} for i in embeddings}
+    return Dictbased_VectorDB(embeddings, metadata)
+
+
+class TestTopLyrics:
+    """Test diversity-aware top lyric selection."""
+
+    def test_empty_db_returns_no_lyrics(self):
+        assert Dictbased_VectorDB({}, {}).get_top_lyrics() == []
+
+    def test_mmr_skips_near_duplicate_choruses(self):
+        chorus = [1.0, 0.0, 0.0]
+        vdb = build_db(
+            [chorus, chorus, [0.99, 0.01, 0.0], [0.6, 0.8, 0.0], [0.6, 0.0, 0.8]]
+        )
+
+        nearest = [r["lyric_id"] for r in vdb.get_top_lyrics(mmr_lambda=1.0)]
+        diverse = [r["lyric_id"] for r in vdb.get_top_lyrics(mmr_lambda=0.5)]
+
+        assert set(nearest) == {0, 1, 2}
+        assert diverse[0] in {0, 1, 2}
+        assert set(diverse[1:]) == {3, 4}
+
+    def test_mmr_with_lambda_one_matches_knn(self):
+        rng = np.random.default_rng(0)
+        vectors = rng.normal(size=(200, 16))
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        vdb = build_db(vectors)
+        query = vectors.mean(axis=0)
+
+        mmr_ids = [r[0] for r in vdb.select_mmr(query, num_results=5, mmr_lambda=1)]
+        knn_ids = [r[0] for r in vdb.get_knn_byitem(query, num_nbrs=5)]
+
+        assert mmr_ids == knn_ids
+
+    def test_returns_at_most_the_stored_items(self):
+        vdb = build_db([[1.0, 0.0], [0.0, 1.0]])
+        assert len(vdb.get_top_lyrics(num_lyrics=5)) == 2
+
+
+class TestMatrixVectorDB:
+    """Test the vectorised exact engine."""
+
+    def test_matches_the_exact_engine(self):
+        vectors = synthetic_embeddings(500, dim=16, seed=2)
+        embeddings = {i: v for i, v in enumerate(vectors)}
+        exact = create_vector_db(dict(embeddings), {}, engine="exact")
+        matrix = create_vector_db(dict(embeddings), {}, engine="matrix")
+
+        for query in vectors[:10]:
+            expected = exact.get_knn_byitem(query, num_nbrs=5)
+            results = matrix.get_knn_byitem(query, num_nbrs=5)
+            assert [r[0] for r in results] == [r[0] for r in expected]
+            assert [r[2] for r in results] == pytest.approx(
+                [r[2] for r in expected], abs=1e-5
+            )
+
+    def test_added_items_invalidate_the_matrix(self):
+        matrix = Matrix_VectorDB({0: np.array([1.0, 0.0])}, {0: {}})
+        assert matrix.get_knn_byitem(np.array([0.0, 1.0]), num_nbrs=1)[0][0] == 0
+
+        matrix.add_item(1, np.array([0.0, 1.0]), {})
+
+        assert matrix.get_knn_byitem(np.array([0.0, 1.0]), num_nbrs=1)[0][0] == 1
+        assert [r[0] for r in matrix.get_knn_byid(1)] == [0]
+
+
+class TestIVFVectorDB:
+    """Test the approximate IVF engine against exact search."""
+
+    @pytest.fixture
+    def vectors(self):
+        return synthetic_embeddings(2000, dim=32, n_clusters=20, seed=1)
+
+    def test_probing_every_list_is_exact(self, vectors):
+        embeddings = {i: v for i, v in enumerate(vectors)}
+        exact = create_vector_db(embeddings, {}, engine="exact")
+        ivf = create_vector_db(embeddings, {}, engine="ivf", n_lists=16, n_probe=16)
+
+        for query in vectors[:10]:
+            assert [r[0] for r in ivf.get_knn_byitem(query, num_nbrs=5)] == [
+                r[0] for r in exact.get_knn_byitem(query, num_nbrs=5)
+            ]
+
+    def test_items_added_after_training_are_searchable(self, vectors):
+        ivf = IVF_VectorDB({i: v for i, v in enumerate(vectors[:1000])}, {})
+        ivf.train()
+
+        ivf.add_item("new", vectors[1500], {"text": "new bar"})
+
+        assert ivf.get_knn_byitem(vectors[1500], num_nbrs=1)[0][0] == "new"
+        assert "new" not in [r[0] for r in ivf.get_knn_byid("new", num_nbrs=3)]
+
+    def test_unknown_engine_raises(self):
+        with pytest.raises(ValueError):
+            create_vector_db({}, {}, engine="faiss")
+
+    def test_benchmark_reports_recall(self):
+        report = benchmark_ann(
+            n_vectors=1000, dim=16, n_queries=20, k=5, n_lists=8, n_probes=(1, 8)
+        )
+
+        assert [r["engine"] for r in report] == ["exact", "ivf", "ivf"]
+        # probing one list of eight misses neighbours, probing them all does not
+        assert report[1]["recall"] < 0.9
+        assert report[-1]["recall"] == 1.0
+
+    def test_benchmark_suite_reports_each_engine_and_size(self):
+        report = benchmark_engines(
+            sizes=(200, 400), dim=16, n_queries=5, k=5, n_clusters=5
+        )
+
+        results = report["results"]
+        assert [(r["engine"], r["n_vectors"]) for r in results] == [
+            ("exact", 200),
+            ("matrix", 200),
+            ("ivf", 200),
+            ("exact", 400),
+            ("matrix", 400),
+            ("ivf", 400),
+        ]
+        assert all(r["p99_ms"] >= r["p50_ms"] > 0 for r in results)
+        assert results[0]["recall"] == results[1]["recall"] == 1.0
+        assert results[2]["index_bytes"] > 0
+        assert json.loads(json.dumps(report)) == report
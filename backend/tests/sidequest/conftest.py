@@ -17,9 +17,24 @@ from backend.sidequest.models import (
 from backend.extensions import db
 from backend.models import User
 from backend.sidequest.services import QuestService
+from backend.sidequest.services.quest_generation_service import (
+    quest_llm_breaker,
+    quest_llm_latency,
+)
 from backend.sidequest.models import QuestTemplate, UserQuest
 
 
+@pytest.fixture(autouse=True)
+def reset_quest_llm_state():
+    """The circuit breaker and latency window are per process, start each test
+    with a closed circuit."""
+    quest_llm_breaker.reset()
+    quest_llm_latency.clear()
+    yield
+    quest_llm_breaker.reset()
+    quest_llm_latency.clear()
+
+
 @pytest.fixture
 def test_sidequest_user(app, test_user):
     """Create a test SideQuest user with preferences."""
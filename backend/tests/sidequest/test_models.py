@@ -8,6 +8,7 @@ import pytest
 from datetime import datetime, timedelta
 
 from backend.sidequest.models import (
+    QuestBoard,
     QuestCategory,
     QuestDifficulty,
     QuestRating,
@@ -90,6 +91,43 @@ class TestUserQuest:
             assert test_quest.status == QuestStatus.COMPLETED
 
 
+class TestQuestBoard:
+    """Test QuestBoard model behavior."""
+
+    def test_board_serialization_matches_quest_serialization(
+        self, test_sidequest_user_with_board
+    ):
+        """The joined-row board serialization gives the same quests as
+        UserQuest.to_dict."""
+        board = QuestBoard.query.filter_by(
+            user_id=test_sidequest_user_with_board.user_id
+        ).first()
+        completed = board.quests.order_by("id").first()
+        completed.complete(
+            feedback_rating=QuestRating.THUMBS_UP,
+            feedback_comment="Great",
+            time_spent=10,
+        )
+        db.session.add(
+            UserQuest(
+                user_id=board.user_id,
+                quest_board_id=board.id,
+                resolved_text="A quest without a template",
+            )
+        )
+        db.session.commit()
+
+        board_dict = board.to_dict()
+
+        assert board_dict["userId"] == board.user_id
+        assert "lastRefreshed" in board_dict
+        assert board_dict["quests"] == [
+            quest.to_dict() for quest in board.quests.order_by("id")
+        ]
+        assert board_dict["quests"][0]["feedback"]["timeSpent"] == 10
+        assert board_dict["quests"][-1]["tags"] is None
+
+
 class TestQuestEnums:
     """Test enum behavior and validation."""
 
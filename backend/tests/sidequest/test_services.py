@@ -5,17 +5,72 @@ Tests business logic, error handling, and integration between services.
 """
 
 import json
+import time
 import pytest
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
 from unittest.mock import Mock, patch
 
+from sqlalchemy import event, update
+
 from backend.sidequest.models import (
+    QuestCategory,
     QuestDifficulty,
+    QuestGenerationLog,
     QuestRating,
     QuestStatus,
+    QuestTemplate,
+    QuestTimeBucket,
+    UserQuest,
+    wilson_lower_bound,
 )
+from backend.config import Config
 from backend.extensions import db
-from backend.sidequest.services import QuestGenerationService, QuestService, UserService
+from backend.models import User
+from backend.sidequest.services import (
+    BoardRefreshService,
+    HistoryService,
+    QuestGenerationService,
+    QuestPoolService,
+    QuestService,
+    TemplateDedupService,
+    UserService,
+    UserStatsService,
+    VotingService,
+)
+from backend.sidequest.services.quest_generation_service import (
+    quest_llm_breaker,
+    quest_llm_latency,
+)
+from backend.sidequest.utils.circuit_breaker import CircuitBreaker
+
+
+def explain_sampling_queries(fn):
+    """Run fn and EXPLAIN every query it ran that orders by random_key, with
+    sequential scans disabled so the planner picks any index it can match"""
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, *args):
+        if "ORDER BY sidequest.sidequest_quest_templates.random_key" in statement:
+            statements.append((statement, parameters))
+
+    event.listen(db.engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        fn()
+    finally:
+        event.remove(db.engine, "before_cursor_execute", before_cursor_execute)
+
+    connection = db.session.connection()
+    connection.exec_driver_sql("SET LOCAL enable_seqscan = off")
+    plans = [
+        "\n".join(
+            row[0]
+            for row in connection.exec_driver_sql("EXPLAIN " + statement, parameters)
+        )
+        for statement, parameters in statements
+    ]
+    db.session.rollback()
+    return plans
 
 
 class TestUserService:
@@ -147,6 +202,167 @@ class TestQuestService:
 
             assert service.board_needs_refresh(user.user_id) is True
 
+    def test_get_potential_templates_skips_seen(
+        self, test_sidequest_user_with_board, app
+    ):
+        """Sampling wraps around the random key and never returns seen templates."""
+        service = QuestService(db.session)
+        user = test_sidequest_user_with_board
+        seen_ids = {
+            quest.quest_template_id
+            for quest in service.get_board(user.user_id).quests.all()
+        }
+        for i in range(5):
+            db.session.add(
+                QuestTemplate(
+                    text=f"Write a haiku about your commute #{i}",
+                    category=QuestCategory.CREATIVITY,
+                    estimated_time="10 minutes",
+                    difficulty=QuestDifficulty.EASY,
+                    tags=["writing"],
+                )
+            )
+        db.session.commit()
+        unseen_ids = {
+            template.id
+            for template in QuestTemplate.query.all()
+            if template.id not in seen_ids
+        }
+
+        templates = service.get_potential_templates(user.user_id, n_templates=100)
+
+        assert len(templates) == len(unseen_ids)
+        assert {template.id for template in templates} == unseen_ids
+        assert len(service.get_potential_templates(user.user_id, n_templates=2)) == 2
+
+    def test_potential_templates_favour_well_rated(
+        self, test_sidequest_user_with_board, app
+    ):
+        """Part of the existing templates on a board are the best rated ones."""
+        service = QuestService(db.session)
+        user = test_sidequest_user_with_board
+        rated = QuestTemplate(
+            text="Cook breakfast for someone you live with",
+            category=QuestCategory.SOCIAL,
+            estimated_time="20 minutes",
+            difficulty=QuestDifficulty.EASY,
+            tags=["cooking"],
+            thumbs_up_count=40,
+            thumbs_down_count=2,
+        )
+        db.session.add(rated)
+        db.session.flush()
+        db.session.execute(
+            update(QuestTemplate)
+            .where(QuestTemplate.id == rated.id)
+            .values(wilson_score=wilson_lower_bound(40, 2))
+        )
+        db.session.commit()
+
+        templates = service.get_potential_templates(user.user_id, n_templates=2)
+
+        assert len(templates) == 2
+        assert templates[0].id == rated.id
+        assert templates[1].id != rated.id
+
+    def test_potential_templates_use_random_key_index(
+        self, test_sidequest_user_with_board, app
+    ):
+        """Sampling reads the partial random_key index instead of sorting."""
+        service = QuestService(db.session)
+        user_id = test_sidequest_user_with_board.user_id
+
+        plans = explain_sampling_queries(
+            lambda: service.get_potential_templates(user_id, n_templates=2)
+        )
+
+        assert plans
+        for plan in plans:
+            assert "ix_sidequest_quest_templates_random_key" in plan, plan
+
+    def test_cleanup_boards(self, test_sidequest_user_with_board, app):
+        """Bulk cleanup applies the same transitions as UserQuest.cleanup."""
+        service = QuestService(db.session)
+        user = test_sidequest_user_with_board
+        board = service.get_board(user.user_id)
+        potential, accepted, completed = board.quests.order_by("id").all()
+        accepted.accept()
+        completed.complete()
+        db.session.commit()
+
+        service.cleanup_boards([user.user_id])
+        db.session.commit()
+
+        assert board.quests.count() == 0
+        assert potential.status == QuestStatus.DECLINED
+        assert accepted.status == QuestStatus.FAILED
+        assert completed.status == QuestStatus.COMPLETED
+
+    def test_refresh_boards_generates_before_cleanup(
+        self, test_sidequest_user_with_board, app
+    ):
+        """Missing quests are generated and reserved before the old board is
+        cleaned up, then handed out by the refresh."""
+        service = QuestService(db.session)
+        user = test_sidequest_user_with_board
+        old_quests = service.get_board(user.user_id).quests.all()
+        texts = iter(
+            [
+                "Write a thank-you note to a neighbour",
+                "Find three shapes hidden in the clouds",
+                "Cook a meal using only five ingredients",
+            ]
+        )
+
+        def generate(requests):
+            # the old board is still intact while the LLM runs
+            assert all(quest.status == QuestStatus.POTENTIAL for quest in old_quests)
+            return {
+                user_id: [
+                    TestQuestPoolService.pool_quest(next(texts)) for _ in range(n)
+                ]
+                for user_id, (_, n) in requests.items()
+            }
+
+        service.get_potential_templates = Mock(return_value=[])
+        service.quest_generation_service.generate_batch_quest_template_data = Mock(
+            side_effect=generate
+        )
+        refreshed_at = datetime.utcnow().replace(microsecond=0)
+
+        service.refresh_boards([user.user_id], refreshed_at=refreshed_at)
+
+        service.quest_generation_service.generate_batch_quest_template_data.assert_called_once()
+        board = service.get_board(user.user_id)
+        assert board.quests.count() == 3
+        assert board.last_refreshed == refreshed_at
+        assert all(quest.status == QuestStatus.DECLINED for quest in old_quests)
+        assert (
+            QuestTemplate.query.filter_by(
+                pooled=True, owner_user_id=user.user_id
+            ).count()
+            == 0
+        )
+
+    def test_failed_generation_leaves_board_alone(
+        self, test_sidequest_user_with_board, app
+    ):
+        """A refresh whose generation fails does not clean up the board."""
+        service = QuestService(db.session)
+        user = test_sidequest_user_with_board
+        service.get_potential_templates = Mock(return_value=[])
+        service.quest_generation_service.generate_batch_quest_template_data = Mock(
+            side_effect=RuntimeError("LLM down")
+        )
+
+        with pytest.raises(RuntimeError):
+            service.refresh_boards([user.user_id], refreshed_at=datetime.utcnow())
+        db.session.rollback()
+
+        quests = service.get_board(user.user_id).quests.all()
+        assert len(quests) == 3
+        assert all(quest.status == QuestStatus.POTENTIAL for quest in quests)
+
 
 class TestQuestGenerationService:
     """Test QuestGenerationService business logic."""
@@ -311,6 +527,688 @@ class TestQuestGenerationService:
                 time_minutes = service._parse_time_estimate(quest["estimated_time"])
                 assert time_minutes <= preferences["max_time"]
 
+    def test_circuit_breaker_fails_fast_to_fallback(self, test_sidequest_user, app):
+        """After repeated LLM failures the LLM is skipped until the circuit
+        half-opens."""
+        service = QuestGenerationService(db.session, "test_key")
+        service.client = Mock()
+        service.client.chat.side_effect = Exception("API Error")
+        preferences = {"categories": ["fitness"], "difficulty": "easy", "max_time": 15}
+
+        for _ in range(quest_llm_breaker.failure_threshold):
+            service.generate_quest_template_data(
+                test_sidequest_user.user_id, preferences
+            )
+        n_calls = service.client.chat.call_count
+
+        quests = service.generate_quest_template_data(
+            test_sidequest_user.user_id, preferences
+        )
+
+        assert quest_llm_breaker.state == CircuitBreaker.OPEN
+        assert service.client.chat.call_count == n_calls
+        assert quests and all(quest["fallback_used"] for quest in quests)
+
+        # half-open: one trial call goes through and closes the circuit
+        quest_llm_breaker._opened_at -= quest_llm_breaker.reset_timeout
+        service.client.chat.side_effect = None
+        service.client.chat.return_value = json.dumps(
+            {
+                "quests": [
+                    {
+                        "text": "Do 10 jumping jacks",
+                        "category": "fitness",
+                        "estimated_time": "5 minutes",
+                        "difficulty": "easy",
+                        "tags": ["exercise"],
+                    }
+                ]
+            }
+        )
+        quests = service.generate_quest_template_data(
+            test_sidequest_user.user_id, preferences, n_quests=1
+        )
+        assert quest_llm_breaker.state == CircuitBreaker.CLOSED
+        assert quests[0]["fallback_used"] is False
+
+    def test_slow_requests_are_hedged(self, app):
+        """A request slower than usual is raced against the hedge model, and the
+        deadline bounds the whole step."""
+        service = QuestGenerationService(db.session, "test_key")
+        response = json.dumps(
+            {
+                "quests": [
+                    {
+                        "text": "Balance on one foot while brushing your teeth",
+                        "category": "fitness",
+                        "estimated_time": "2 minutes",
+                        "difficulty": "easy",
+                        "tags": ["balance"],
+                    }
+                ]
+            }
+        )
+
+        def chat(model, **kwargs):
+            if model == service.model:
+                time.sleep(0.5)
+            return response
+
+        service.client = Mock()
+        service.client.chat.side_effect = chat
+        for _ in range(quest_llm_latency.min_samples):
+            quest_llm_latency.record(0.01)
+        preferences = {"categories": ["fitness"], "difficulty": "easy", "max_time": 15}
+
+        with patch.object(Config, "QUEST_GENERATION_HEDGE_MODEL", "hedge/model"):
+            quests = service._generate_with_llm(preferences, n_quests=1)
+        assert quests[0]["model_used"] == "hedge/model"
+
+        with patch.object(Config, "QUEST_GENERATION_DEADLINE_SECONDS", 0.1):
+            with pytest.raises(TimeoutError):
+                service._generate_with_llm(preferences, n_quests=1)
+
+    def test_fallback_quests_top_up_from_other_categories(self, app):
+        """Short categories are topped up from the rest, with copies of the
+        catalog quests."""
+        service = QuestGenerationService(db.session, "test_key")
+        preferences = {"categories": ["fitness"], "difficulty": "easy", "max_time": 5}
+        fitting = [
+            quest
+            for quests in service.fallback_quests.values()
+            for quest in quests
+            if quest["difficulty"] == "easy"
+            and service._parse_time_estimate(quest["estimated_time"]) <= 5
+        ]
+
+        quests = service._generate_fallback_quests(preferences, n_quests=len(fitting))
+
+        assert sorted(quest["text"] for quest in quests) == sorted(
+            quest["text"] for quest in fitting
+        )
+        quests[0]["model_used"] = None
+        assert all("model_used" not in quest for quest in fitting)
+
+    def test_batch_generation_fans_out_per_user(self, test_sidequest_user, app):
+        """One LLM request serves several users; users it skips fall back."""
+        other_user = User(email="other@example.com", name="Other User")
+        db.session.add(other_user)
+        db.session.commit()
+        service = QuestGenerationService(db.session, "test_key")
+        service.client = Mock()
+        service.client.chat.return_value = json.dumps(
+            {
+                "users": [
+                    {
+                        "user": "user_1",
+                        "quests": [
+                            {
+                                "text": "Do 10 jumping jacks",
+                                "category": "fitness",
+                                "estimated_time": "5 minutes",
+                                "difficulty": "easy",
+                                "tags": ["exercise", "quick"],
+                            }
+                        ],
+                    }
+                ]
+            }
+        )
+        preferences = {"categories": ["fitness"], "difficulty": "easy", "max_time": 15}
+
+        quests = service.generate_batch_quest_template_data(
+            {
+                test_sidequest_user.user_id: (preferences, 1),
+                other_user.id: (preferences, 2),
+            }
+        )
+
+        service.client.chat.assert_called_once()
+        assert [q["text"] for q in quests[test_sidequest_user.user_id]] == [
+            "Do 10 jumping jacks"
+        ]
+        assert quests[test_sidequest_user.user_id][0]["fallback_used"] is False
+        assert len(quests[other_user.id]) == 2
+        assert all(q["fallback_used"] for q in quests[other_user.id])
+
+        logs = {log.user_id: log for log in QuestGenerationLog.query.all()}
+        assert logs[test_sidequest_user.user_id].fallback_used is False
+        assert logs[other_user.id].fallback_used is True
+        assert logs[other_user.id].quests_generated == 2
+
+
+class TestQuestPoolService:
+    """Test the pre-generated quest pool."""
+
+    @staticmethod
+    def pool_quest(text, category="fitness", difficulty="medium", minutes=10):
+        return {
+            "text": text,
+            "category": category,
+            "estimated_time": f"{minutes} minutes",
+            "difficulty": difficulty,
+            "tags": ["pool"],
+        }
+
+    def test_refill_tops_up_low_cells(self, app):
+        """Refilling asks the LLM for the missing templates of each low cell."""
+        generation_service = QuestGenerationService(db.session)
+        generation_service.generate_pool_quest_data = Mock()
+        generation_service.generate_pool_quest_data.return_value = [
+            self.pool_quest(text)
+            for text in (
+                "Walk to a park you have never visited",
+                "Do twenty squats during a TV commercial break",
+                "Take the stairs instead of the elevator all day",
+                "Stretch your hamstrings before breakfast",
+            )
+        ]
+        pool = QuestPoolService(db.session, generation_service)
+        cell = (QuestCategory.FITNESS, QuestDifficulty.MEDIUM, QuestTimeBucket.MEDIUM)
+
+        assert pool.refill(cells=[cell]) == 4
+
+        generation_service.generate_pool_quest_data.assert_called_once_with(
+            category="fitness", difficulty="medium", max_time=30, n_quests=4
+        )
+        assert pool.stock_levels()[cell] == 4
+        assert cell not in pool.cells_needing_refill()
+
+    def test_refill_files_quests_under_requesting_cell(self, app):
+        """Quests estimated outside the cell still count towards it, so a short
+        cell isn't refilled forever."""
+        generation_service = QuestGenerationService(db.session)
+        generation_service.generate_pool_quest_data = Mock()
+        generation_service.generate_pool_quest_data.return_value = [
+            self.pool_quest(text, minutes=10)
+            for text in (
+                "Walk to a park you have never visited",
+                "Do twenty squats during a TV commercial break",
+                "Take the stairs instead of the elevator all day",
+                "Stretch your hamstrings before breakfast",
+            )
+        ]
+        pool = QuestPoolService(db.session, generation_service)
+        cell = (QuestCategory.FITNESS, QuestDifficulty.MEDIUM, QuestTimeBucket.MICRO)
+
+        assert pool.refill(cells=[cell]) == 4
+        assert pool.refill(cells=[cell]) == 0
+
+        generation_service.generate_pool_quest_data.assert_called_once()
+        assert pool.stock_levels()[cell] == 4
+        template = db.session.query(QuestTemplate).filter_by(pooled=True).first()
+        assert template.estimated_minutes == 10
+
+    def test_populate_board_claims_from_pool(self, test_sidequest_user, app):
+        """A board is filled from the pool without calling the LLM."""
+        service = QuestService(db.session)
+        service.quest_generation_service.client = Mock()
+        for text in (
+            "Do a plank next to your favourite window",
+            "Do a plank while your coffee brews",
+            "Do a plank during your next phone call",
+        ):
+            service.quest_pool_service.add_to_pool(self.pool_quest(text))
+        service.quest_pool_service.add_to_pool(
+            self.pool_quest("Run a half marathon along the river", minutes=120)
+        )
+        db.session.commit()
+
+        service.populate_board(test_sidequest_user.user_id)
+
+        service.quest_generation_service.client.chat.assert_not_called()
+        quests = service.get_board(test_sidequest_user.user_id).quests.all()
+        assert len(quests) == 3
+        # the new quest comes from the pool, the other two are existing templates
+        claimed = quests[0].quest_template
+        assert claimed.pooled is False
+        assert claimed.owner_user_id == test_sidequest_user.user_id
+        assert claimed.text.startswith("Do a plank")
+        assert QuestTemplate.query.filter_by(pooled=True).count() == 3
+
+    def test_claim_respects_preferences(self, test_sidequest_user, app):
+        """Only templates in the user's categories and difficulty are claimed."""
+        pool = QuestPoolService(db.session, QuestGenerationService(db.session))
+        pool.add_to_pool(
+            self.pool_quest("Call a friend you have not seen in a year", "social")
+        )
+        pool.add_to_pool(
+            self.pool_quest("Hold a wall sit for as long as you can", difficulty="hard")
+        )
+        db.session.commit()
+
+        assert (
+            pool.claim_templates(test_sidequest_user.user_id, test_sidequest_user, 3)
+            == []
+        )
+
+
+class TestTemplateDedupService:
+    """Test the near-duplicate index of quest templates."""
+
+    @staticmethod
+    def template(text, **kwargs):
+        return QuestTemplate(
+            text=text,
+            category=QuestCategory.OUTDOORS,
+            estimated_time="10 minutes",
+            difficulty=QuestDifficulty.EASY,
+            tags=["walking"],
+            **kwargs,
+        )
+
+    REWORDED_WALK = {
+        "text": "Take a 15-minute walk around your neighbourhood.",
+        "category": QuestCategory.OUTDOORS,
+        "estimated_time": "15 minutes",
+        "difficulty": QuestDifficulty.EASY,
+        "tags": ["walking"],
+    }
+
+    def test_near_duplicates_reuse_the_template(self, test_sidequest_user, app):
+        """A reworded quest hands out the indexed template, others are indexed."""
+        user_id = test_sidequest_user.user_id
+        dedup = TemplateDedupService(db.session)
+        original = self.template("Take a 10-minute walk around your neighborhood")
+        assert dedup.add_template(original) is original
+        db.session.commit()
+        n_templates = QuestTemplate.query.count()
+
+        service = QuestService(db.session)
+        reworded, unrelated = service._create_generated_templates(
+            user_id,
+            [
+                self.REWORDED_WALK,
+                {
+                    "text": "Learn to say thank you in five languages",
+                    "category": QuestCategory.LEARNING,
+                    "estimated_time": "10 minutes",
+                    "difficulty": QuestDifficulty.EASY,
+                    "tags": ["languages"],
+                },
+            ],
+        )
+        db.session.commit()
+
+        assert reworded is original
+        assert unrelated.owner_user_id == user_id
+        assert QuestTemplate.query.count() == n_templates + 1
+        assert dedup.find_duplicate("Learn to say thank you in 5 languages") == (
+            unrelated
+        )
+
+    def test_seen_templates_are_not_reused(self, test_sidequest_user, app):
+        """A near-duplicate of a template the user was shown is dropped."""
+        user_id = test_sidequest_user.user_id
+        original = self.template("Take a 10-minute walk around your neighborhood")
+        TemplateDedupService(db.session).add_template(original)
+        db.session.add(UserQuest(user_id=user_id, quest_template=original))
+        db.session.commit()
+
+        service = QuestService(db.session)
+
+        assert service._create_generated_templates(user_id, [self.REWORDED_WALK]) == []
+
+    def test_voting_drops_near_duplicates(self, test_user, app):
+        """Templates generated for voting go through the index too."""
+        TemplateDedupService(db.session).add_template(
+            self.template("Take a 10-minute walk around your neighborhood")
+        )
+        db.session.commit()
+        service = VotingService(db.session)
+        service.quest_generation_service.generate_quest_template_data = Mock(
+            return_value=[
+                self.REWORDED_WALK,
+                {**self.REWORDED_WALK, "text": "Plant a herb on your windowsill"},
+            ]
+        )
+
+        templates = service._generate_voting_templates(2)
+
+        assert [template.text for template in templates] == [
+            "Plant a herb on your windowsill"
+        ]
+        assert templates[0].minhash is not None
+
+    def test_pool_drops_near_duplicates(self, app):
+        """The pool doesn't stock rewordings of existing templates."""
+        pool = QuestPoolService(db.session, QuestGenerationService(db.session))
+        pool.add_to_pool(TestQuestPoolService.pool_quest("Do a plank for one minute"))
+        db.session.commit()
+
+        assert (
+            pool.add_to_pool(
+                TestQuestPoolService.pool_quest("Do a plank for 1 minute!")
+            )
+            is None
+        )
+
+    def test_backfill_indexes_existing_templates(self, app):
+        """Templates created before the index get indexed once."""
+        db.session.add(self.template("Watch the sunset from a rooftop"))
+        db.session.commit()
+        dedup = TemplateDedupService(db.session)
+
+        assert dedup.backfill() >= 1
+        assert dedup.backfill() == 0
+        assert dedup.find_duplicate("Watch the sunset from the rooftop") is not None
+
+
+class TestBoardRefreshService:
+    """Test the scheduled midnight board refresh."""
+
+    def test_next_midnight(self, app):
+        """Midnight is computed in the user's timezone and returned as UTC."""
+        now = datetime(2026, 1, 1, 14, 50, tzinfo=timezone.utc)
+
+        assert BoardRefreshService.next_midnight("Asia/Tokyo", now) == datetime(
+            2026, 1, 1, 15, 0, tzinfo=timezone.utc
+        )
+        assert BoardRefreshService.last_midnight("Asia/Tokyo", now) == datetime(
+            2025, 12, 31, 15, 0, tzinfo=timezone.utc
+        )
+        assert BoardRefreshService.next_midnight("Not/AZone", now) == datetime(
+            2026, 1, 2, 0, 0, tzinfo=timezone.utc
+        )
+
+    def test_refresh_due_boards(self, test_sidequest_user_with_board, app):
+        """Quests are generated ahead of midnight, the boards are only refreshed
+        once it has passed, stamped with that midnight."""
+        user = test_sidequest_user_with_board
+        user.timezone = "Asia/Tokyo"
+        db.session.commit()
+        quest_service = Mock()
+        quest_service.reserve_board_quests.return_value = 3
+        scheduler = BoardRefreshService(db.session, quest_service)
+        midnight = scheduler.next_midnight("Asia/Tokyo", datetime.now(timezone.utc))
+        before, after = midnight - timedelta(minutes=5), midnight + timedelta(minutes=1)
+
+        assert scheduler.refresh_due_boards(before, lead_time=timedelta(minutes=1)) == 0
+        quest_service.reserve_board_quests.assert_not_called()
+        assert scheduler.refresh_due_boards(before) == 0
+        quest_service.reserve_board_quests.assert_called_once_with([user.user_id])
+        quest_service.refresh_boards.assert_not_called()
+
+        assert scheduler.refresh_due_boards(after) == 1
+        quest_service.refresh_boards.assert_called_once_with(
+            [user.user_id], refreshed_at=midnight.replace(tzinfo=None)
+        )
+
+        board = QuestService(db.session).get_board(user.user_id)
+        board.last_refreshed = midnight.replace(tzinfo=None)
+        db.session.commit()
+        assert scheduler.users_to_refresh(midnight, ["Asia/Tokyo"]) == []
+
+    def test_dormant_boards_left_to_request_path(
+        self, test_sidequest_user_with_board, app
+    ):
+        """Boards of users who haven't acted on a quest lately are not
+        pre-generated, acting on one brings them back."""
+        user = test_sidequest_user_with_board
+        user.timezone = "Asia/Tokyo"
+        service = QuestService(db.session)
+        board = service.get_board(user.user_id)
+        long_ago = datetime.utcnow() - timedelta(days=30)
+        board.created_at = board.last_refreshed = long_ago
+        db.session.commit()
+        scheduler = BoardRefreshService(db.session, Mock())
+        midnight = scheduler.next_midnight("Asia/Tokyo", datetime.now(timezone.utc))
+
+        assert scheduler.users_to_refresh(midnight, ["Asia/Tokyo"]) == []
+
+        quest = board.quests.first()
+        service.update_quest_status(quest.id, "accepted")
+        assert scheduler.users_to_refresh(midnight, ["Asia/Tokyo"]) == [user.user_id]
+
+    def test_pre_refreshed_board_counts_as_new_day(
+        self, test_sidequest_user_with_board, app
+    ):
+        """A board stamped with the last local midnight does not need a refresh,
+        even when that midnight was on the previous UTC day."""
+        user = test_sidequest_user_with_board
+        user.timezone = "Asia/Tokyo"
+        service = QuestService(db.session)
+        last_midnight = BoardRefreshService.next_midnight(
+            "Asia/Tokyo", datetime.now(timezone.utc)
+        ) - timedelta(days=1)
+        service.get_board(user.user_id).last_refreshed = last_midnight.replace(
+            tzinfo=None
+        )
+        db.session.commit()
+
+        assert service.board_needs_refresh(user.user_id) is False
+
+
+class TestUserStatsService:
+    """Test the materialized user stats."""
+
+    def test_stats_follow_status_changes(self, test_sidequest_user_with_board, app):
+        """Incremental updates give the same stats as a rebuild."""
+        user_id = test_sidequest_user_with_board.user_id
+        service = QuestService(db.session)
+        stats_service = service.user_stats_service
+        stats_service.get_stats(user_id)
+        first, second, third = service.get_board(user_id).quests.order_by("id").all()
+        first.quest_template = QuestTemplate(
+            text="Do 10 push-ups",
+            category=QuestCategory.FITNESS,
+            estimated_time="5 minutes",
+            difficulty=QuestDifficulty.EASY,
+            tags=["test"],
+        )
+        db.session.commit()
+
+        service.update_quest_status(first.id, "accepted")
+        service.update_quest_status(first.id, "completed")
+        service.update_quest_status(second.id, "abandoned")
+        service.update_quest_status(third.id, "accepted")
+        service.cleanup_board(user_id)
+
+        stats = stats_service.stats_to_dict(stats_service.get_stats(user_id))
+        assert stats == {
+            "streak": 1,
+            "success_rate": 33.3,
+            "most_completed_category": "fitness",
+            "top_tags": [{"tag": "test", "count": 1}],
+            "total_completed": 1,
+            "total_accepted": 3,
+        }
+
+        rebuilt = stats_service.rebuild(user_id)
+        db.session.commit()
+        assert stats_service.stats_to_dict(rebuilt) == stats
+
+    def test_streak_expires(self, test_sidequest_user_with_board, app):
+        """A streak only counts while its last completion was today or yesterday."""
+        user_id = test_sidequest_user_with_board.user_id
+        stats_service = UserStatsService(db.session)
+        stats = stats_service.get_stats(user_id)
+        stats.streak_length = 3
+        stats.last_completed_date = datetime.utcnow().date() - timedelta(days=1)
+
+        assert stats_service.stats_to_dict(stats)["streak"] == 3
+        assert (
+            stats_service.stats_to_dict(
+                stats, today=datetime.utcnow().date() + timedelta(days=1)
+            )["streak"]
+            == 0
+        )
+
+
+class TestHistoryService:
+    """Test HistoryService queries."""
+
+    def test_7_day_history_uses_local_days(self, test_sidequest_user, app):
+        """Quests are grouped by the calendar day in the user's timezone."""
+        user_id = test_sidequest_user.user_id
+        test_sidequest_user.timezone = "America/Los_Angeles"
+        user_tz = ZoneInfo("America/Los_Angeles")
+        yesterday = datetime.now(user_tz).date() - timedelta(days=1)
+
+        def utc(day, hour):
+            local = datetime.combine(day, datetime.min.time(), tzinfo=user_tz)
+            return (
+                (local + timedelta(hours=hour))
+                .astimezone(timezone.utc)
+                .replace(tzinfo=None)
+            )
+
+        template = QuestTemplate(
+            text="Write a haiku about your commute",
+            category=QuestCategory.CREATIVITY,
+            estimated_time="10 minutes",
+            difficulty=QuestDifficulty.EASY,
+            tags=["writing"],
+        )
+        db.session.add_all(
+            [
+                # late evening locally is already the next day in UTC
+                UserQuest(
+                    user_id=user_id,
+                    quest_template=template,
+                    status=QuestStatus.COMPLETED,
+                    created_at=utc(yesterday, 23),
+                ),
+                UserQuest(
+                    user_id=user_id,
+                    resolved_text="Declined quest from two days ago",
+                    status=QuestStatus.DECLINED,
+                    created_at=utc(yesterday - timedelta(days=1), 1),
+                ),
+            ]
+        )
+        db.session.commit()
+
+        history = HistoryService(db.session).get_7_day_history(user_id)
+
+        assert len(history) == 7
+        assert history[0]["date"] == yesterday.isoformat()
+        assert history[0]["completed_count"] == 1
+        assert history[0]["total_count"] == 1
+        assert history[0]["quests"][0]["text"] == "Write a haiku about your commute"
+        assert history[0]["quests"][0]["category"] == "creativity"
+        assert history[1]["total_count"] == 1
+        assert history[1]["quests"][0]["skipped"] is True
+
+
+class TestVotingService:
+    """Test vote counters and template ranking."""
+
+    @staticmethod
+    def template(text, thumbs_up=0, thumbs_down=0, category=QuestCategory.LEARNING):
+        return QuestTemplate(
+            text=text,
+            category=category,
+            estimated_time="15 minutes",
+            difficulty=QuestDifficulty.MEDIUM,
+            tags=["voting"],
+            thumbs_up_count=thumbs_up,
+            thumbs_down_count=thumbs_down,
+        )
+
+    def test_vote_counters_follow_flips(self, test_user, app):
+        """Votes update the template's counters, flips move the vote across."""
+        template = self.template("Learn the names of three constellations")
+        db.session.add(template)
+        db.session.commit()
+        service = VotingService(db.session)
+
+        service.submit_vote(test_user.id, template.id, "thumbs_up")
+        service.submit_vote(test_user.id, template.id, "thumbs_up")
+        assert (template.thumbs_up_count, template.thumbs_down_count) == (1, 0)
+        assert template.wilson_score == pytest.approx(0.2065, abs=1e-4)
+
+        service.submit_vote(test_user.id, template.id, "thumbs_down")
+        stats = service.get_template_vote_stats(template.id)
+        assert stats["thumbs_up"] == 0
+        assert stats["thumbs_down"] == 1
+        assert stats["total_votes"] == 1
+        assert template.wilson_score == 0
+
+    @pytest.mark.parametrize("stratify", [False, True])
+    def test_vote_sampling_uses_random_key_indexes(self, test_user, stratify, app):
+        """Plain and stratified sampling both read a partial random_key index."""
+        service = VotingService(db.session)
+        service._generate_voting_templates = Mock(return_value=[])
+
+        plans = explain_sampling_queries(
+            lambda: service.get_quests_to_vote_on(
+                test_user.id, limit=3, stratify=stratify
+            )
+        )
+
+        assert plans
+        for plan in plans:
+            # Either partial index may win on a near-empty table; neither
+            # does if the predicate doesn't match.
+            assert "_random_key on sidequest_quest_templates" in plan, plan
+            assert "Seq Scan on sidequest_quest_templates" not in plan, plan
+
+    def test_highly_rated_templates_ranked_by_wilson_score(self, app):
+        """Many votes beat a slightly higher approval rate from a few."""
+        templates = {
+            "many": self.template(
+                "Cook a dish from a country you've never visited", 40, 10
+            ),
+            "few": self.template("Sketch the view from your window", 5, 0),
+            "disliked": self.template("Reorganize your sock drawer", 1, 9),
+            "too_few_votes": self.template("Hum a song backwards", 3, 0),
+        }
+        db.session.add_all(templates.values())
+        db.session.flush()
+        db.session.execute(
+            update(QuestTemplate).values(
+                wilson_score=wilson_lower_bound(
+                    QuestTemplate.thumbs_up_count, QuestTemplate.thumbs_down_count
+                )
+            )
+        )
+        db.session.commit()
+
+        rated = VotingService(db.session).get_highly_rated_templates()
+
+        assert [template.id for template in rated] == [
+            templates["many"].id,
+            templates["few"].id,
+        ]
+
+    def test_quests_to_vote_on_skip_voted_and_pooled(self, test_user, app):
+        """Only unvoted, handed out templates are sampled."""
+        voted = self.template("Write a haiku about breakfast")
+        pooled = self.template("Find a four-leaf clover")
+        pooled.pooled = True
+        unvoted = [self.template(f"Learn a word in language #{i}") for i in range(3)]
+        db.session.add_all([voted, pooled, *unvoted])
+        db.session.commit()
+        service = VotingService(db.session)
+        service.submit_vote(test_user.id, voted.id, "thumbs_up")
+
+        n_available = QuestTemplate.query.filter_by(pooled=False).count() - 1
+        templates = service.get_quests_to_vote_on(test_user.id, limit=n_available)
+
+        sampled_ids = {template.id for template in templates}
+        assert len(sampled_ids) == n_available
+        assert {t.id for t in unvoted} <= sampled_ids
+        assert voted.id not in sampled_ids
+        assert pooled.id not in sampled_ids
+
+    def test_quests_to_vote_on_stratified(self, test_user, app):
+        """Stratified samples spread over the categories, topping up when one runs
+        short."""
+        templates = [
+            self.template(f"Learn fact #{i}", category=QuestCategory.LEARNING)
+            for i in range(10)
+        ] + [self.template("Stretch for five minutes", category=QuestCategory.FITNESS)]
+        db.session.add_all(templates)
+        db.session.commit()
+
+        sample = VotingService(db.session).get_quests_to_vote_on(
+            test_user.id, limit=len(QuestCategory), stratify=True
+        )
+
+        assert len({template.id for template in sample}) == len(QuestCategory)
+        assert QuestCategory.FITNESS in {template.category for template in sample}
+
 
 class TestServiceIntegration:
     """Test integration between services."""
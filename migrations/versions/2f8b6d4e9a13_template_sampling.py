@@ -0,0 +1,55 @@
+"""template sampling
+
+Revision ID: 2f8b6d4e9a13
+Revises: 7c3e9a1d5b20
+Create Date: 2025-09-08 14:31:09.552017
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "2f8b6d4e9a13"
+down_revision = "7c3e9a1d5b20"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # random() is volatile, so every existing row gets its own key
+    with op.batch_alter_table(
+        "sidequest_quest_templates", schema="sidequest"
+    ) as batch_op:
+        batch_op.add_column(
+            sa.Column(
+                "random_key",
+                sa.Float(),
+                nullable=False,
+                server_default=sa.text("random()"),
+            )
+        )
+        batch_op.create_index(
+            "ix_sidequest_quest_templates_random_key",
+            ["random_key"],
+            unique=False,
+            postgresql_where=sa.text("NOT pooled"),
+        )
+
+    with op.batch_alter_table("sidequest_user_quests", schema="sidequest") as batch_op:
+        batch_op.create_index(
+            "ix_sidequest_user_quests_user_template",
+            ["user_id", "quest_template_id"],
+            unique=False,
+        )
+
+
+def downgrade():
+    with op.batch_alter_table("sidequest_user_quests", schema="sidequest") as batch_op:
+        batch_op.drop_index("ix_sidequest_user_quests_user_template")
+
+    with op.batch_alter_table(
+        "sidequest_quest_templates", schema="sidequest"
+    ) as batch_op:
+        batch_op.drop_index("ix_sidequest_quest_templates_random_key")
+        batch_op.drop_column("random_key")
@@ -0,0 +1,45 @@
+"""user stats
+
+Revision ID: 5a1c7e3f8d42
+Revises: 2f8b6d4e9a13
+Create Date: 2025-09-10 09:47:22.180394
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = "5a1c7e3f8d42"
+down_revision = "2f8b6d4e9a13"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # filled in by `python -m backend.sidequest.worker backfill-stats`
+    op.create_table(
+        "sidequest_user_stats",
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("total_completed", sa.Integer(), nullable=False),
+        sa.Column("total_accepted", sa.Integer(), nullable=False),
+        sa.Column(
+            "category_counts", postgresql.JSON(astext_type=sa.Text()), nullable=False
+        ),
+        sa.Column("tag_counts", postgresql.JSON(astext_type=sa.Text()), nullable=False),
+        sa.Column("streak_length", sa.Integer(), nullable=False),
+        sa.Column("last_completed_date", sa.Date(), nullable=True),
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+        sa.Column("updated_at", sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(
+            ["user_id"],
+            ["user.id"],
+        ),
+        sa.PrimaryKeyConstraint("user_id"),
+        schema="sidequest",
+    )
+
+
+def downgrade():
+    op.drop_table("sidequest_user_stats", schema="sidequest")
@@ -0,0 +1,52 @@
+"""quest pool
+
+Revision ID: 7c3e9a1d5b20
+Revises: 04f587e8b714
+Create Date: 2025-09-06 10:12:44.318201
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = "7c3e9a1d5b20"
+down_revision = "04f587e8b714"
+branch_labels = None
+depends_on = None
+
+questtimebucket = postgresql.ENUM(
+    "MICRO", "MEDIUM", "AMBITIOUS", name="questtimebucket", create_type=False
+)
+
+
+def upgrade():
+    questtimebucket.create(op.get_bind(), checkfirst=True)
+
+    with op.batch_alter_table(
+        "sidequest_quest_templates", schema="sidequest"
+    ) as batch_op:
+        batch_op.add_column(
+            sa.Column("pooled", sa.Boolean(), nullable=False, server_default=sa.false())
+        )
+        batch_op.add_column(sa.Column("time_bucket", questtimebucket, nullable=True))
+        batch_op.add_column(sa.Column("estimated_minutes", sa.Integer(), nullable=True))
+        batch_op.create_index(
+            "ix_sidequest_quest_templates_pool",
+            ["category", "difficulty", "time_bucket"],
+            unique=False,
+            postgresql_where=sa.text("pooled"),
+        )
+
+
+def downgrade():
+    with op.batch_alter_table(
+        "sidequest_quest_templates", schema="sidequest"
+    ) as batch_op:
+        batch_op.drop_index("ix_sidequest_quest_templates_pool")
+        batch_op.drop_column("estimated_minutes")
+        batch_op.drop_column("time_bucket")
+        batch_op.drop_column("pooled")
+
+    questtimebucket.drop(op.get_bind(), checkfirst=True)
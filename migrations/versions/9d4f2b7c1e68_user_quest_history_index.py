@@ -0,0 +1,31 @@
+"""user quest history index
+
+Revision ID: 9d4f2b7c1e68
+Revises: 5a1c7e3f8d42
+Create Date: 2025-09-11 16:05:37.906114
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "9d4f2b7c1e68"
+down_revision = "5a1c7e3f8d42"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table("sidequest_user_quests", schema="sidequest") as batch_op:
+        batch_op.create_index(
+            "ix_sidequest_user_quests_user_created",
+            ["user_id", "created_at"],
+            unique=False,
+            postgresql_include=["status"],
+        )
+
+
+def downgrade():
+    with op.batch_alter_table("sidequest_user_quests", schema="sidequest") as batch_op:
+        batch_op.drop_index("ix_sidequest_user_quests_user_created")
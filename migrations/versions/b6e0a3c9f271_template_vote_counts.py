@@ -0,0 +1,84 @@
+"""template vote counts
+
+Revision ID: b6e0a3c9f271
+Revises: 9d4f2b7c1e68
+Create Date: 2025-09-13 11:22:58.473650
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "b6e0a3c9f271"
+down_revision = "9d4f2b7c1e68"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table(
+        "sidequest_quest_templates", schema="sidequest"
+    ) as batch_op:
+        batch_op.add_column(
+            sa.Column(
+                "thumbs_up_count", sa.Integer(), nullable=False, server_default="0"
+            )
+        )
+        batch_op.add_column(
+            sa.Column(
+                "thumbs_down_count", sa.Integer(), nullable=False, server_default="0"
+            )
+        )
+        batch_op.add_column(
+            sa.Column("wilson_score", sa.Float(), nullable=False, server_default="0")
+        )
+
+    # backfill the counters from the existing votes, then the Wilson lower bound
+    # (z = 1.96, same formula as models.wilson_lower_bound)
+    op.execute("""
+        UPDATE sidequest.sidequest_quest_templates t
+        SET thumbs_up_count = v.thumbs_up, thumbs_down_count = v.thumbs_down
+        FROM (
+            SELECT quest_template_id,
+                   count(*) FILTER (WHERE vote = 'THUMBS_UP') AS thumbs_up,
+                   count(*) FILTER (WHERE vote = 'THUMBS_DOWN') AS thumbs_down
+            FROM sidequest.sidequest_quest_template_votes
+            GROUP BY quest_template_id
+        ) v
+        WHERE t.id = v.quest_template_id
+        """)
+    op.execute("""
+        UPDATE sidequest.sidequest_quest_templates
+        SET wilson_score = (
+            thumbs_up_count + 1.96 * 1.96 / 2
+            - 1.96 * sqrt(
+                coalesce(
+                    thumbs_up_count::float * thumbs_down_count
+                    / nullif(thumbs_up_count + thumbs_down_count, 0),
+                    0
+                )
+                + 1.96 * 1.96 / 4
+            )
+        ) / (thumbs_up_count + thumbs_down_count + 1.96 * 1.96)
+        WHERE thumbs_up_count + thumbs_down_count > 0
+        """)
+
+    with op.batch_alter_table(
+        "sidequest_quest_templates", schema="sidequest"
+    ) as batch_op:
+        batch_op.create_index(
+            "ix_sidequest_quest_templates_wilson_score",
+            [sa.text("wilson_score DESC")],
+            unique=False,
+        )
+
+
+def downgrade():
+    with op.batch_alter_table(
+        "sidequest_quest_templates", schema="sidequest"
+    ) as batch_op:
+        batch_op.drop_index("ix_sidequest_quest_templates_wilson_score")
+        batch_op.drop_column("wilson_score")
+        batch_op.drop_column("thumbs_down_count")
+        batch_op.drop_column("thumbs_up_count")
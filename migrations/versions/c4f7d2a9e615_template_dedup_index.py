@@ -0,0 +1,71 @@
+"""template dedup index
+
+Revision ID: c4f7d2a9e615
+Revises: e3a9c5d7b184
+Create Date: 2025-09-15 10:12:41.906318
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = "c4f7d2a9e615"
+down_revision = "e3a9c5d7b184"
+branch_labels = None
+depends_on = None
+
+SAMPLE_INDEXES = {
+    "ix_sidequest_quest_templates_random_key": ["random_key"],
+    "ix_sidequest_quest_templates_category_random_key": ["category", "random_key"],
+}
+
+
+def _recreate_sample_indexes(where):
+    with op.batch_alter_table(
+        "sidequest_quest_templates", schema="sidequest"
+    ) as batch_op:
+        for name, columns in SAMPLE_INDEXES.items():
+            batch_op.drop_index(name)
+            batch_op.create_index(
+                name, columns, unique=False, postgresql_where=sa.text(where)
+            )
+
+
+def upgrade():
+    with op.batch_alter_table(
+        "sidequest_quest_templates", schema="sidequest"
+    ) as batch_op:
+        batch_op.add_column(
+            sa.Column("minhash", postgresql.JSON(astext_type=sa.Text()), nullable=True)
+        )
+
+    # filled in by `python -m backend.sidequest.worker backfill-dedup`
+    op.create_table(
+        "sidequest_quest_template_bands",
+        sa.Column("band", sa.SmallInteger(), nullable=False),
+        sa.Column("bucket", sa.BigInteger(), nullable=False),
+        sa.Column("quest_template_id", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(
+            ["quest_template_id"],
+            ["sidequest.sidequest_quest_templates.id"],
+            ondelete="CASCADE",
+        ),
+        sa.PrimaryKeyConstraint("band", "bucket", "quest_template_id"),
+        schema="sidequest",
+    )
+
+    # variants are never sampled
+    _recreate_sample_indexes("NOT pooled AND parent_template_id IS NULL")
+
+
+def downgrade():
+    _recreate_sample_indexes("NOT pooled")
+
+    op.drop_table("sidequest_quest_template_bands", schema="sidequest")
+
+    with op.batch_alter_table(
+        "sidequest_quest_templates", schema="sidequest"
+    ) as batch_op:
+        batch_op.drop_column("minhash")
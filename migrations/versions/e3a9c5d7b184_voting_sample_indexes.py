@@ -0,0 +1,49 @@
+"""voting sample indexes
+
+Revision ID: e3a9c5d7b184
+Revises: b6e0a3c9f271
+Create Date: 2025-09-14 18:40:03.227519
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "e3a9c5d7b184"
+down_revision = "b6e0a3c9f271"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table(
+        "sidequest_quest_templates", schema="sidequest"
+    ) as batch_op:
+        batch_op.create_index(
+            "ix_sidequest_quest_templates_category_random_key",
+            ["category", "random_key"],
+            unique=False,
+            postgresql_where=sa.text("NOT pooled"),
+        )
+
+    with op.batch_alter_table(
+        "sidequest_quest_template_votes", schema="sidequest"
+    ) as batch_op:
+        batch_op.create_index(
+            "ix_sidequest_quest_template_votes_user_template",
+            ["user_id", "quest_template_id"],
+            unique=False,
+        )
+
+
+def downgrade():
+    with op.batch_alter_table(
+        "sidequest_quest_template_votes", schema="sidequest"
+    ) as batch_op:
+        batch_op.drop_index("ix_sidequest_quest_template_votes_user_template")
+
+    with op.batch_alter_table(
+        "sidequest_quest_templates", schema="sidequest"
+    ) as batch_op:
+        batch_op.drop_index("ix_sidequest_quest_templates_category_random_key")